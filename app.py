@@ -1,14 +1,27 @@
+import base64
 import os
-import tempfile
+import time
+import uuid
+from itertools import accumulate
 import streamlit as st
-import pdfplumber
-import docx
-import re
-from groq import Groq
-import base64
-import requests
-from bs4 import BeautifulSoup
-from gtts import gTTS
+import metrics
+import ratelimit
+from artifacts import ArtifactQuotaError, ArtifactStore
+from boilerplate import format_boilerplate_report, remove_boilerplate_each
+from cache import DiskCache
+from encoding import AUDIO_OUTPUT_FORMAT, FORMATS, available_formats, encode_audio, mime_type
+from chunking import chunk_for_rewrite, chunk_for_tts, estimate_tokens
+from checkpoints import Checkpoint, checkpoint_key, prune_checkpoints
+from chapters import assemble_chapters, chapter_index_json, detect_chapters, format_timestamp
+from extraction import content_hash, format_page_timings, ingest_files
+from fetching import fetch_urls, make_session
+from jobs import DONE, FAILED, FINISHED, JobRunner
+from rewriter import rewrite_text
+from pipeline import stream_audiobook
+from retrieval import PassageIndex, build_chat_messages
+from mp3 import concatenate_mp3
+from textview import MAX_SEARCH_HITS, PageIndex, page_html
+from tts import clean_text_for_tts, format_gap_report, synthesize_gtts_chunk_cached, text_to_speech
 # from pydub import AudioSegment   # ❌ REMOVED – NOT SUPPORTED ON STREAMLIT CLOUD
 
 # ---------------------------
@@ -19,20 +32,33 @@ st.set_page_config(page_title="Audio Book Generator", page_icon="", layout="wide
 # ---------------------------
 # BACKGROUND IMAGE & STYLING
 # ---------------------------
+# The image is served by Streamlit's static file server (enabled in
+# .streamlit/config.toml) from ./static, so the browser fetches and caches
+# it once instead of getting it base64-encoded in every rerun's page. An
+# image still at the old location (the working directory) is inlined as
+# before until it is moved.
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+
 @st.cache_data
 def get_base_64_of_bin_file(bin_file):
     with open(bin_file, 'rb') as f:
-        data = f.read()
-    return base64.b64encode(data).decode()
-
-def set_png_as_page_bg(png_file):
-    try:
-        bin_str = get_base_64_of_bin_file(png_file)
+        return base64.b64encode(f.read()).decode()
+
+def background_url(image_name):
+    if os.path.exists(os.path.join(STATIC_DIR, image_name)):
+        return f"app/static/{image_name}"
+    if os.path.exists(image_name):
+        return f"data:image/jpeg;base64,{get_base_64_of_bin_file(image_name)}"
+    return None
+
+def set_page_bg(image_name):
+    url = background_url(image_name)
+    if url:
         page_bg_img = f'''
         <style>
         @import url('https://fonts.googleapis.com/css2?family=Poppins:wght@400;600&family=Lato:wght@400;700&display=swap');
         .stApp {{
-            background-image: url("data:image/jpeg;base64,{bin_str}");
+            background-image: url("{url}");
             background-size: cover;
             background-repeat: no-repeat;
             background-attachment: fixed;
@@ -53,10 +79,10 @@ def set_png_as_page_bg(png_file):
         </style>
         '''
         st.markdown(page_bg_img, unsafe_allow_html=True)
-    except FileNotFoundError:
+    else:
         st.markdown("<style>.stApp { background-color: #2c3e50; }</style>", unsafe_allow_html=True)
 
-set_png_as_page_bg("background.jpg")
+set_page_bg("background.jpg")
 
 # ---------------------------
 # API CLIENT (Groq)
@@ -65,154 +91,596 @@ groq_api_key = st.secrets.get("GROQ_API_KEY") or os.getenv("GROQ_API_KEY")
 if not groq_api_key:
     st.error("No Groq API key found! Please add it to Streamlit secrets.")
     st.stop()
-client = Groq(api_key=groq_api_key)
+
+@st.cache_resource
+def get_groq_client(api_key):
+    # Built on first use and shared by every session and rerun: importing
+    # groq and setting up its HTTP client costs ~200 ms. Retries are left
+    # to ratelimit.LIMITER, which has to see every 429 to adapt.
+    from groq import Groq
+    return Groq(api_key=api_key, max_retries=0)
+
+# ---------------------------
+# CACHES (shared across sessions)
+# ---------------------------
+@st.cache_resource
+def get_rewrite_cache():
+    return DiskCache("rewrites", max_bytes=int(os.getenv("REWRITE_CACHE_MB", "256")) * 1024 * 1024)
+
+@st.cache_resource
+def get_audio_cache():
+    return DiskCache("audio", max_bytes=int(os.getenv("AUDIO_CACHE_MB", "1024")) * 1024 * 1024)
+
+@st.cache_resource
+def get_extraction_cache():
+    return DiskCache("extractions", max_bytes=int(os.getenv("EXTRACTION_CACHE_MB", "256")) * 1024 * 1024)
+
+@st.cache_resource
+def get_page_cache():
+    return DiskCache("pages", max_bytes=int(os.getenv("PAGE_CACHE_MB", "64")) * 1024 * 1024)
+
+@st.cache_resource
+def get_url_session():
+    # One pooled session for all sessions' fetches, so connections to the
+    # same site are reused.
+    return make_session()
+
+@st.cache_resource
+def get_artifact_store():
+    store = ArtifactStore()
+    store.start_reaper()
+    return store
+
+@st.cache_resource
+def get_job_runner():
+    prune_checkpoints()
+    return JobRunner()
+
+@st.cache_resource(max_entries=8)
+def get_passage_index(sha256, _path):
+    # Keyed on content, so every session with the same book shares one
+    # index; passages are read back from the caller's own copy.
+    return PassageIndex(_path)
+
+@st.cache_resource
+def start_metrics_server():
+    # Prometheus /metrics on METRICS_PORT, once per process (not per session).
+    return metrics.start_http_server()
+
+start_metrics_server()
 
 # ---------------------------
 # SESSION STATE
 # ---------------------------
+# Large text and audio live in the artifact store (artifacts.py); session
+# state only holds their handles.
 for key, default in {
-    "original_text": "",
-    "rewritten_text": "",
+    "session_id": uuid.uuid4().hex,
+    "original_artifact": None,
+    "rewritten_artifact": None,
     "audio_path": None,
+    # {"format", "path"}: audio_path re-encoded for download (encoding.py).
+    "encoded_audio": None,
+    "download_format": AUDIO_OUTPUT_FORMAT if AUDIO_OUTPUT_FORMAT in available_formats() else "original",
     "last_uploaded_files": None,
+    "doc_headings": [],
+    "chapters": None,
+    "chapter_index": None,
     "messages": [],
+    "rewrite_job": None,
+    "tts_job": None,
+    "chapter_job": None,
+    "encode_job": None,
+    "stream_job": None,
+    # Sections the streaming job has finished so far ({"index", "audio_path",
+    # "notice"}), appended from the job's thread, and their scratch directory.
+    "stream_sections": [],
+    "stream_dir": None,
+    "job_notices": [],
     "active_tab": "Step 1: Upload"
 }.items():
     if key not in st.session_state:
         st.session_state[key] = default
 
+# Groq requests made by this session (and the jobs it starts) queue as one
+# owner in the shared rate limiter.
+ratelimit.set_owner(st.session_state.session_id)
+
+# ---------------------------
+# SESSION ARTIFACTS
+# ---------------------------
+def load_text(key):
+    return get_artifact_store().read_text(st.session_state[key])
+
+def save_text(key, text):
+    store = get_artifact_store()
+    old = st.session_state[key]
+    st.session_state[key] = store.put_text(st.session_state.session_id, text, name=key) if text else None
+    store.delete(old)
+
+def set_audio_path(path):
+    old = st.session_state.audio_path
+    st.session_state.audio_path = path
+    if old != path:
+        get_artifact_store().delete(old)
+        set_encoded_audio(None)
+
+def set_encoded_audio(encoded):
+    old = st.session_state.encoded_audio
+    st.session_state.encoded_audio = encoded
+    if old and old != encoded:
+        get_artifact_store().delete(old["path"])
+
+def new_audio_path(name, suffix=".mp3"):
+    return get_artifact_store().new_path(st.session_state.session_id, name, suffix)
+
+def clear_chapters():
+    delete_chapter_artifacts(get_artifact_store(), st.session_state.chapters or [])
+    st.session_state.chapters, st.session_state.chapter_index = None, None
+
+def reset_document():
+    save_text("original_artifact", "")
+    save_text("rewritten_artifact", "")
+    set_audio_path(None)
+    clear_chapters()
+
+def touch_session():
+    """Keep this session's artifacts alive; notice if the reaper took them."""
+    get_artifact_store().touch(st.session_state.session_id)
+    handles = [st.session_state.original_artifact, st.session_state.rewritten_artifact]
+    paths = [handle.path for handle in handles if handle] + [st.session_state.audio_path]
+    if st.session_state.encoded_audio:
+        paths.append(st.session_state.encoded_audio["path"])
+    if any(path and not os.path.exists(path) for path in paths):
+        st.session_state.original_artifact = st.session_state.rewritten_artifact = None
+        st.session_state.encoded_audio = None
+        st.session_state.audio_path, st.session_state.chapters, st.session_state.chapter_index = None, None, None
+        st.session_state.last_uploaded_files = None
+        st.warning("This session was idle for too long and its documents were cleared. Please upload them again.")
+
 # ---------------------------
 # TEXT PROCESSING
 # ---------------------------
-def chunk_text_by_sentences(text, max_chunk_length=3000):
-    sentences = re.split(r'(?<=[.!?]) +', text.strip())
-    chunks, current_chunk = [], ""
-    for sentence in sentences:
-        if len(current_chunk) + len(sentence) < max_chunk_length:
-            current_chunk += " " + sentence
-        else:
-            chunks.append(current_chunk.strip())
-            current_chunk = sentence
-    if current_chunk:
-        chunks.append(current_chunk.strip())
-    return chunks
-
-def rewrite_with_groq(text, progress_placeholder):
-    chunks = chunk_text_by_sentences(text)
-    rewritten = ""
-    progress_bar = progress_placeholder.progress(0, text="Initializing rewrite...")
-    for i, chunk in enumerate(chunks):
-        try:
-            response = client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[
-                    {"role": "system", "content": "You are an expert audiobook scriptwriter. Rewrite the text in a storytelling tone."},
-                    {"role": "user", "content": chunk}
-                ],
-                temperature=0.7,
-                max_tokens=4096
+# These run as background jobs (see jobs.py), off the script thread, so
+# they must not call Streamlit; caches are passed in by the caller. Chunks
+# are checkpointed as they finish, so clicking the button again after a
+# crash, restart or partial failure only redoes the missing chunks.
+def rewrite_with_groq(client, text, cache=None, on_progress=None, resume=True):
+    # resume=False asks for a fresh rewrite: no cache, no checkpoint.
+    checkpoint = Checkpoint(checkpoint_key("rewrite", text)) if resume else None
+    rewritten, errors = rewrite_text(client, text, on_progress=on_progress, cache=cache, checkpoint=checkpoint)
+    if checkpoint and not errors:
+        checkpoint.discard()
+    return rewritten, errors
+
+# ---------------------------
+# DOCUMENT CHAT
+# ---------------------------
+CHAT_MODEL = "llama-3.1-8b-instant"
+# Earlier turns sent along with a question, for follow-ups.
+CHAT_HISTORY_MESSAGES = 6
+CHAT_MAX_TOKENS = 1024
+
+def chat_passages(question):
+    """Top passages of the uploaded book for ``question`` (none without a book)."""
+    artifact = st.session_state.original_artifact
+    if not artifact:
+        return []
+    return get_passage_index(artifact.sha256, artifact.path).passages(question, path=artifact.path)
+
+def stream_chat_reply(client, messages):
+    """Yield the reply's text as it streams in."""
+    prompt_chars = sum(len(message["content"]) for message in messages)
+    with metrics.span("chat", chars=prompt_chars) as record:
+        start = time.perf_counter()
+        cost = sum(estimate_tokens(message["content"]) for message in messages) + CHAT_MAX_TOKENS
+        # The slot is held until the reply has finished streaming, and the
+        # bucket is charged with the usage Groq reports at the end.
+        with ratelimit.LIMITER.hold(cost) as usage_record:
+            stream = client.chat.completions.create(
+                model=CHAT_MODEL, messages=messages, temperature=0.7, max_tokens=CHAT_MAX_TOKENS, stream=True
             )
-            rewritten_chunk = response.choices[0].message.content.strip()
-            rewritten += rewritten_chunk + " "
-            progress_bar.progress((i + 1) / len(chunks), text=f"Rewriting chunk {i+1}/{len(chunks)}...")
-        except Exception as e:
-            st.error(f"Error processing chunk {i+1}: {e}")
-    progress_bar.empty()
-    return rewritten
+            first_token = True
+            for chunk in stream:
+                # Groq reports usage on the last chunk, under x_groq.
+                usage = getattr(getattr(chunk, "x_groq", None), "usage", None)
+                if usage is not None:
+                    record["tokens_prompt"] = usage.prompt_tokens
+                    record["tokens_completion"] = usage.completion_tokens
+                    usage_record["used"] = usage.total_tokens
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if first_token:
+                        metrics.REGISTRY.observe("chat_first_token_seconds", time.perf_counter() - start,
+                                                 help="Time to the first streamed chat token.")
+                        first_token = False
+                    yield delta
+
+def format_sources(passages):
+    return "Passages used: " + ", ".join(str(passage + 1) for passage, _ in passages)
 
 # ---------------------------
 # gTTS (Human-Like TTS)
 # ---------------------------
-MAX_TTS_LENGTH = 4000
-
-def clean_text_for_tts(text):
-    cleaned = re.sub(r'[^\w\s.,!?;:()"\']', '', text)
-    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
-    return cleaned
-
-def chunk_text_for_gtts(text, max_length=MAX_TTS_LENGTH):
-    sentences = re.split(r'(?<=[.!?]) +', text.strip())
-    chunks, current = [], ""
-    for sentence in sentences:
-        if len(current) + len(sentence) < max_length:
-            current += " " + sentence
-        else:
-            chunks.append(current.strip())
-            current = sentence
-    if current:
-        chunks.append(current.strip())
-    return chunks
-
 # ------------------------------------------------------------------
 # 🔥 FIXED FUNCTION: REMOVED SILENCE, WORKS ON STREAMLIT CLOUD
 # ------------------------------------------------------------------
-def convert_text_to_speech_gtts(text, language="en", storyteller=True):
-    cleaned_text = clean_text_for_tts(text)
-    chunks = chunk_text_for_gtts(cleaned_text)
+def convert_text_to_speech_gtts(text, final_path, language="en", storyteller=True, cache=None, on_progress=None):
+    # ❌ Removed silent placeholder completely
+    checkpoint = Checkpoint(checkpoint_key("tts", text, engine="gtts", voice=language, storyteller=storyteller))
+    path, gaps, total = text_to_speech(
+        text, final_path, "gtts", language, storyteller, cache=cache, on_progress=on_progress, checkpoint=checkpoint
+    )
+    if path and not gaps:
+        checkpoint.discard()
+    return path, gaps, total
+# ------------------------------------------------------------------
 
-    if not chunks:
-        st.error("No text available to convert to audio.")
-        return None
+def encode_for_download(audio_path, output_path, format_key, on_progress=None):
+    # Returns the source too, so a result for audio that has since been
+    # replaced can be told apart.
+    return audio_path, format_key, encode_audio(audio_path, output_path, format_key, on_progress=on_progress)
 
-    temp_dir = tempfile.mkdtemp()
-    mp3_chunks = []
+# ---------------------------
+# BACKGROUND JOBS
+# ---------------------------
+JOB_POLL_SECONDS = 1.0
+JOB_LABELS = {"rewrite_job": "Rewriting", "tts_job": "Synthesizing audio", "chapter_job": "Chapters",
+              "encode_job": "Encoding audiobook", "stream_job": "Rewriting & narrating"}
+# What a job's on_progress(done, total) counts, for the progress bar.
+JOB_UNITS = {"encode_job": "second", "stream_job": "section"}
+
+def apply_rewrite_result(job):
+    rewritten, errors = job["result"]
+    save_text("rewritten_artifact", rewritten)
+    clear_chapters()
+    notices = [("error", f"Error processing chunk {i+1}: {e}") for i, e in sorted(errors.items())]
+    if errors:
+        # Finished chunks are checkpointed, so a second run only redoes these.
+        return notices + [("warning", f"{len(errors)} chunk(s) are missing from the script. "
+                                      "Click \"Rewrite with AI\" again to retry just those.")]
+    return notices + [("success", "Rewrite finished.")]
+
+def apply_tts_result(job):
+    path, gaps, total = job["result"]
+    if not total:
+        return [("error", "No text available to convert to audio.")]
+    notices = [("warning", format_gap_report(gaps, total))] if gaps else []
+    if not path:
+        return notices + [("error", "No audio generated.")]
+    get_artifact_store().check_quota(st.session_state.session_id, path)
+    set_audio_path(path)
+    return notices + [("success", "Audiobook ready!")]
+
+def apply_encode_result(job):
+    audio_path, format_key, path = job["result"]
+    if audio_path != st.session_state.audio_path:
+        get_artifact_store().delete(path)
+        return [("info", "The audiobook changed while it was being encoded; encode it again to download it.")]
+    get_artifact_store().check_quota(st.session_state.session_id, path)
+    set_encoded_audio({"format": format_key, "path": path})
+    return [("success", "Download ready.")]
+
+def apply_stream_result(job):
+    result = job["result"]
+    save_text("rewritten_artifact", result["rewritten"])
+    clear_chapters()
+    if result["audio_path"]:
+        get_artifact_store().check_quota(st.session_state.session_id, result["audio_path"])
+    set_audio_path(result["audio_path"])
+    if result["audio_path"]:
+        return result["notices"] + [("success", "Audiobook ready! Download it from Step 3.")]
+    return result["notices"]
+
+def apply_chapter_result(job):
+    result = job["result"]
+    old = st.session_state.chapters or []
+    st.session_state.chapters = result["chapters"]
+    delete_chapter_artifacts(get_artifact_store(), old, keep=result["chapters"])
+    if result["script_changed"]:
+        save_text("rewritten_artifact", join_chapter_scripts(result["chapters"]))
+    if result["audio_path"]:
+        set_audio_path(result["audio_path"])
+        st.session_state.chapter_index = result["index"]
+    elif result["script_changed"]:
+        st.session_state.chapter_index = None
+    return result["notices"]
+
+JOB_HANDLERS = {"rewrite_job": apply_rewrite_result, "tts_job": apply_tts_result, "chapter_job": apply_chapter_result,
+                "encode_job": apply_encode_result, "stream_job": apply_stream_result}
+
+def discard_stream_sections():
+    st.session_state.stream_sections = []
+    get_artifact_store().delete(st.session_state.stream_dir)
+    st.session_state.stream_dir = None
+
+# Run once a job is gone, whatever its outcome.
+JOB_CLEANUP = {"stream_job": discard_stream_sections}
+
+def collect_finished_jobs():
+    """Move results of this session's finished jobs into session state."""
+    runner = get_job_runner()
+    for key, handler in JOB_HANDLERS.items():
+        job_id = st.session_state[key]
+        if not job_id:
+            continue
+        job = runner.get(job_id)
+        if (job is None or job["status"] in FINISHED) and key in JOB_CLEANUP:
+            JOB_CLEANUP[key]()
+        if job is None:
+            st.session_state[key] = None
+            st.session_state.job_notices.append(("error", f"{JOB_LABELS[key]} job expired before it was collected."))
+        elif job["status"] in FINISHED:
+            st.session_state[key] = None
+            runner.forget(job_id)
+            if job["status"] == DONE:
+                try:
+                    st.session_state.job_notices.extend(handler(job))
+                except ArtifactQuotaError as e:
+                    st.session_state.job_notices.append(("error", str(e)))
+            elif job["status"] == FAILED:
+                st.session_state.job_notices.append(("error", f"{JOB_LABELS[key]} failed: {job['error']}"))
+            else:
+                st.session_state.job_notices.append(("info", f"{JOB_LABELS[key]} cancelled."))
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress():
+    # Only this fragment reruns while a job is active; the full script
+    # reruns once, when a job finishes, to pick up its result.
+    runner = get_job_runner()
+    for key, label in JOB_LABELS.items():
+        job_id = st.session_state[key]
+        if not job_id:
+            continue
+        job = runner.get(job_id)
+        if job is None or job["status"] in FINISHED:
+            st.rerun()
+        if job["total"]:
+            unit = JOB_UNITS.get(key, "chunk")
+            st.progress(job["done"] / job["total"], text=f"{label}: {unit} {job['done']}/{job['total']}")
+        else:
+            st.progress(0, text=f"{label}: {job['status']}...")
+        if st.button("Cancel", key=f"cancel_{key}"):
+            runner.cancel(job_id)
 
-    # ❌ Removed silent placeholder completely
+# ---------------------------
+# STREAMING MODE (rewrite + narrate overlapped)
+# ---------------------------
+def stream_rewrite_and_narrate(client, store, session_id, text, out_dir, sections, language="en", storyteller=True,
+                               rewrite_cache=None, audio_cache=None, on_progress=None):
+    """Background job: rewrite and narrate ``text`` with the stages overlapped.
+
+    Each section is appended to ``sections`` as soon as its audio is ready
+    (in ``out_dir``, which the caller deletes), so the page can play it
+    while the rest is generated. Returns ``{"rewritten", "audio_path",
+    "notices"}``.
+    """
+    chunks = chunk_for_rewrite(text)
+    if not chunks:
+        return {"rewritten": "", "audio_path": None, "notices": [("error", "No text available to rewrite.")]}
 
-    for i, chunk in enumerate(chunks):
-        try:
-            if storyteller:
-                chunk = re.sub(r'(?<=[.!?]) ', '. ', chunk)
-                chunk = chunk.replace(',', ', ')
-                chunk = chunk + " ..."
+    def tts_chunker(rewritten_chunk):
+        return chunk_for_tts(clean_text_for_tts(rewritten_chunk))
 
-            tts = gTTS(text=chunk, lang=language, slow=True)
-            chunk_path = os.path.join(temp_dir, f"chunk_{i}.mp3")
-            tts.save(chunk_path)
-            mp3_chunks.append(chunk_path)
+    def synthesize(piece, path):
+        return synthesize_gtts_chunk_cached(piece, path, language, storyteller, cache=audio_cache)
 
-        except Exception as e:
-            st.error(f"Error generating audio for chunk {i+1}: {e}")
+    rewritten_parts, section_paths, notices = [], [], []
+    for section in stream_audiobook(client, chunks, tts_chunker, synthesize, out_dir, rewrite_cache=rewrite_cache):
+        n, total = section["index"] + 1, section["total"]
+        notice = None
+        if section["error"]:
+            notice = ("error", f"Error processing chunk {n}: {section['error']}")
+        else:
+            rewritten_parts.append(section["text"] + " ")
+            if section["gaps"]:
+                notice = ("warning", format_gap_report(section["gaps"], section["pieces"]))
+            if section["audio_path"]:
+                section_paths.append(section["audio_path"])
+        if notice:
+            notices.append(notice)
+        sections.append({"index": n, "audio_path": section["audio_path"], "notice": notice})
+        if on_progress:
+            on_progress(n, total)
+
+    final_path = None
+    if section_paths:
+        final_path = concatenate_mp3(section_paths, store.new_path(session_id, "audiobook", ".mp3"))
+    return {"rewritten": "".join(rewritten_parts), "audio_path": final_path, "notices": notices}
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_stream_sections():
+    with st.expander("Sections (play while the rest is generated)", expanded=True):
+        sections = list(st.session_state.stream_sections)
+        if not sections:
+            st.caption("Sections appear here as soon as they are narrated.")
+        for section in sections:
+            if section["notice"]:
+                getattr(st, section["notice"][0])(section["notice"][1])
+            if section["audio_path"]:
+                st.caption(f"Section {section['index']}")
+                st.audio(section["audio_path"], format="audio/mp3")
 
-    if not mp3_chunks:
-        st.error("No audio generated.")
+# ---------------------------
+# CHAPTERS
+# ---------------------------
+# Chapter "text", "script" and "audio_path" are artifacts, like the
+# document's. The chapter jobs below run on the job runner like the other
+# jobs, so they must not touch Streamlit: they work on copies of the
+# chapter dicts and return them, and apply_chapter_result() swaps them
+# into session state. A job that fails or is cancelled deletes what it
+# created.
+CHAPTER_FIELDS = ("text", "script", "audio_path")
+
+def _artifact_path(artifact):
+    return getattr(artifact, "path", artifact)
+
+def delete_chapter_artifacts(store, chapters, keep=()):
+    """Delete the artifacts of ``chapters`` that ``keep`` (other chapters) doesn't use."""
+    kept = {_artifact_path(chapter.get(field)) for chapter in keep for field in CHAPTER_FIELDS}
+    for chapter in chapters:
+        for field in CHAPTER_FIELDS:
+            if _artifact_path(chapter.get(field)) not in kept:
+                store.delete(chapter.get(field))
+
+def _progress_from(on_progress, offset, total):
+    """``on_progress`` for one step of a job, reported as overall counts."""
+    if on_progress is None:
         return None
+    return lambda done, _: on_progress(offset + done, total)
+
+def rewrite_chapter(client, store, session_id, chapter, cache=None, on_progress=None, resume=True):
+    """Rewritten copy of ``chapter`` (without audio) and its chunk errors."""
+    script, errors = rewrite_with_groq(client, store.read_text(chapter["text"]), cache, on_progress, resume)
+    chapter = dict(chapter, script=store.put_text(session_id, script, name="chapter-script"), audio_path=None)
+    return chapter, [("error", f"Error processing chunk {i+1} of \"{chapter['title']}\": {e}")
+                     for i, e in sorted(errors.items())]
+
+def narrate_chapter(store, session_id, chapter, cache=None, on_progress=None, language="en", storyteller=True):
+    """Narrated copy of ``chapter`` and its gap report notices."""
+    path, gaps, total = convert_text_to_speech_gtts(
+        store.read_text(chapter["script"]), store.new_path(session_id, "chapter", ".mp3"), language, storyteller,
+        cache=cache, on_progress=on_progress
+    )
+    chapter = dict(chapter, audio_path=path)
+    if path:
+        store.check_quota(session_id, path)
+    return chapter, [("warning", f"{chapter['title']}: {format_gap_report(gaps, total)}")] if gaps else []
+
+def assemble_chapter_book(store, session_id, chapters):
+    """Join the narrated chapters into one book with an ID3 chapter index.
+
+    Returns ``(chapters, path, index)``; the chapters get their
+    ``start_ms``. ``path`` and ``index`` are ``None`` if nothing is narrated.
+    """
+    ready = [i for i, chapter in enumerate(chapters) if chapter.get("audio_path")]
+    if not ready:
+        return chapters, None, None
+    final_path = store.new_path(session_id, "audiobook", ".mp3")
+    index = assemble_chapters(
+        [chapters[i]["audio_path"] for i in ready], [chapters[i]["title"] for i in ready], final_path
+    )
+    store.check_quota(session_id, final_path)
+    chapters = [dict(chapter) for chapter in chapters]
+    for i, entry in zip(ready, index):
+        chapters[i]["start_ms"] = entry["start_ms"]
+    return chapters, final_path, index
+
+def rewrite_by_chapter(client, store, session_id, text, known_headings=(), cache=None, on_progress=None):
+    chapters = detect_chapters(text, known_headings)
+    totals = [len(chunk_for_rewrite(chapter["text"])) for chapter in chapters]
+    rewritten, notices = [], []
+    try:
+        for chapter, offset in zip(chapters, accumulate([0] + totals)):
+            rewritten.append(dict(chapter, text=store.put_text(session_id, chapter["text"], name="chapter-text")))
+            rewritten[-1], errors = rewrite_chapter(client, store, session_id, rewritten[-1], cache,
+                                                    _progress_from(on_progress, offset, sum(totals)))
+            notices += errors
+    except BaseException:
+        delete_chapter_artifacts(store, rewritten)
+        raise
+    return {"chapters": rewritten, "audio_path": None, "index": None, "script_changed": True,
+            "notices": notices + [("success", f"Rewrote {len(rewritten)} chapter(s).")]}
+
+def narrate_chapters(store, session_id, chapters, cache=None, on_progress=None):
+    totals = [len(chunk_for_tts(clean_text_for_tts(store.read_text(chapter["script"])))) for chapter in chapters]
+    narrated, notices = [], []
+    try:
+        for chapter, offset in zip(chapters, accumulate([0] + totals)):
+            chapter, gaps = narrate_chapter(store, session_id, chapter, cache,
+                                            _progress_from(on_progress, offset, sum(totals)))
+            narrated.append(chapter)
+            notices += gaps
+        narrated, audio_path, index = assemble_chapter_book(store, session_id, narrated)
+    except BaseException:
+        delete_chapter_artifacts(store, narrated, keep=chapters)
+        raise
+    if not audio_path:
+        notices.append(("error", "No chapter audio generated."))
+    return {"chapters": narrated, "audio_path": audio_path, "index": index, "script_changed": False,
+            "notices": notices}
+
+def regenerate_chapter(client, store, session_id, chapters, i, script=None, cache=None, on_progress=None):
+    """Rewrite chapter ``i`` again, or give it ``script``; then re-narrate it and reassemble the book."""
+    updated, notices = list(chapters), []
+    try:
+        if script is None:
+            # A fresh rewrite, so the rewrite cache and checkpoint are bypassed.
+            updated[i], notices = rewrite_chapter(client, store, session_id, updated[i], on_progress=on_progress,
+                                                  resume=False)
+        else:
+            updated[i] = dict(updated[i], script=store.put_text(session_id, script, name="chapter-script"),
+                              audio_path=None)
+        updated[i], gaps = narrate_chapter(store, session_id, updated[i], cache, on_progress)
+        updated, audio_path, index = assemble_chapter_book(store, session_id, updated)
+    except BaseException:
+        delete_chapter_artifacts(store, updated, keep=chapters)
+        raise
+    return {"chapters": updated, "audio_path": audio_path, "index": index, "script_changed": True,
+            "notices": notices + gaps + [("success", f"Regenerated \"{updated[i]['title']}\".")]}
+
+def join_chapter_scripts(chapters):
+    store = get_artifact_store()
+    return "".join(store.read_text(chapter["script"]) for chapter in chapters)
 
-    # Merge MP3 chunks directly
-    final_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3").name
-    with open(final_path, "wb") as outfile:
-        for mp3_file in mp3_chunks:
-            with open(mp3_file, "rb") as f:
-                outfile.write(f.read())
+# ---------------------------
+# FILE EXTRACTION
+# ---------------------------
+def extract_text_from_urls(urls):
+    progress_bar = st.progress(0, text="Fetching pages...")
 
-    return final_path
-# ------------------------------------------------------------------
+    def update_progress(done, total):
+        progress_bar.progress(done / total, text=f"Fetched {done}/{total} page(s)...")
+
+    texts, errors = fetch_urls(urls, session=get_url_session(), cache=get_page_cache(), on_progress=update_progress)
+    progress_bar.empty()
+    for i, e in sorted(errors.items()):
+        st.error(f"Error fetching {urls[i]}: {e}")
+    for url, text in zip(urls, texts):
+        if text == "":
+            st.warning(f"Could not find any paragraph text on {url}.")
+    return "\n\n".join(text for text in texts if text)
 
 # ---------------------------
-# FILE EXTRACTION
+# PAGED TEXT VIEWER
 # ---------------------------
-def extract_text_from_url(url):
-    try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        paragraphs = soup.find_all('p')
-        return "\n".join([p.get_text() for p in paragraphs]) if paragraphs else ""
-    except requests.exceptions.RequestException as e:
-        st.error(f"Error fetching URL: {e}")
-        return ""
-
-def extract_text_from_pdf(file):
-    text = ""
-    with pdfplumber.open(file) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text() or ""
-    return text
-
-def extract_text_from_docx(file):
-    doc = docx.Document(file)
-    return "\n".join([para.text for para in doc.paragraphs])
+def get_page_index(artifact, key):
+    # Artifacts are immutable files, so the path tells whether the text
+    # was replaced since the index was built.
+    cached = st.session_state.get(f"{key}_page_index")
+    if cached is None or cached.path != artifact.path:
+        cached = PageIndex(artifact.path)
+        st.session_state[f"{key}_page_index"] = cached
+        st.session_state[f"{key}_page"] = 1
+    return cached
+
+def render_text_viewer(artifact, key):
+    """Show one page of a text artifact at a time, with search and jump-to-page.
+
+    Only the visible page is read from disk and sent to the browser, so a
+    rerun costs the same for a 2 MB book as for a short article.
+    """
+    index = get_page_index(artifact, key)
+    page_key, query_key = f"{key}_page", f"{key}_query"
+    col1, col2 = st.columns([3, 1])
+    query = col1.text_input("Search", key=query_key, placeholder="Search text...", label_visibility="collapsed")
+    col2.number_input("Page", min_value=1, max_value=len(index), key=page_key, label_visibility="collapsed")
+    if query:
+        hits = index.search(query)
+        if hits:
+            def jump():
+                hit = st.session_state[f"{key}_hit"]
+                st.session_state[page_key] = index.page_of(hit) + 1
+            st.selectbox(
+                f"{len(hits)}{'+' if len(hits) == MAX_SEARCH_HITS else ''} match(es)",
+                [offset for _, offset in hits], key=f"{key}_hit", on_change=jump,
+                format_func=lambda offset: f"Page {index.page_of(offset) + 1}: …{index.snippet(offset, len(query))}…",
+            )
+        else:
+            st.caption("No matches.")
+    page = st.session_state[page_key] - 1
+    st.markdown(f'<div class="text-container">{page_html(index, page, query)}</div>', unsafe_allow_html=True)
+    st.caption(f"Page {page + 1} of {len(index)} · {artifact.chars:,} characters")
 
 # ---------------------------
 # STREAMLIT UI
@@ -220,12 +688,31 @@ def extract_text_from_docx(file):
 st.title(" AI AUDIOBOOK GENERATOR")
 st.markdown("##### Convert documents and articles into human-like narrated audiobooks — free and easy!")
 
+touch_session()
+collect_finished_jobs()
+for level, message in st.session_state.job_notices:
+    getattr(st, level)(message)
+st.session_state.job_notices = []
+
 with st.sidebar:
     st.header("Settings")
     st.markdown(" Voice: Google gTTS (Human-like)")
     st.markdown(" Powered by: Groq + Streamlit")
     st.markdown("---")
     st.info("Tip: Use en-in for Indian accent or en-uk for British accent.")
+    rewrite_cache_stats = get_rewrite_cache().stats()
+    st.caption(f"Rewrite cache: {rewrite_cache_stats['hits']} hits / {rewrite_cache_stats['misses']} misses")
+    audio_cache_stats = get_audio_cache().stats()
+    st.caption(f"Audio cache: {audio_cache_stats['hits']} hits / {audio_cache_stats['misses']} misses")
+    groq_tokens = sum(metrics.REGISTRY.value("groq_tokens_total", kind=kind) for kind in ("prompt", "completion"))
+    st.caption(f"Groq tokens used (all sessions): {groq_tokens}")
+    limiter_stats = ratelimit.LIMITER.stats()
+    st.caption(f"Groq requests: {limiter_stats['in_flight']} in flight, {limiter_stats['waiting']} queued, "
+               f"limit {limiter_stats['limit']}, {limiter_stats['throttled']} rate-limited")
+    if any(st.session_state[key] for key in JOB_LABELS):
+        st.markdown("---")
+        st.subheader("Background Jobs")
+        show_job_progress()
 
 tab_names = ["Step 1: Upload", "Step 2: Rewrite", "Step 3: Generate & Chat"]
 st.session_state.active_tab = st.radio("Navigation", tab_names, horizontal=True, label_visibility="collapsed", key="navigation_radio")
@@ -239,62 +726,112 @@ if st.session_state.active_tab == "Step 1: Upload":
 
     if input_method == "Upload File(s)":
         uploaded_files = st.file_uploader("Upload PDF, DOCX, or TXT files:", type=["pdf", "docx", "txt"], accept_multiple_files=True)
+        strip_boilerplate = st.checkbox(
+            "Remove repeated headers, footers and boilerplate", value=True,
+            help="Running headers, page numbers and duplicated paragraphs would otherwise be rewritten and read out on every page."
+        )
         if uploaded_files:
-            uploaded_filenames = [f.name for f in uploaded_files]
-            if st.session_state.last_uploaded_files != uploaded_filenames:
-                st.session_state.original_text, st.session_state.rewritten_text, st.session_state.audio_path = "", "", None
-                all_text = ""
+            uploaded_data = [(f.name, f.getvalue()) for f in uploaded_files]
+            uploaded_signature = [(name, content_hash(data)) for name, data in uploaded_data] + [strip_boilerplate]
+            if st.session_state.last_uploaded_files != uploaded_signature:
+                reset_document()
+                pdf_timings, doc_headings = {}, []
                 with st.spinner("Extracting text..."):
-                    for uploaded_file in uploaded_files:
-                        if uploaded_file.name.endswith(".pdf"):
-                            all_text += extract_text_from_pdf(uploaded_file)
-                        elif uploaded_file.name.endswith(".docx"):
-                            all_text += extract_text_from_docx(uploaded_file)
-                        else:
-                            all_text += uploaded_file.read().decode("utf-8")
-                st.session_state.original_text = all_text
-                st.session_state.last_uploaded_files = uploaded_filenames
-            if st.session_state.original_text:
-                st.success(f"Extracted {len(st.session_state.original_text)} characters.")
+                    texts = ingest_files(uploaded_data, cache=get_extraction_cache(), timings=pdf_timings, headings=doc_headings)
+                boilerplate_report = None
+                if strip_boilerplate:
+                    with st.spinner("Removing boilerplate..."):
+                        texts, boilerplate_report = remove_boilerplate_each(texts)
+                st.session_state.boilerplate_report = boilerplate_report
+                try:
+                    save_text("original_artifact", "".join(texts))
+                except ArtifactQuotaError as e:
+                    st.error(str(e))
+                st.session_state.doc_headings = doc_headings
+                st.session_state.last_uploaded_files = uploaded_signature
+                st.session_state.pdf_timings = pdf_timings
+            if st.session_state.original_artifact:
+                st.success(f"Extracted {st.session_state.original_artifact.chars} characters.")
+                boilerplate_report = st.session_state.get("boilerplate_report")
+                if boilerplate_report and boilerplate_report["chars_saved"]:
+                    st.info(format_boilerplate_report(boilerplate_report))
+                if st.session_state.get("pdf_timings"):
+                    with st.expander("PDF extraction timings"):
+                        for filename, timings in st.session_state.pdf_timings.items():
+                            st.markdown(f"**{filename}**\n\n{format_page_timings(timings)}")
                 if st.button("Proceed to Step 2 →", use_container_width=True):
                     st.session_state.active_tab = "Step 2: Rewrite"
                     st.rerun()
 
     elif input_method == "From Web URL":
-        url = st.text_input("Enter article URL:")
+        url_input = st.text_area("Enter article URL(s), one per line:")
         if st.button("Fetch Text", use_container_width=True):
-            if url:
-                with st.spinner("Fetching text..."):
-                    text = extract_text_from_url(url)
-                st.session_state.original_text = text
-                if text:
+            urls = [line.strip() for line in url_input.splitlines() if line.strip()]
+            if urls:
+                text = extract_text_from_urls(urls)
+                reset_document()
+                try:
+                    save_text("original_artifact", text)
+                except ArtifactQuotaError as e:
+                    st.error(str(e))
+                if st.session_state.original_artifact:
                     st.success("Text extracted successfully!")
-                    st.markdown(f'<div class="text-container">{text[:1000]}...</div>', unsafe_allow_html=True)
-                    if st.button("Proceed to Step 2 →", use_container_width=True):
-                        st.session_state.active_tab = "Step 2: Rewrite"
-                        st.rerun()
             else:
                 st.warning("Please enter a valid URL.")
+        if st.session_state.original_artifact:
+            render_text_viewer(st.session_state.original_artifact, "url_preview")
+            if st.button("Proceed to Step 2 →", use_container_width=True):
+                st.session_state.active_tab = "Step 2: Rewrite"
+                st.rerun()
 
 # ---------------------------
 # Step 2: Rewrite
 # ---------------------------
 elif st.session_state.active_tab == "Step 2: Rewrite":
     st.header("🪄 AI Script Rewriter")
-    if not st.session_state.original_text:
+    if not st.session_state.original_artifact:
         st.warning("Upload or fetch text first.")
     else:
         col1, col2 = st.columns(2)
         with col1:
             st.subheader("Original Text")
-            st.markdown(f'<div class="text-container">{st.session_state.original_text}</div>', unsafe_allow_html=True)
+            render_text_viewer(st.session_state.original_artifact, "original")
         with col2:
             st.subheader("Rewritten Script")
-            if st.button("Rewrite with AI ", use_container_width=True):
-                progress_placeholder = st.empty()
-                st.session_state.rewritten_text = rewrite_with_groq(st.session_state.original_text, progress_placeholder)
-            if st.session_state.rewritten_text:
-                st.markdown(f'<div class="text-container">{st.session_state.rewritten_text}</div>', unsafe_allow_html=True)
+            if st.button("Rewrite with AI ", use_container_width=True, disabled=bool(st.session_state.rewrite_job)):
+                st.session_state.rewrite_job = get_job_runner().submit(
+                    "rewrite", rewrite_with_groq, get_groq_client(groq_api_key), load_text("original_artifact"),
+                    cache=get_rewrite_cache()
+                )
+                st.rerun()
+            if st.session_state.rewrite_job:
+                st.info("Rewriting in the background; progress is shown in the sidebar.")
+            if st.button("Rewrite by Chapter ", use_container_width=True, disabled=bool(st.session_state.chapter_job)):
+                clear_chapters()
+                st.session_state.chapter_job = get_job_runner().submit(
+                    "chapters", rewrite_by_chapter, get_groq_client(groq_api_key), get_artifact_store(),
+                    st.session_state.session_id, load_text("original_artifact"), st.session_state.doc_headings,
+                    cache=get_rewrite_cache()
+                )
+                st.rerun()
+            if st.session_state.chapter_job:
+                st.info("Working on chapters in the background; progress is shown in the sidebar.")
+            if st.button("Rewrite & Narrate (Streaming) ", use_container_width=True,
+                         disabled=bool(st.session_state.stream_job)):
+                store = get_artifact_store()
+                st.session_state.stream_sections = []
+                st.session_state.stream_dir = store.temp_dir(st.session_state.session_id)
+                st.session_state.stream_job = get_job_runner().submit(
+                    "stream", stream_rewrite_and_narrate, get_groq_client(groq_api_key), store,
+                    st.session_state.session_id, load_text("original_artifact"), st.session_state.stream_dir,
+                    st.session_state.stream_sections, rewrite_cache=get_rewrite_cache(), audio_cache=get_audio_cache()
+                )
+                st.rerun()
+            if st.session_state.stream_job:
+                st.info("Rewriting and narrating in the background; progress is shown in the sidebar.")
+                show_stream_sections()
+            if st.session_state.rewritten_artifact:
+                render_text_viewer(st.session_state.rewritten_artifact, "rewritten")
                 if st.button("Proceed to Step 3 →", use_container_width=True):
                     st.session_state.active_tab = "Step 3: Generate & Chat"
                     st.rerun()
@@ -304,41 +841,116 @@ elif st.session_state.active_tab == "Step 2: Rewrite":
 # ---------------------------
 elif st.session_state.active_tab == "Step 3: Generate & Chat":
     st.header(" Generate Your Audiobook")
-    if not st.session_state.rewritten_text:
+    if not st.session_state.rewritten_artifact:
         st.warning("Please rewrite your text first.")
     else:
-        if st.button("Generate Human-like Audio ", use_container_width=True):
-            with st.spinner("Generating natural narration..."):
-                st.session_state.audio_path = convert_text_to_speech_gtts(
-                    st.session_state.rewritten_text,
-                    language="en",
-                    storyteller=True
-                )
-            if st.session_state.audio_path:
-                st.success("Audiobook ready!")
+        if st.button("Generate Human-like Audio ", use_container_width=True, disabled=bool(st.session_state.tts_job)):
+            st.session_state.tts_job = get_job_runner().submit(
+                "tts", convert_text_to_speech_gtts,
+                load_text("rewritten_artifact"),
+                new_audio_path("audiobook"),
+                language="en",
+                storyteller=True,
+                cache=get_audio_cache()
+            )
+            st.rerun()
+        if st.session_state.tts_job:
+            st.info("Generating natural narration in the background; progress is shown in the sidebar.")
 
         if st.session_state.audio_path:
             st.audio(st.session_state.audio_path, format="audio/mp3")
-            with open(st.session_state.audio_path, "rb") as f:
-                st.download_button("⬇ Download Audiobook", data=f, file_name="ai_audiobook.mp3", mime="audio/mp3")
+            formats = available_formats()
+            if st.session_state.download_format not in formats:
+                st.session_state.download_format = "original"
+            format_key = st.selectbox("Download format", formats, format_func=lambda key: FORMATS[key].label,
+                                      key="download_format")
+            if len(formats) == 1:
+                st.caption("Install ffmpeg to download smaller, loudness-normalized Opus or MP3 files.")
+            encoded = st.session_state.encoded_audio
+            if format_key == "original":
+                download_path = st.session_state.audio_path
+            elif encoded and encoded["format"] == format_key:
+                download_path = encoded["path"]
+            else:
+                download_path = None
+                if st.button("Encode for Download", use_container_width=True, disabled=bool(st.session_state.encode_job)):
+                    st.session_state.encode_job = get_job_runner().submit(
+                        "encode", encode_for_download,
+                        st.session_state.audio_path,
+                        new_audio_path("audiobook", FORMATS[format_key].extension),
+                        format_key
+                    )
+                    st.rerun()
+                if st.session_state.encode_job:
+                    st.info("Encoding in the background; progress is shown in the sidebar.")
+            if download_path:
+                with open(download_path, "rb") as f:
+                    st.download_button("⬇ Download Audiobook", data=f, file_name=f"ai_audiobook{FORMATS[format_key].extension}",
+                                       mime=mime_type(download_path))
+
+        if st.session_state.chapters:
+            st.markdown("---")
+            st.header("Chapters")
+            chapters = st.session_state.chapters
+            chapter_busy = bool(st.session_state.chapter_job)
+            if st.button("Generate Chapter-Indexed Audiobook ", use_container_width=True, disabled=chapter_busy):
+                st.session_state.chapter_job = get_job_runner().submit(
+                    "chapters", narrate_chapters, get_artifact_store(), st.session_state.session_id, chapters,
+                    cache=get_audio_cache()
+                )
+                st.rerun()
+            if chapter_busy:
+                st.info("Working on chapters in the background; progress is shown in the sidebar.")
+
+            if st.session_state.chapter_index:
+                for i, chapter in enumerate(chapters):
+                    start = format_timestamp(chapter["start_ms"]) if chapter.get("audio_path") else "missing"
+                    with st.expander(f"{i+1}. {chapter['title']} ({start})"):
+                        if chapter.get("audio_path"):
+                            st.audio(chapter["audio_path"], format="audio/mp3")
+                        script = st.text_area("Chapter script", get_artifact_store().read_text(chapter["script"]),
+                                              key=f"chapter_script_{i}", height=150)
+                        col1, col2 = st.columns(2)
+                        renarrate = col1.button("Re-narrate Chapter", key=f"renarrate_{i}", use_container_width=True,
+                                                disabled=chapter_busy)
+                        rewrite_again = col2.button("Rewrite Chapter Again", key=f"rewrite_again_{i}", use_container_width=True,
+                                                    disabled=chapter_busy)
+                        if renarrate or rewrite_again:
+                            if rewrite_again:
+                                st.session_state.pop(f"chapter_script_{i}", None)
+                            st.session_state.chapter_job = get_job_runner().submit(
+                                "chapters", regenerate_chapter, get_groq_client(groq_api_key), get_artifact_store(),
+                                st.session_state.session_id, chapters, i, script=None if rewrite_again else script,
+                                cache=get_audio_cache()
+                            )
+                            st.rerun()
+                st.download_button("⬇ Download Chapter Index (JSON)", data=chapter_index_json(st.session_state.chapter_index),
+                                   file_name="ai_audiobook.chapters.json", mime="application/json")
 
         st.markdown("---")
         st.header("Chat with an AI Assistant")
+        st.caption("Questions are answered from the most relevant passages of your uploaded book.")
         for message in st.session_state.messages:
             with st.chat_message(message["role"]):
                 st.markdown(message["content"])
-        if prompt := st.chat_input("Ask anything..."):
+                if message.get("sources"):
+                    st.caption(message["sources"])
+        if prompt := st.chat_input("Ask anything about the book..."):
+            history = [{"role": m["role"], "content": m["content"]}
+                       for m in st.session_state.messages[-CHAT_HISTORY_MESSAGES:]]
             st.session_state.messages.append({"role": "user", "content": prompt})
-            try:
-                with st.spinner("Thinking..."):
-                    chat_response = client.chat.completions.create(
-                        model="llama-3.1-8b-instant",
-                        messages=[{"role": "system", "content": "You are a helpful assistant."},
-                                  {"role": "user", "content": prompt}],
-                        temperature=0.7
-                    )
-                    response_content = chat_response.choices[0].message.content
-                    st.session_state.messages.append({"role": "assistant", "content": response_content})
-            except Exception as e:
-                st.error(f"Error: {e}")
-            st.rerun()
+            with st.chat_message("user"):
+                st.markdown(prompt)
+            with st.chat_message("assistant"):
+                try:
+                    with st.spinner("Searching the book..."):
+                        passages = chat_passages(prompt)
+                    messages = build_chat_messages(prompt, passages, history)
+                    response_content = st.write_stream(stream_chat_reply(get_groq_client(groq_api_key), messages))
+                    sources = format_sources(passages) if passages else None
+                    if sources:
+                        st.caption(sources)
+                    st.session_state.messages.append({"role": "assistant", "content": response_content,
+                                                      "sources": sources})
+                except Exception as e:
+                    st.error(f"Error: {e}")
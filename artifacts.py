@@ -0,0 +1,234 @@
+import hashlib
+import mmap
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+
+from cache import CACHE_DIR
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR") or os.path.join(CACHE_DIR, "sessions")
+SESSION_QUOTA_MB = int(os.getenv("SESSION_QUOTA_MB", "512"))
+GLOBAL_QUOTA_MB = int(os.getenv("GLOBAL_QUOTA_MB", "4096"))
+# Sessions not seen for this long are reaped with all their artifacts.
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(6 * 3600)))
+REAPER_INTERVAL_SECONDS = int(os.getenv("REAPER_INTERVAL_SECONDS", "600"))
+
+LAST_SEEN = ".last_seen"
+
+class ArtifactQuotaError(Exception):
+    pass
+
+# A handle to a text artifact: cheap to keep in session state, and enough
+# to show sizes without reading the file.
+# ``sha256`` identifies the content, e.g. for caches built over the text.
+TextArtifact = namedtuple("TextArtifact", ["path", "chars", "size", "sha256"])
+
+@contextmanager
+def mapped(path):
+    """Read-only memory map of ``path`` (``b""`` for an empty file)."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b""
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            yield m
+
+def _file_size(path):
+    try:
+        return os.path.getsize(path)
+    except FileNotFoundError:
+        return 0
+
+# ---------------------------
+# SESSION ARTIFACT STORE
+# ---------------------------
+class ArtifactStore:
+    """Large per-session text and audio kept on disk, one directory per session.
+
+    Session state holds only handles (``TextArtifact`` or an audio path).
+    Every write is checked against a per-session and a global quota and
+    raises ``ArtifactQuotaError`` when either would be exceeded. Usage is
+    kept as running totals: the directory is walked once, at start-up,
+    then text artifacts count when written, files produced in place (audio)
+    when passed to ``check_quota()``, and both stop counting when deleted
+    or reaped; scratch directories don't count. Sessions are kept alive by
+    ``touch()``; ``reap()`` deletes the directories of sessions idle for
+    longer than ``ttl_seconds``, and ``start_reaper()`` runs it
+    periodically on a daemon thread. One instance is shared by all
+    sessions through ``st.cache_resource``.
+    """
+
+    def __init__(self, directory=ARTIFACT_DIR, session_quota=SESSION_QUOTA_MB * 1024 * 1024,
+                 global_quota=GLOBAL_QUOTA_MB * 1024 * 1024, ttl_seconds=SESSION_TTL_SECONDS):
+        self.directory = directory
+        self.session_quota = session_quota
+        self.global_quota = global_quota
+        self.ttl_seconds = ttl_seconds
+        # Reentrant: _check_quota() reaps while holding it.
+        self._lock = threading.RLock()
+        self._reaper = None
+        os.makedirs(directory, exist_ok=True)
+        # Accounted file -> size, and the running totals over them.
+        self._sizes = {}
+        self._session_totals = {}
+        self._total = 0
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name != LAST_SEEN:
+                    self._account(os.path.join(root, name))
+
+    def session_dir(self, session_id):
+        path = os.path.join(self.directory, session_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def touch(self, session_id):
+        marker = os.path.join(self.session_dir(session_id), LAST_SEEN)
+        with open(marker, "a"):
+            os.utime(marker)
+
+    # -- quotas -------------------------------------------------------
+    def _session_of(self, path):
+        return os.path.relpath(path, self.directory).split(os.sep, 1)[0]
+
+    def _add(self, path, size):
+        # Caller holds the lock (or is __init__).
+        change = size - self._sizes.pop(path, 0)
+        if size:
+            self._sizes[path] = size
+        session_id = self._session_of(path)
+        self._session_totals[session_id] = self._session_totals.get(session_id, 0) + change
+        self._total += change
+
+    def _account(self, path):
+        self._add(os.path.abspath(path), _file_size(path))
+
+    def _forget(self, path):
+        """Stop counting ``path``, or everything under it if it is a directory."""
+        path = os.path.abspath(path)
+        for accounted in [p for p in self._sizes if p == path or p.startswith(path + os.sep)]:
+            self._add(accounted, 0)
+
+    def session_bytes(self, session_id):
+        with self._lock:
+            return self._session_totals.get(session_id, 0)
+
+    def total_bytes(self):
+        with self._lock:
+            return self._total
+
+    def _check_quota(self, session_id, extra=0):
+        if self.session_bytes(session_id) + extra > self.session_quota:
+            raise ArtifactQuotaError(
+                f"This session's storage quota ({self.session_quota // (1024 * 1024)} MB) is full. "
+                "Start over with a smaller document or clear the current one."
+            )
+        if self.total_bytes() + extra > self.global_quota:
+            self.reap()
+            if self.total_bytes() + extra > self.global_quota:
+                raise ArtifactQuotaError("Server storage is full; please try again later.")
+
+    def check_quota(self, session_id, path=None):
+        """Enforce quotas after a file was produced in place (e.g. audio).
+
+        If over quota, ``path`` is deleted before the error is raised.
+        """
+        with self._lock:
+            if path:
+                self._account(path)
+            try:
+                self._check_quota(session_id)
+            except ArtifactQuotaError:
+                if path:
+                    self.delete(path)
+                raise
+
+    # -- text ---------------------------------------------------------
+    def put_text(self, session_id, text, name="text"):
+        data = text.encode("utf-8")
+        with self._lock:
+            self._check_quota(session_id, len(data))
+            path = self.new_path(session_id, name, ".txt")
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            self._account(path)
+        return TextArtifact(path, len(text), len(data), hashlib.sha256(data).hexdigest())
+
+    def read_text(self, artifact):
+        if artifact is None:
+            return ""
+        with mapped(artifact.path) as data:
+            # Decoded straight from the mapped pages, without a bytes copy.
+            return str(data, "utf-8") if data else ""
+
+    # -- files --------------------------------------------------------
+    def new_path(self, session_id, name, suffix=""):
+        """Fresh path in the session directory; the caller creates the file."""
+        return os.path.join(self.session_dir(session_id), f"{name}-{uuid.uuid4().hex[:12]}{suffix}")
+
+    def temp_dir(self, session_id):
+        """Scratch directory that is reaped with the session if not removed."""
+        return tempfile.mkdtemp(dir=self.session_dir(session_id), prefix="tmp-")
+
+    def delete(self, artifact):
+        """Delete a text artifact, audio path or scratch directory; ``None`` is ignored."""
+        if artifact is None:
+            return
+        path = artifact.path if isinstance(artifact, TextArtifact) else artifact
+        if not os.path.abspath(path).startswith(os.path.abspath(self.directory) + os.sep):
+            return  # never delete anything the store didn't create
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._forget(path)
+
+    # -- reaping ------------------------------------------------------
+    def reap(self):
+        """Delete every session idle for longer than ``ttl_seconds``."""
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_dir():
+                continue
+            marker = os.path.join(entry.path, LAST_SEEN)
+            try:
+                last_seen = os.stat(marker).st_mtime
+            except FileNotFoundError:
+                last_seen = entry.stat().st_mtime
+            if last_seen < cutoff:
+                shutil.rmtree(entry.path, ignore_errors=True)
+                with self._lock:
+                    self._forget(entry.path)
+                    self._session_totals.pop(entry.name, None)
+                removed += 1
+        return removed
+
+    def start_reaper(self, interval=REAPER_INTERVAL_SECONDS):
+        if self._reaper is not None:
+            return
+
+        def loop():
+            while True:
+                try:
+                    self.reap()
+                except OSError:
+                    pass
+                time.sleep(interval)
+
+        self._reaper = threading.Thread(target=loop, name="artifact-reaper", daemon=True)
+        self._reaper.start()
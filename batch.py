@@ -0,0 +1,277 @@
+"""Headless batch converter: a directory of documents in, audiobooks out.
+
+    python batch.py books/ audiobooks/ --workers 8 --rewrite-concurrency 4
+
+Every PDF/DOCX/TXT under the input directory becomes ``<name>.mp3`` (or
+``<name>.ogg`` with ``--format opus``) and the narrated script ``<name>.txt``
+under the output directory, mirroring sub-directories; documents that
+differ only in extension (book.pdf, book.docx) are refused up front.
+Documents are processed in parallel worker processes; inside each worker
+the rewrite and TTS requests run concurrently as well.
+
+Progress is recorded in ``manifest.json`` in the output directory after
+every document, so an interrupted run picks up where it stopped: finished
+documents whose content hasn't changed are skipped, and documents that
+were cut off mid-way resume from their per-chunk checkpoints. Streamlit is not
+imported. GROQ_API_KEY must be set unless ``--no-rewrite`` is given.
+
+With ``--trace`` each document's stage timings are saved next to its
+audiobook as ``<name>.trace.json`` (open in chrome://tracing or Perfetto).
+Set METRICS_TEXTFILE (e.g. ``/var/lib/node_exporter/audiobook_{pid}.prom``)
+to export Prometheus metrics from every worker process.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import metrics
+from boilerplate import remove_boilerplate
+from cache import DiskCache
+from checkpoints import Checkpoint, checkpoint_key
+from encoding import AUDIO_OUTPUT_FORMAT, FORMATS, encode_audio
+from extraction import content_hash, extract_text_from_docx, extract_text_from_pdf
+from rewriter import REWRITE_CONCURRENCY, rewrite_text
+from tts import TTS_CONCURRENCY, format_gap_report, text_to_speech
+
+DOCUMENT_EXTENSIONS = (".pdf", ".docx", ".txt")
+MANIFEST_NAME = "manifest.json"
+
+# ---------------------------
+# MANIFEST
+# ---------------------------
+def load_manifest(path):
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"documents": {}}
+
+def save_manifest(path, manifest):
+    # Write-then-rename so a crash never leaves a truncated manifest.
+    temp_path = path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(temp_path, path)
+
+def find_documents(input_dir):
+    documents = []
+    for root, _, files in os.walk(input_dir):
+        for name in files:
+            if name.lower().endswith(DOCUMENT_EXTENSIONS):
+                documents.append(os.path.relpath(os.path.join(root, name), input_dir))
+    return sorted(documents)
+
+def output_collisions(documents):
+    """Groups of documents that would write the same ``<name>.mp3`` (book.pdf and book.docx).
+
+    Compared case-insensitively, as output directories may be.
+    """
+    by_output = {}
+    for document in documents:
+        by_output.setdefault(os.path.splitext(document)[0].lower(), []).append(document)
+    return [group for group in by_output.values() if len(group) > 1]
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return content_hash(f.read())
+
+# ---------------------------
+# WORKER
+# ---------------------------
+_resources = {}
+
+def _resource(name, factory):
+    # One Groq client / cache handle per worker process.
+    if name not in _resources:
+        _resources[name] = factory()
+    return _resources[name]
+
+def _groq_client():
+    from groq import Groq
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        raise RuntimeError("GROQ_API_KEY is not set.")
+    # ratelimit.LIMITER does the retrying, so it sees every 429.
+    return Groq(api_key=api_key, max_retries=0)
+
+def extract_document(path):
+    lower = path.lower()
+    if lower.endswith(".pdf"):
+        # Documents already run in parallel; don't nest a page pool per worker.
+        return extract_text_from_pdf(path, max_workers=1)
+    if lower.endswith(".docx"):
+        return extract_text_from_docx(path)
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+def convert_document(source, output_base, options):
+    """Extract, rewrite and narrate one document. Runs in a worker process."""
+    trace = metrics.Trace(source) if options["trace"] else None
+    try:
+        with metrics.tracing(trace), metrics.span("document"):
+            return _convert_document(source, output_base, options)
+    finally:
+        if trace is not None:
+            trace.save(output_base + ".trace.json")
+        metrics.write_textfile()
+
+def _convert_document(source, output_base, options):
+    start = time.perf_counter()
+    text = extract_document(source)
+    boilerplate = {}
+    if options["strip_boilerplate"]:
+        text, boilerplate = remove_boilerplate(text)
+    script = text
+    if options["rewrite"]:
+        client = _resource("groq", _groq_client)
+        cache = _resource("rewrites", lambda: DiskCache("rewrites"))
+        rewrite_checkpoint = Checkpoint(checkpoint_key("rewrite", text), source=source)
+        script, errors = rewrite_text(
+            client, text, max_workers=options["rewrite_concurrency"], cache=cache, checkpoint=rewrite_checkpoint
+        )
+        if errors:
+            first = errors[min(errors)]
+            raise RuntimeError(f"{len(errors)} chunk(s) could not be rewritten (chunk {min(errors) + 1}: {first})")
+
+    with open(output_base + ".txt", "w", encoding="utf-8") as f:
+        f.write(script)
+
+    partial_path = output_base + ".mp3.part"
+    cache = _resource("audio", lambda: DiskCache("audio", max_bytes=1024 * 1024 * 1024))
+    tts_checkpoint = Checkpoint(checkpoint_key(
+        "tts", script, engine=options["engine"], voice=options["voice"], storyteller=options["storyteller"]
+    ), source=source)
+    path, gaps, total = text_to_speech(
+        script, partial_path, options["engine"], options["voice"], options["storyteller"],
+        cache=cache, max_workers=options["tts_concurrency"], checkpoint=tts_checkpoint
+    )
+    if gaps:
+        raise RuntimeError(format_gap_report(gaps, total))
+    if not path:
+        raise RuntimeError("No text to narrate.")
+    output_path = output_base + FORMATS[options["format"]].extension
+    if options["format"] == "original":
+        os.replace(partial_path, output_path)
+    else:
+        encode_audio(partial_path, output_path, options["format"])
+        os.remove(partial_path)
+    tts_checkpoint.discard()
+    if options["rewrite"]:
+        rewrite_checkpoint.discard()
+    return {
+        "status": "done",
+        "output": output_path,
+        "characters": len(text),
+        "boilerplate_chars_saved": boilerplate.get("chars_saved", 0),
+        "boilerplate_tokens_saved": boilerplate.get("tokens_saved", 0),
+        "chunks": total,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+# ---------------------------
+# DRIVER
+# ---------------------------
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Convert a directory of documents into audiobooks.")
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="documents processed in parallel (default: CPU count)")
+    parser.add_argument("--rewrite-concurrency", type=int, default=REWRITE_CONCURRENCY,
+                        help="Groq requests in flight per document")
+    parser.add_argument("--tts-concurrency", type=int, default=TTS_CONCURRENCY,
+                        help="TTS requests in flight per document")
+    parser.add_argument("--engine", choices=("gtts", "edge-tts"), default="gtts")
+    parser.add_argument("--voice", default=None,
+                        help="gTTS language (default en) or edge-tts voice (default en-US-AriaNeural)")
+    parser.add_argument("--no-rewrite", action="store_true", help="narrate the extracted text as-is")
+    parser.add_argument("--no-storyteller", action="store_true", help="disable gTTS storyteller pacing")
+    parser.add_argument("--keep-boilerplate", action="store_true",
+                        help="don't remove repeated headers, footers and duplicate paragraphs")
+    parser.add_argument("--format", choices=list(FORMATS), default=AUDIO_OUTPUT_FORMAT,
+                        help="output encoding; mp3 and opus are smaller and loudness-normalized (need ffmpeg)")
+    parser.add_argument("--retry-failed", action="store_true", help="also retry documents that failed last run")
+    parser.add_argument("--trace", action="store_true", help="write <name>.trace.json with per-stage spans")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.makedirs(args.output_dir, exist_ok=True)
+    manifest_path = os.path.join(args.output_dir, MANIFEST_NAME)
+    manifest = load_manifest(manifest_path)
+    entries = manifest["documents"]
+    # Only settings that change the output decide whether a finished
+    # document must be redone; concurrency does not.
+    output_options = {
+        "rewrite": not args.no_rewrite,
+        "engine": args.engine,
+        "voice": args.voice or ("en" if args.engine == "gtts" else "en-US-AriaNeural"),
+        "storyteller": not args.no_storyteller,
+        "strip_boilerplate": not args.keep_boilerplate,
+        "format": args.format,
+    }
+    options = dict(output_options, rewrite_concurrency=args.rewrite_concurrency, tts_concurrency=args.tts_concurrency,
+                   trace=args.trace)
+
+    documents = find_documents(args.input_dir)
+    collisions = output_collisions(documents)
+    if collisions:
+        for group in collisions:
+            print(f"Output name clash: {', '.join(group)} would write the same "
+                  f"{os.path.splitext(group[0])[0]}.* files; rename all but one.", file=sys.stderr)
+        return 2
+
+    jobs, skipped = [], 0
+    for document in documents:
+        source = os.path.join(args.input_dir, document)
+        output_base = os.path.join(args.output_dir, os.path.splitext(document)[0])
+        digest = file_hash(source)
+        entry = entries.get(document, {})
+        if entry.get("sha256") == digest and entry.get("options") == output_options:
+            if entry.get("status") == "done" and os.path.exists(entry.get("output", "")):
+                skipped += 1
+                continue
+            if entry.get("status") == "failed" and not args.retry_failed:
+                skipped += 1
+                continue
+        os.makedirs(os.path.dirname(output_base) or ".", exist_ok=True)
+        entries[document] = {"status": "pending", "sha256": digest, "options": output_options}
+        jobs.append((document, source, output_base))
+    save_manifest(manifest_path, manifest)
+
+    print(f"{len(jobs)} document(s) to convert, {skipped} already handled (see {manifest_path}).")
+    failed = 0
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool:
+        futures = {
+            pool.submit(convert_document, source, output_base, options): document
+            for document, source, output_base in jobs
+        }
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                document = futures[future]
+                try:
+                    entries[document].update(future.result())
+                    entries[document].pop("error", None)
+                    status = f"done in {entries[document]['seconds']}s"
+                except Exception as e:
+                    entries[document].update(status="failed", error=str(e))
+                    failed += 1
+                    status = f"FAILED: {e}"
+                save_manifest(manifest_path, manifest)
+                print(f"[{done}/{len(jobs)}] {document}: {status}", flush=True)
+        except KeyboardInterrupt:
+            pool.shutdown(wait=False, cancel_futures=True)
+            print("Interrupted; re-run the same command to resume.", file=sys.stderr)
+            return 130
+
+    print(f"Finished {len(jobs) - failed}/{len(jobs)} in {time.perf_counter() - started:.1f}s.")
+    saved = sum(entries[document].get("boilerplate_tokens_saved", 0) for document, _, _ in jobs)
+    if saved:
+        print(f"Boilerplate removal saved ~{saved:,} tokens of rewrite and narration.")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Micro-benchmark for chunking.py against the chunkers it replaced.
+
+Run from the repository root:
+
+    python -m benchmarks.chunking [--mb 1 2 4 8]
+
+Reports throughput (MB/s) and how many rewrite / TTS requests each
+chunker would issue for the same text. Throughput should stay flat as the
+input grows; the legacy ``+=`` chunkers are included for comparison.
+"""
+import argparse
+import random
+import re
+import time
+
+from chunking import chunk_for_rewrite, chunk_for_tts
+
+WORDS = (
+    "the a storm ship captain harbour night wind old letter door house river light "
+    "quietly remembered across beneath suddenly whispered carried towards beyond"
+).split()
+
+def synthetic_text(size, seed=0):
+    rng = random.Random(seed)
+    paragraphs, total = [], 0
+    while total < size:
+        sentences = []
+        for _ in range(rng.randint(2, 8)):
+            words = [rng.choice(WORDS) for _ in range(rng.randint(5, 30))]
+            sentences.append(" ".join(words).capitalize() + rng.choice(".!?"))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+# ---------------------------
+# LEGACY CHUNKERS (for comparison)
+# ---------------------------
+def legacy_chunk_text_by_sentences(text, max_chunk_length=3000):
+    sentences = re.split(r'(?<=[.!?]) +', text.strip())
+    chunks, current_chunk = [], ""
+    for sentence in sentences:
+        if len(current_chunk) + len(sentence) < max_chunk_length:
+            current_chunk += " " + sentence
+        else:
+            chunks.append(current_chunk.strip())
+            current_chunk = sentence
+    if current_chunk:
+        chunks.append(current_chunk.strip())
+    return chunks
+
+def legacy_chunk_text_overlap(text, chunk_size=3000, overlap=200):
+    chunks = []; start = 0
+    while start < len(text):
+        end = start + chunk_size
+        chunks.append(text[start:end])
+        if end >= len(text): break
+        start = end - overlap
+    return chunks
+
+CHUNKERS = [
+    ("chunk_for_rewrite", chunk_for_rewrite),
+    ("chunk_for_tts(gtts)", lambda text: chunk_for_tts(text, "gtts")),
+    ("chunk_for_tts(edge-tts)", lambda text: chunk_for_tts(text, "edge-tts")),
+    ("legacy chunk_text_by_sentences", legacy_chunk_text_by_sentences),
+    ("legacy chunk_text (overlap)", legacy_chunk_text_overlap),
+]
+
+def run(sizes_mb, repeat=3):
+    print(f"{'chunker':32} {'MB':>5} {'best s':>8} {'MB/s':>8} {'chunks':>8} {'chars sent':>12}")
+    for mb in sizes_mb:
+        text = synthetic_text(int(mb * 1024 * 1024))
+        for name, chunker in CHUNKERS:
+            best = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                chunks = chunker(text)
+                best = min(best, time.perf_counter() - start)
+            sent = sum(len(chunk) for chunk in chunks)
+            print(f"{name:32} {mb:>5g} {best:>8.3f} {len(text) / 1e6 / best:>8.1f} {len(chunks):>8} {sent:>12}")
+        print()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=float, nargs="+", default=[1, 2, 4, 8], help="input sizes in MB")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.mb, args.repeat)
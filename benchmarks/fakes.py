@@ -0,0 +1,219 @@
+"""Local stand-ins for the Groq API and gTTS, for benchmarks and tests.
+
+``FakeGroqServer`` is a real HTTP server speaking the OpenAI-compatible
+chat completions protocol, so the actual ``groq.Groq`` client (timeouts,
+retries, JSON decoding) is exercised; point it at ``server.base_url``.
+``fake_gtts`` swaps ``tts.synthesize_gtts_chunk`` for a function that
+writes valid silent MP3 frames. Both take a latency (seconds, jittered
++/-50%) and a failure rate, drawn from a seeded RNG.
+"""
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import tts
+
+# ---------------------------
+# FAKE GROQ SERVER
+# ---------------------------
+class FakeGroqServer:
+    """Echoes the user message back as the completion after ``latency``.
+
+    ``stream=True`` requests get the echo word by word as server-sent
+    events, with usage on the last chunk under ``x_groq`` as Groq does.
+
+    A ``failure_rate`` fraction of requests get a 503, which is retried
+    like any transient server error. With ``requests_per_second`` set,
+    requests over that quota (per one-second window) get a 429 with a
+    Retry-After until the window ends, like Groq's rate limiter.
+    ``requests``, ``failures``, ``throttled`` and ``completion_tokens``
+    count what the server saw.
+    """
+
+    def __init__(self, latency=0.05, failure_rate=0.0, seed=0, requests_per_second=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.requests_per_second = requests_per_second
+        self.requests = 0
+        self.failures = 0
+        self.throttled = 0
+        self.completion_tokens = 0
+        self._window = (0, 0)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._httpd.server_port}"
+
+    def _over_quota(self):
+        """Seconds until the current window ends if this request is over quota, else ``None``."""
+        if not self.requests_per_second:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            window, used = self._window
+            if int(now) != window:
+                window, used = int(now), 0
+            self._window = (window, used + 1)
+            if used < self.requests_per_second:
+                return None
+            self.throttled += 1
+        return window + 1 - now
+
+    def _draw(self):
+        with self._lock:
+            self.requests += 1
+            delay = self.latency * (0.5 + self._rng.random())
+            failed = self._rng.random() < self.failure_rate
+            if failed:
+                self.failures += 1
+        return delay, failed
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, status, payload, headers=()):
+                body = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in headers:
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                wait = server._over_quota()
+                if wait is not None:
+                    self._reply(429, {"error": {"message": "fake rate limit", "type": "tokens"}},
+                                [("Retry-After", f"{wait:.3f}")])
+                    return
+                delay, failed = server._draw()
+                time.sleep(delay)
+                if failed:
+                    self._reply(503, {"error": {"message": "fake overload", "type": "server_error"}})
+                    return
+                content = request["messages"][-1]["content"]
+                prompt_tokens = sum(len(m["content"]) for m in request["messages"]) // 4
+                completion_tokens = len(content) // 4
+                with server._lock:
+                    server.completion_tokens += completion_tokens
+                usage = {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                }
+                if request.get("stream"):
+                    self._stream(request, content, usage)
+                    return
+                self._reply(200, {
+                    "id": "chatcmpl-fake",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": request.get("model", "fake"),
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": usage,
+                })
+
+            def _stream(self, request, content, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                self.close_connection = True
+                words = content.split(" ")
+                for i, word in enumerate(words):
+                    last = i == len(words) - 1
+                    chunk = {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion.chunk",
+                        "created": int(time.time()),
+                        "model": request.get("model", "fake"),
+                        "choices": [{
+                            "index": 0,
+                            "delta": {"content": word if last else word + " "},
+                            "finish_reason": "stop" if last else None,
+                        }],
+                    }
+                    if last:
+                        chunk["x_groq"] = {"id": "req-fake", "usage": usage}
+                    self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.write(b"data: [DONE]\n\n")
+
+        return Handler
+
+    def client(self, **kwargs):
+        from groq import Groq
+        return Groq(api_key="fake-key", base_url=self.base_url, **kwargs)
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+# ---------------------------
+# FAKE gTTS
+# ---------------------------
+# MPEG-2.5 Layer III, 8 kbps, 8 kHz, mono: 72-byte frames of 576 samples.
+# Real gTTS output (24 kHz) has about 3x as many frames per second; the
+# low rate keeps a 10 MB book's audio to a few hundred MB of temp files.
+SILENT_FRAME = b"\xff\xe3\x18\xc4" + b"\x00" * 68
+FRAME_SECONDS = 576 / 8000
+CHARS_PER_SECOND = 15  # roughly gTTS's slow=True speaking rate
+
+def silent_mp3(text):
+    seconds = max(1, len(text)) / CHARS_PER_SECOND
+    return SILENT_FRAME * max(1, round(seconds / FRAME_SECONDS))
+
+@contextmanager
+def fake_gtts(latency=0.03, failure_rate=0.0, seed=0):
+    """Replace gTTS for the duration of the block.
+
+    Yields a list that receives the service time of every call.
+    """
+    rng = random.Random(seed)
+    lock = threading.Lock()
+    latencies = []
+    original = tts.synthesize_gtts_chunk
+
+    def synthesize(chunk, path, language="en", storyteller=True):
+        start = time.perf_counter()
+        with lock:
+            delay = latency * (0.5 + rng.random())
+            failed = rng.random() < failure_rate
+        time.sleep(delay)
+        if failed:
+            raise ConnectionError("fake gTTS failure")
+        with open(path, "wb") as f:
+            f.write(silent_mp3(tts.storyteller_pacing(chunk) if storyteller else chunk))
+        with lock:
+            latencies.append(time.perf_counter() - start)
+        return path
+
+    tts.synthesize_gtts_chunk = synthesize
+    try:
+        yield latencies
+    finally:
+        tts.synthesize_gtts_chunk = original
@@ -0,0 +1,221 @@
+"""End-to-end pipeline benchmark against local Groq and TTS stand-ins.
+
+Run from the repository root (no network or API keys needed):
+
+    python -m benchmarks.pipeline [--sizes 10k 100k 1m 10m] [--check]
+
+For each synthetic document size it times the stages the app runs:
+DOCX extraction, boilerplate removal, rewrite chunking, rewrite (real Groq client against
+``benchmarks.fakes.FakeGroqServer``), TTS (clean + chunk + synthesize with
+``fake_gtts``) and the MP3 merge. It reports throughput and, for the
+per-request stages, latency percentiles.
+
+``--check`` compares the run with ``benchmarks/baseline.json`` and exits
+non-zero if any stage's throughput dropped, or p90 latency grew, by more
+than ``--tolerance``. ``--update-baseline`` stores the run as the new
+baseline. Keep the latency/failure settings the same as the baseline's
+(they are saved with it) or the comparison is meaningless.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import docx
+
+from benchmarks.chunking import synthetic_text
+from boilerplate import remove_boilerplate
+from benchmarks.fakes import FakeGroqServer, fake_gtts
+from chunking import chunk_for_rewrite, chunk_for_tts
+from extraction import extract_text_from_bytes
+from mp3 import concatenate_mp3
+from rewriter import rewrite_chunks
+from tts import clean_text_for_tts, synthesize_gtts_chunks
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+# Stages faster than this are mostly timer noise; their throughput isn't compared.
+MIN_COMPARE_SECONDS = 0.05
+SIZE_SUFFIXES = {"k": 1024, "m": 1024 * 1024}
+
+def parse_size(value):
+    value = value.lower()
+    if value[-1] in SIZE_SUFFIXES:
+        return int(float(value[:-1]) * SIZE_SUFFIXES[value[-1]])
+    return int(value)
+
+def percentile(values, q):
+    """Nearest-rank percentile; ``None`` for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(q / 100 * len(ordered)) - 1))]
+
+def build_docx(text):
+    document = docx.Document()
+    for paragraph in text.split("\n\n"):
+        document.add_paragraph(paragraph)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+class _TimedClient:
+    """Groq client proxy that records the latency of every completion call."""
+
+    def __init__(self, client):
+        self._create = client.chat.completions.create
+        self.latencies = []
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        start = time.perf_counter()
+        try:
+            return self._create(**kwargs)
+        finally:
+            self.latencies.append(time.perf_counter() - start)
+
+# ---------------------------
+# STAGES
+# ---------------------------
+def _stage(name, size, seconds, items, latencies=(), errors=0):
+    return {
+        "stage": name,
+        "bytes": size,
+        "seconds": seconds,
+        "mb_per_s": size / 1e6 / seconds if seconds else None,
+        "items": items,
+        "p50": percentile(latencies, 50),
+        "p90": percentile(latencies, 90),
+        "p99": percentile(latencies, 99),
+        "errors": errors,
+    }
+
+def run_document(size, server, args):
+    text = synthetic_text(size, seed=size)
+    data = build_docx(text)
+    results = []
+
+    start = time.perf_counter()
+    extracted = extract_text_from_bytes("bench.docx", data)
+    results.append(_stage("extract", len(data), time.perf_counter() - start, 1))
+
+    start = time.perf_counter()
+    deduped, _ = remove_boilerplate(extracted)
+    results.append(_stage("dedupe", len(extracted), time.perf_counter() - start, 1))
+    extracted = deduped
+
+    start = time.perf_counter()
+    chunks = chunk_for_rewrite(extracted)
+    results.append(_stage("chunk", len(extracted), time.perf_counter() - start, len(chunks)))
+
+    # Like the app: retries are left to ratelimit.LIMITER.
+    client = _TimedClient(server.client(max_retries=0))
+    start = time.perf_counter()
+    rewritten, errors = rewrite_chunks(client, chunks, max_workers=args.rewrite_concurrency)
+    results.append(_stage("rewrite", len(extracted), time.perf_counter() - start, len(chunks),
+                          client.latencies, len(errors)))
+    script = "".join(chunk + " " for chunk in rewritten if chunk is not None)
+
+    with tempfile.TemporaryDirectory() as temp_dir, \
+            fake_gtts(args.tts_latency, args.tts_failure_rate, seed=size) as latencies:
+        start = time.perf_counter()
+        tts_chunks = chunk_for_tts(clean_text_for_tts(script))
+        paths, gaps = synthesize_gtts_chunks(
+            tts_chunks, temp_dir, max_workers=args.tts_concurrency, retries=args.tts_retries
+        )
+        results.append(_stage("tts", len(script), time.perf_counter() - start, len(tts_chunks),
+                              latencies, len(gaps)))
+
+        audio = [path for path in paths if path]
+        audio_bytes = sum(os.path.getsize(path) for path in audio)
+        start = time.perf_counter()
+        concatenate_mp3(audio, os.path.join(temp_dir, "book.mp3"))
+        results.append(_stage("merge", audio_bytes, time.perf_counter() - start, len(audio)))
+    return results
+
+# ---------------------------
+# REPORTING / BASELINE
+# ---------------------------
+def _ms(value):
+    return f"{value * 1000:.0f}" if value is not None else "-"
+
+def print_report(report):
+    print(f"{'size':>8} {'stage':8} {'seconds':>8} {'MB/s':>8} {'items':>6} {'p50 ms':>7} {'p90 ms':>7} {'p99 ms':>7} {'errors':>6}")
+    for size, stages in report["runs"].items():
+        for stage in stages:
+            mb_per_s = f"{stage['mb_per_s']:.2f}" if stage["mb_per_s"] is not None else "-"
+            print(f"{size:>8} {stage['stage']:8} {stage['seconds']:>8.3f} {mb_per_s:>8} {stage['items']:>6} "
+                  f"{_ms(stage['p50']):>7} {_ms(stage['p90']):>7} {_ms(stage['p99']):>7} {stage['errors']:>6}")
+        print()
+
+def compare(report, baseline, tolerance):
+    """Return a list of regression messages (empty if none)."""
+    regressions = []
+    for size, stages in report["runs"].items():
+        previous = {stage["stage"]: stage for stage in baseline["runs"].get(size, [])}
+        for stage in stages:
+            before = previous.get(stage["stage"])
+            if not before:
+                continue
+            label = f"{size} {stage['stage']}"
+            if before["mb_per_s"] and before["seconds"] >= MIN_COMPARE_SECONDS and stage["mb_per_s"] is not None \
+                    and stage["mb_per_s"] < before["mb_per_s"] * (1 - tolerance):
+                regressions.append(f"{label}: {stage['mb_per_s']:.2f} MB/s, baseline {before['mb_per_s']:.2f} MB/s")
+            if before["p90"] and stage["p90"] is not None and stage["p90"] > before["p90"] * (1 + tolerance):
+                regressions.append(f"{label}: p90 {_ms(stage['p90'])} ms, baseline {_ms(before['p90'])} ms")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", default=["10k", "100k", "1m", "10m"],
+                        help="document sizes, e.g. 10k 1m (default: 10k 100k 1m 10m)")
+    parser.add_argument("--groq-latency", type=float, default=0.05, help="fake Groq latency in seconds")
+    parser.add_argument("--groq-failure-rate", type=float, default=0.0)
+    parser.add_argument("--tts-latency", type=float, default=0.03, help="fake TTS latency in seconds")
+    parser.add_argument("--tts-failure-rate", type=float, default=0.0)
+    parser.add_argument("--tts-retries", type=int, default=3)
+    parser.add_argument("--rewrite-concurrency", type=int, default=4)
+    parser.add_argument("--tts-concurrency", type=int, default=4)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--check", action="store_true", help="fail on regressions against the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.4, help="allowed relative regression (default 0.4)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    settings = {key: getattr(args, key) for key in (
+        "groq_latency", "groq_failure_rate", "tts_latency", "tts_failure_rate", "tts_retries",
+        "rewrite_concurrency", "tts_concurrency",
+    )}
+    report = {"settings": settings, "runs": {}}
+    with FakeGroqServer(args.groq_latency, args.groq_failure_rate) as server:
+        for size in args.sizes:
+            report["runs"][size] = run_document(parse_size(size), server, args)
+            print(f"{size}: done", file=sys.stderr, flush=True)
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}.")
+    if args.check:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["settings"] != settings:
+            print("Warning: settings differ from the baseline's; comparing anyway.", file=sys.stderr)
+        regressions = compare(report, baseline, args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
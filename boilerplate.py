@@ -0,0 +1,183 @@
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from heapq import nsmallest
+
+import metrics
+from chapters import PAGE_BREAK, is_heading
+from chunking import estimate_tokens
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+# Lines this close to the top or bottom of a page can be running headers,
+# footers or page numbers.
+EDGE_LINES = 2
+# ... and are dropped once the same (normalised) line was seen at the same
+# edge (top or bottom) of this share of the pages, and of no fewer pages than
+# MIN_REPEAT_PAGES. A fixed count would catch dialogue ("Yes," she said.)
+# that happens to end a few pages of a long book.
+MIN_REPEAT_SHARE = float(os.getenv("BOILERPLATE_MIN_REPEAT_SHARE", "0.1"))
+MIN_REPEAT_PAGES = int(os.getenv("BOILERPLATE_MIN_REPEAT_PAGES", "3"))
+# Numbers are ignored when comparing lines this short ("Page 12 of 300");
+# longer lines must repeat verbatim, or body text differing only in its
+# numbers would match. Chapter headings always compare verbatim, or
+# "Chapter 1", "Chapter 2"... would all be one repeated line.
+MASK_DIGITS_MAX_WORDS = 6
+
+# Paragraphs of fewer words are never treated as duplicates ("Yes.",
+# scene breaks, short dialogue).
+MIN_PARAGRAPH_WORDS = 12
+SHINGLE_WORDS = 5
+SKETCH_SIZE = 32
+# Estimated Jaccard similarity above which a paragraph is a near-duplicate
+# of an earlier one.
+NEAR_DUPLICATE_SIMILARITY = float(os.getenv("NEAR_DUPLICATE_SIMILARITY", "0.8"))
+
+DIGITS = re.compile(r"\d+")
+WORD = re.compile(r"\w+")
+# Keeps the separators so line, paragraph and page breaks survive the round
+# trip. Single line breaks count: DOCX extraction joins paragraphs with one
+# "\n" and PDF pages have no blank lines at all.
+BLOCK_SPLIT = re.compile(r"(\s*[\n\f]\s*)")
+
+def _normalize_line(line):
+    words = line.split()
+    normalized = " ".join(words).lower()
+    if len(words) > MASK_DIGITS_MAX_WORDS or is_heading(" ".join(words)):
+        return normalized
+    return DIGITS.sub("#", normalized)
+
+# ---------------------------
+# RUNNING HEADERS / FOOTERS
+# ---------------------------
+def _edge_keys(lines):
+    """``{index: {(edge, line hash), ...}}`` for the lines near the top and bottom of a page."""
+    filled = [i for i, line in enumerate(lines) if line.strip()]
+    keys = defaultdict(set)
+    for edge, indexes in (("top", filled[:EDGE_LINES]), ("bottom", filled[-EDGE_LINES:])):
+        for i in indexes:
+            keys[i].add((edge, hash(_normalize_line(lines[i]))))
+    return keys
+
+def remove_repeated_lines(text, min_pages=MIN_REPEAT_PAGES, min_share=MIN_REPEAT_SHARE):
+    """Drop header/footer lines that repeat across the pages of ``text``.
+
+    Pages are separated by ``chapters.PAGE_BREAK`` (PDF extraction). Lines
+    near a page's top or bottom are hashed after normalisation (case,
+    whitespace, and digits in short lines other than headings); a line
+    seen at the same edge of ``min_share`` of the pages (and at least
+    ``min_pages``) is kept at its first occurrence, so a chapter title that
+    doubles as a running header still opens its chapter, and removed
+    everywhere else.
+    Returns ``(text, lines_removed)``.
+    """
+    pages = text.split(PAGE_BREAK)
+    threshold = max(min_pages, math.ceil(len(pages) * min_share))
+    if len(pages) < threshold:
+        return text, 0
+    page_lines = [page.split("\n") for page in pages]
+    page_keys = [_edge_keys(lines) for lines in page_lines]
+    seen_on = Counter()
+    for keys in page_keys:
+        seen_on.update(set().union(*keys.values()))
+    repeated = {key for key, pages_seen in seen_on.items() if pages_seen >= threshold}
+    if not repeated:
+        return text, 0
+
+    kept_first, removed = set(), 0
+    for lines, keys in zip(page_lines, page_keys):
+        for i in sorted(keys, reverse=True):
+            line_keys = keys[i] & repeated
+            if not line_keys:
+                continue
+            if not line_keys <= kept_first:
+                kept_first.update(line_keys)
+                continue
+            del lines[i]
+            removed += 1
+    return PAGE_BREAK.join("\n".join(lines) for lines in page_lines), removed
+
+# ---------------------------
+# NEAR-DUPLICATE PARAGRAPHS
+# ---------------------------
+def sketch(paragraph, size=SKETCH_SIZE):
+    """Bottom-k MinHash sketch: the ``size`` smallest hashes of the word 5-gram shingles."""
+    words = WORD.findall(paragraph.lower())
+    shingles = {hash(tuple(words[i:i + SHINGLE_WORDS])) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    return frozenset(nsmallest(size, shingles))
+
+def similarity(a, b, size=SKETCH_SIZE):
+    """Jaccard similarity estimated from two bottom-k sketches."""
+    union = nsmallest(size, a | b)
+    return sum(1 for value in union if value in a and value in b) / len(union) if union else 0.0
+
+def remove_near_duplicates(text, threshold=NEAR_DUPLICATE_SIMILARITY):
+    """Drop paragraphs that nearly repeat an earlier one (repeated legal notices, banners...).
+
+    Paragraphs are blocks between line or page breaks. Each gets a
+    MinHash sketch; candidates are earlier paragraphs sharing a sketch
+    value (looked up in an inverted index), and only those are compared.
+    Returns ``(text, paragraphs_removed)``.
+    """
+    parts = BLOCK_SPLIT.split(text)
+    index = defaultdict(list)
+    sketches = []
+    removed = 0
+    # parts alternates block, separator, block, ...
+    for i in range(0, len(parts), 2):
+        block = parts[i]
+        if len(block.split()) < MIN_PARAGRAPH_WORDS:
+            continue
+        current = sketch(block)
+        shared = Counter(j for value in current for j in index[value])
+        # Similar sketches must share at least about threshold * size values;
+        # paragraphs under SKETCH_SIZE + 4 words have fewer shingles than that.
+        if any(count >= threshold * len(current) / 2 and similarity(current, sketches[j]) >= threshold
+               for j, count in shared.items()):
+            parts[i] = ""
+            removed += 1
+            continue
+        for value in current:
+            index[value].append(len(sketches))
+        sketches.append(current)
+    return "".join(parts), removed
+
+# ---------------------------
+# PIPELINE STAGE
+# ---------------------------
+def remove_boilerplate(text):
+    """Run both passes over freshly extracted ``text``, before chunking.
+
+    Returns ``(text, report)`` where ``report`` has ``lines_removed``,
+    ``paragraphs_removed``, ``chars_saved`` and ``tokens_saved`` (estimated
+    with ``chunking.estimate_tokens``).
+    """
+    with metrics.span("boilerplate", chars=len(text)) as record:
+        cleaned, lines_removed = remove_repeated_lines(text)
+        cleaned, paragraphs_removed = remove_near_duplicates(cleaned)
+        report = {
+            "lines_removed": lines_removed,
+            "paragraphs_removed": paragraphs_removed,
+            "chars_saved": len(text) - len(cleaned),
+            "tokens_saved": max(0, estimate_tokens(text) - estimate_tokens(cleaned)),
+        }
+        record.update(report)
+    metrics.count("boilerplate_chars_saved_total", report["chars_saved"],
+                  help="Characters removed before rewrite and TTS.")
+    return cleaned, report
+
+def remove_boilerplate_each(texts):
+    """``remove_boilerplate`` per document (pages never span files); reports are summed."""
+    results = [remove_boilerplate(text) for text in texts]
+    report = {key: 0 for key in ("lines_removed", "paragraphs_removed", "chars_saved", "tokens_saved")}
+    for _, single in results:
+        for key in report:
+            report[key] += single[key]
+    return [text for text, _ in results], report
+
+def format_boilerplate_report(report):
+    return (f"Removed {report['lines_removed']} repeated header/footer line(s) and "
+            f"{report['paragraphs_removed']} duplicate paragraph(s): {report['chars_saved']:,} characters "
+            f"(~{report['tokens_saved']:,} tokens) less to rewrite and narrate.")
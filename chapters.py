@@ -0,0 +1,220 @@
+import json
+import re
+import struct
+from collections import Counter
+
+from mp3 import concatenate_mp3, mp3_duration
+
+# ---------------------------
+# CHAPTER DETECTION
+# ---------------------------
+# Chapters shorter than this (excluding the heading) are folded into the
+# next one, e.g. a "PART ONE" page directly followed by "Chapter 1".
+MIN_CHAPTER_CHARS = 200
+MAX_HEADING_CHARS = 80
+
+PAGE_BREAK = "\f"
+
+# "Chapter", "Part" and "Book" need a designator after them ("Chapter 12",
+# "Part Two", "BOOK IV", "Chapter one"); the others stand alone. Keywords
+# must be capitalized, or every wrapped line starting "book that he..."
+# would open a chapter.
+SECTION_KEYWORDS = ("chapter", "part", "book")
+STANDALONE_KEYWORDS = ("prologue", "epilogue", "introduction", "preface", "foreword", "afterword", "appendix",
+                       "conclusion")
+NUMBER_WORDS = ("one", "two", "three", "four", "five", "six", "seven", "eight", "nine", "ten", "eleven", "twelve",
+                "thirteen", "fourteen", "fifteen", "sixteen", "seventeen", "eighteen", "nineteen", "twenty")
+
+def _capitalized(words):
+    return "|".join(f"{word.capitalize()}|{word.upper()}" for word in words)
+
+KEYWORD_HEADING = re.compile(
+    rf"^(?:(?:{_capitalized(SECTION_KEYWORDS)})\s+(?:\d{{1,3}}|{'|'.join(NUMBER_WORDS)}|[A-Z][\w'-]*)"
+    rf"|{_capitalized(STANDALONE_KEYWORDS)})\b"
+)
+NUMBERED_HEADING = re.compile(r"^\d{1,3}(\.\d{1,3})*\.?\s+[A-Z]")
+# Words a title-case heading leaves in lower case.
+MINOR_WORDS = {"a", "an", "and", "as", "at", "but", "by", "for", "from", "in", "into", "of", "on", "or", "the", "to",
+               "with"}
+TITLE_SEPARATORS = ":.-\u2013\u2014"
+
+def _starts_upper(word):
+    first = next((c for c in word if c.isalnum()), "")
+    return not first or first.isupper() or first.isdigit()
+
+def _title_shaped(rest):
+    """Whether ``rest``, what follows "Chapter 3", reads as a title rather than a sentence.
+
+    After a separator ("Chapter 3: The long road") only the first word must
+    be capitalized; otherwise the words must be title case. A trailing minor
+    word ("Part Two: Of Mice and") means a line that wraps.
+    """
+    separated = rest[:1] in TITLE_SEPARATORS
+    words = rest.lstrip(" " + TITLE_SEPARATORS).split()
+    if not words:
+        return True
+    if len(words) > 1 and words[-1].lower() in MINOR_WORDS:
+        return False
+    if separated:
+        return _starts_upper(words[0])
+    return all(_starts_upper(word) or word.lower() in MINOR_WORDS for word in words)
+
+def is_heading(line, known_headings=()):
+    """Whether the stripped ``line`` is a chapter heading on its own (see ``find_headings``)."""
+    if not line or len(line) > MAX_HEADING_CHARS or len(line.split()) > 10:
+        return False
+    if line in known_headings:
+        return True
+    keyword = KEYWORD_HEADING.match(line)
+    if keyword:
+        return line[-1] not in ",;" and _title_shaped(line[keyword.end():].lstrip(" "))
+    if line[-1] in ".,;:!?":
+        return False
+    return bool(NUMBERED_HEADING.match(line))
+
+def _page_title_lines(text):
+    """First lines of PDF pages that look like titles (short, all caps).
+
+    Running headers also sit at the top of pages, so lines that start more
+    than two pages are ignored.
+    """
+    first_lines = []
+    for page in text.split(PAGE_BREAK)[1:]:
+        stripped = page.lstrip()
+        first_lines.append(stripped.split("\n", 1)[0].strip() if stripped else "")
+    counts = Counter(first_lines)
+    return {
+        line for line in first_lines
+        if line and counts[line] <= 2 and line.isupper() and len(line) <= MAX_HEADING_CHARS
+        and line[-1] not in ".,;:"
+    }
+
+def find_headings(text, known_headings=()):
+    """Return ``[(offset, title)]`` for every heading line in ``text``.
+
+    A line is a heading if it is one of ``known_headings`` (e.g. DOCX
+    paragraphs styled as headings), is a short title starting with a
+    capitalized chapter keyword ("Chapter 12", "PART TWO: THE RETURN",
+    "Prologue"), is a short numbered title ("3. The Storm", "2.1 Setup"),
+    or is an all-caps title at the top of a PDF page.
+    """
+    known = {heading.strip() for heading in known_headings if heading.strip()}
+    known |= _page_title_lines(text)
+    headings = []
+    for match in re.finditer(r"[^\n\f]+", text):
+        line = match.group().strip()
+        if is_heading(line, known):
+            headings.append((match.start(), line))
+    return headings
+
+def detect_chapters(text, known_headings=(), min_chars=MIN_CHAPTER_CHARS):
+    """Split ``text`` into ``[{"title", "text"}]`` chapters.
+
+    The chapter texts concatenate back to ``text`` exactly; each chapter
+    starts with its heading line so the heading is narrated too. Text
+    before the first heading becomes an "Opening" chapter.
+    """
+    headings = find_headings(text, known_headings)
+    if not headings:
+        return [{"title": "Full Text", "text": text}] if text.strip() else []
+
+    chapters = []
+    if text[:headings[0][0]].strip():
+        chapters.append({"title": "Opening", "text": text[:headings[0][0]], "body": len(text[:headings[0][0]].strip())})
+    for k, (start, title) in enumerate(headings):
+        end = headings[k + 1][0] if k + 1 < len(headings) else len(text)
+        body = len(text[start:end].strip()) - len(title)
+        chapters.append({"title": title, "text": text[start:end], "body": body})
+
+    merged = []
+    carry = None
+    for chapter in chapters:
+        if carry:
+            chapter = {
+                "title": f"{carry['title']}: {chapter['title']}",
+                "text": carry["text"] + chapter["text"],
+                "body": carry["body"] + chapter["body"],
+            }
+            carry = None
+        if chapter["body"] < min_chars:
+            carry = chapter
+        else:
+            merged.append(chapter)
+    if carry:
+        if merged:
+            merged[-1]["text"] += carry["text"]
+            merged[-1]["body"] += carry["body"]
+        else:
+            merged.append(carry)
+    return [{"title": chapter["title"], "text": chapter["text"]} for chapter in merged]
+
+# ---------------------------
+# ID3v2.3 CHAPTER TAG
+# ---------------------------
+NO_OFFSET = 0xFFFFFFFF
+
+def _id3_frame(frame_id, data):
+    return frame_id.encode("ascii") + struct.pack(">IH", len(data), 0) + data
+
+def _text_frame(frame_id, text):
+    # Encoding 1 = UTF-16 with BOM, the only Unicode option ID3v2.3 has.
+    return _id3_frame(frame_id, b"\x01" + text.encode("utf-16") + b"\x00\x00")
+
+def _syncsafe(n):
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+def build_chapter_tag(titles, times_ms, book_title=None):
+    """ID3v2.3 tag with a CTOC table of contents and one CHAP frame per chapter.
+
+    ``times_ms`` holds ``(start, end)`` pairs. Byte offsets are left unset
+    (0xFFFFFFFF), which tells players to seek by time.
+    """
+    frames = b""
+    if book_title:
+        frames += _text_frame("TIT2", book_title)
+    element_ids = [f"chp{i}".encode("latin-1") for i in range(len(titles))]
+    if len(element_ids) <= 255:
+        toc = b"toc\x00" + bytes([0x03, len(element_ids)]) + b"".join(eid + b"\x00" for eid in element_ids)
+        frames += _id3_frame("CTOC", toc)
+    for eid, title, (start, end) in zip(element_ids, titles, times_ms):
+        chap = eid + b"\x00" + struct.pack(">IIII", start, end, NO_OFFSET, NO_OFFSET) + _text_frame("TIT2", title)
+        frames += _id3_frame("CHAP", chap)
+    return b"ID3\x03\x00\x00" + _syncsafe(len(frames)) + frames
+
+# ---------------------------
+# ASSEMBLY
+# ---------------------------
+def assemble_chapters(chapter_paths, titles, output_path, book_title=None):
+    """Concatenate per-chapter MP3s into one chapter-marked audiobook.
+
+    Returns the chapter index: ``[{"title", "start_ms", "end_ms",
+    "start_byte", "end_byte"}]``. Byte offsets point into ``output_path``
+    (start of each chapter's first audio frame). Swapping one chapter only
+    means regenerating its MP3 and calling this again; nothing else is
+    re-synthesized.
+    """
+    times_ms = []
+    position = 0
+    for path in chapter_paths:
+        duration = round(mp3_duration(path) * 1000)
+        times_ms.append((position, position + duration))
+        position += duration
+
+    tag = build_chapter_tag(titles, times_ms, book_title)
+    boundaries = []
+    concatenate_mp3(chapter_paths, output_path, prefix=tag, boundaries=boundaries)
+    with open(output_path, "rb") as f:
+        f.seek(0, 2)
+        end_of_file = f.tell()
+    ends = boundaries[1:] + [end_of_file]
+    return [
+        {"title": title, "start_ms": start, "end_ms": end, "start_byte": start_byte, "end_byte": end_byte}
+        for title, (start, end), start_byte, end_byte in zip(titles, times_ms, boundaries, ends)
+    ]
+
+def chapter_index_json(index):
+    return json.dumps({"chapters": index}, indent=2, ensure_ascii=False)
+
+def format_timestamp(ms):
+    seconds = ms // 1000
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
@@ -0,0 +1,120 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+import metrics
+from cache import CACHE_DIR, make_key
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+CHECKPOINT_DIR = os.getenv("CHECKPOINT_DIR") or os.path.join(CACHE_DIR, "jobs")
+# Job directories untouched for this long are assumed abandoned.
+CHECKPOINT_RETENTION_DAYS = float(os.getenv("CHECKPOINT_RETENTION_DAYS", "7"))
+
+def checkpoint_key(kind, text, **options):
+    """Job key: the same document with the same settings resumes the same job."""
+    return make_key("checkpoint", kind, text, options)
+
+# ---------------------------
+# PER-CHUNK CHECKPOINTS
+# ---------------------------
+class Checkpoint:
+    """Per-chunk results of one long job, one file per chunk in a job directory.
+
+    Has the same ``get``/``set``/``get_text``/``set_text`` interface as
+    ``cache.DiskCache`` and is keyed the same way (rewrite or audio cache
+    keys), but is never evicted while the job is unfinished. Every file is
+    written to a temporary name and renamed into place, so a crash or
+    restart leaves either a complete chunk or nothing: resuming the job
+    only redoes the chunks that were in flight. ``discard()`` once the
+    job's final output is safely stored.
+
+    Two sessions working on the same document share the job directory;
+    each instance holds a ``.lease`` file in it, and ``discard()`` only
+    removes the directory once no other lease is left. Checkpoints are an
+    optimisation, so a failed write is counted and otherwise ignored.
+    """
+
+    def __init__(self, job_key, directory=CHECKPOINT_DIR, **meta):
+        self.path = os.path.join(directory, job_key)
+        self._lease = os.path.join(self.path, f"{uuid.uuid4().hex}.lease")
+        self._write(self._lease, b"")
+        meta_path = os.path.join(self.path, "job.json")
+        if meta and not os.path.exists(meta_path):
+            self._write(meta_path, json.dumps(dict(meta, created=time.time())).encode("utf-8"))
+
+    def _file(self, key):
+        return os.path.join(self.path, f"{key}.chunk")
+
+    def _write(self, path, data):
+        temp_path = None
+        try:
+            # Recreated if a holder whose lease was missed removed it.
+            os.makedirs(self.path, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.path, suffix=".part")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+            temp_path = None
+        except OSError:
+            metrics.count("checkpoint_write_errors_total", help="Checkpoint files that could not be written.")
+        finally:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def get(self, key):
+        try:
+            with open(self._file(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def set(self, key, value):
+        self._write(self._file(key), value)
+
+    def get_text(self, key):
+        value = self.get(key)
+        return value.decode("utf-8") if value is not None else None
+
+    def set_text(self, key, text):
+        self.set(key, text.encode("utf-8"))
+
+    def __contains__(self, key):
+        return os.path.exists(self._file(key))
+
+    def completed(self):
+        """Number of chunks checkpointed so far."""
+        try:
+            return sum(1 for name in os.listdir(self.path) if name.endswith(".chunk"))
+        except FileNotFoundError:
+            return 0
+
+    def discard(self):
+        """Release this holder's lease; the directory goes with the last one."""
+        try:
+            os.remove(self._lease)
+            others = any(name.endswith(".lease") for name in os.listdir(self.path))
+        except FileNotFoundError:
+            others = False
+        if not others:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+def prune_checkpoints(directory=CHECKPOINT_DIR, max_age_days=CHECKPOINT_RETENTION_DAYS):
+    """Delete job directories with no new checkpoint for ``max_age_days``."""
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - max_age_days * 86400
+    removed = 0
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if os.path.isdir(path) and os.stat(path).st_mtime < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
@@ -0,0 +1,123 @@
+import os
+import re
+
+import metrics
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+# Rough English average for Llama-family tokenizers; good enough for
+# packing, and it errs towards smaller chunks on dense text.
+CHARS_PER_TOKEN = 4
+
+# The rewrite comes back at roughly the length of its input, so the input
+# budget is bounded by the completion's max_tokens (4096), not the model's
+# context window. Keep headroom for the storytelling expansion.
+REWRITE_TOKEN_BUDGET = int(os.getenv("REWRITE_TOKEN_BUDGET", "2400"))
+
+# Per-request character limits for the TTS engines.
+ENGINE_LIMITS = {
+    "gtts": 4000,
+    "edge-tts": 2500,
+}
+
+# Once a chunk is this full, a paragraph break is a good place to end it.
+PARAGRAPH_FLUSH_RATIO = 0.8
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n|\f")
+# A sentence ends at ., ! or ? (optionally followed by a closing quote or
+# bracket) and then whitespace, so "3.14" and "e.g.," stay intact.
+SENTENCE_BREAK = re.compile(r"[.!?][\"')\]]?(\s+)")
+
+def estimate_tokens(text):
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+# ---------------------------
+# CHUNKING ENGINE
+# ---------------------------
+def _sentences(paragraph):
+    start = 0
+    for match in SENTENCE_BREAK.finditer(paragraph):
+        sentence = paragraph[start:match.start(1)].strip()
+        if sentence:
+            yield sentence
+        start = match.end()
+    sentence = paragraph[start:].strip()
+    if sentence:
+        yield sentence
+
+def _split_oversized(sentence, max_size, measure):
+    """Split a single over-budget sentence on word boundaries."""
+    pieces, current, size = [], [], 0
+    for word in sentence.split():
+        word_size = measure(word) + 1
+        if current and size + word_size > max_size:
+            pieces.append(" ".join(current))
+            current, size = [], 0
+        while word_size > max_size:
+            # A single "word" longer than the budget (URLs, base64...).
+            cut = max(1, len(word) * max_size // word_size)
+            pieces.append(word[:cut])
+            word = word[cut:]
+            word_size = measure(word) + 1
+        current.append(word)
+        size += word_size
+    if current:
+        pieces.append(" ".join(current))
+    return pieces
+
+def chunk_text(text, max_size, measure=len):
+    """Pack ``text`` into chunks of at most ``max_size`` (by ``measure``).
+
+    Chunks end on sentence boundaries, preferring paragraph boundaries once
+    a chunk is mostly full; paragraphs inside a chunk stay separated by a
+    blank line. Only a sentence that alone exceeds the budget is split,
+    and then on word boundaries. Every sentence is measured once and the
+    output is built with a single join per chunk, so the cost is linear
+    in the length of ``text``. There is no overlap between chunks.
+    """
+    with metrics.span("chunk", chars=len(text), max_size=max_size) as record:
+        chunks = _chunk_text(text, max_size, measure)
+        record["chunks"] = len(chunks)
+    return chunks
+
+def _chunk_text(text, max_size, measure):
+    chunks = []
+    paragraphs, sentences, size = [], [], 0
+    # Cost of the separators flush() joins with.
+    space_size, break_size = measure(" "), measure("\n\n")
+
+    def flush():
+        nonlocal paragraphs, sentences, size
+        if sentences:
+            paragraphs.append(" ".join(sentences))
+        if paragraphs:
+            chunks.append("\n\n".join(paragraphs))
+        paragraphs, sentences, size = [], [], 0
+
+    for paragraph in PARAGRAPH_BREAK.split(text):
+        for sentence in _sentences(paragraph):
+            sentence_size = measure(sentence)
+            if sentence_size > max_size:
+                flush()
+                chunks.extend(_split_oversized(sentence, max_size, measure))
+                continue
+            gap = space_size if sentences else break_size if paragraphs else 0
+            if size + gap + sentence_size > max_size:
+                flush()
+                gap = 0
+            sentences.append(sentence)
+            size += gap + sentence_size
+        if sentences:
+            paragraphs.append(" ".join(sentences))
+            sentences = []
+        if size >= max_size * PARAGRAPH_FLUSH_RATIO:
+            flush()
+    flush()
+    return chunks
+
+def chunk_for_rewrite(text, max_tokens=REWRITE_TOKEN_BUDGET):
+    return chunk_text(text, max_tokens, estimate_tokens)
+
+def chunk_for_tts(text, engine="gtts"):
+    return chunk_text(text, ENGINE_LIMITS[engine])
@@ -0,0 +1,109 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from collections import namedtuple
+
+import metrics
+from mp3 import mp3_duration
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+FFMPEG = os.getenv("FFMPEG", "ffmpeg")
+# Default output format (a key of FORMATS); "original" ships the TTS MP3 as is.
+# gTTS produces 64 kbps mono MP3, so both re-encodes are a fraction of its size.
+AUDIO_OUTPUT_FORMAT = os.getenv("AUDIO_OUTPUT_FORMAT", "original")
+MP3_BITRATE = os.getenv("MP3_BITRATE", "32k")
+OPUS_BITRATE = os.getenv("OPUS_BITRATE", "24k")
+# EBU R128 loudness target; -16 LUFS is the usual level for spoken word.
+LOUDNESS_TARGET_LUFS = float(os.getenv("LOUDNESS_TARGET_LUFS", "-16"))
+TRUE_PEAK_DB = -1.5
+LOUDNESS_RANGE = 11
+
+OutputFormat = namedtuple("OutputFormat", ["label", "extension", "mime", "muxer", "sample_rate", "codec_args"])
+
+FORMATS = {
+    "original": OutputFormat("MP3 as synthesized", ".mp3", "audio/mpeg", None, None, None),
+    "mp3": OutputFormat(f"MP3, {MP3_BITRATE}bps, loudness-normalized", ".mp3", "audio/mpeg", "mp3", 24000,
+                        ["-c:a", "libmp3lame", "-b:a", MP3_BITRATE]),
+    # "voip" tunes Opus for speech and 60 ms frames suit it; complexity 5
+    # encodes about twice as fast as the default 10 at the same size.
+    "opus": OutputFormat(f"Opus, {OPUS_BITRATE}bps, loudness-normalized", ".ogg", "audio/ogg", "ogg", 24000,
+                         ["-c:a", "libopus", "-b:a", OPUS_BITRATE, "-application", "voip", "-frame_duration", "60",
+                          "-compression_level", "5"]),
+}
+
+class EncoderError(RuntimeError):
+    pass
+
+def encoder_available(ffmpeg=FFMPEG):
+    return shutil.which(ffmpeg) is not None
+
+def available_formats(ffmpeg=FFMPEG):
+    """Keys of ``FORMATS`` usable here; only ``"original"`` without ffmpeg."""
+    return list(FORMATS) if encoder_available(ffmpeg) else ["original"]
+
+def mime_type(path):
+    extension = os.path.splitext(path)[1].lower()
+    return next((fmt.mime for fmt in FORMATS.values() if fmt.extension == extension), "application/octet-stream")
+
+# ---------------------------
+# ENCODING
+# ---------------------------
+def encode_command(input_path, output_path, fmt, normalize=True, ffmpeg=FFMPEG):
+    command = [ffmpeg, "-hide_banner", "-nostdin", "-nostats", "-loglevel", "error", "-progress", "pipe:1", "-y",
+               "-i", input_path, "-vn", "-ac", "1"]
+    if normalize:
+        # Single-pass loudnorm adjusts gain continuously as it streams, so
+        # chunks synthesized at different levels come out even.
+        command += ["-af", f"loudnorm=I={LOUDNESS_TARGET_LUFS}:TP={TRUE_PEAK_DB}:LRA={LOUDNESS_RANGE}"]
+    return command + ["-ar", str(fmt.sample_rate)] + fmt.codec_args + ["-f", fmt.muxer, output_path]
+
+def encode_audio(input_path, output_path, format_key=AUDIO_OUTPUT_FORMAT, normalize=True, on_progress=None,
+                 ffmpeg=FFMPEG):
+    """Output stage: transcode the assembled MP3 ``input_path`` to ``output_path``.
+
+    ffmpeg streams the file from disk to disk, so memory use doesn't grow
+    with the length of the book; ID3 chapters are carried over. The output
+    appears atomically. ``on_progress(seconds_done, seconds_total)`` follows
+    ffmpeg's progress reports; an exception raised from it (a cancelled
+    job) stops ffmpeg. ``"original"`` just copies the file. Raises
+    ``EncoderError`` if ffmpeg is missing or fails. Returns ``output_path``.
+    """
+    fmt = FORMATS[format_key]
+    if fmt.codec_args is None:
+        shutil.copyfile(input_path, output_path)
+        return output_path
+    total = max(1, round(mp3_duration(input_path)))
+    partial_path = output_path + ".part"
+    command = encode_command(input_path, partial_path, fmt, normalize, ffmpeg)
+    with metrics.span("encode", bytes=os.path.getsize(input_path), format=format_key) as record, \
+            tempfile.TemporaryFile() as errors:
+        try:
+            process = subprocess.Popen(command, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=errors)
+        except FileNotFoundError:
+            raise EncoderError(f"{ffmpeg} not found; install ffmpeg or set FFMPEG to its path.") from None
+        try:
+            for line in process.stdout:
+                key, _, value = line.decode("ascii", errors="replace").strip().partition("=")
+                # out_time_us is "N/A" until the first packet is written.
+                if key == "out_time_us" and value.isdigit() and on_progress:
+                    on_progress(min(total, int(value) // 1_000_000), total)
+            returncode = process.wait()
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            if process.returncode != 0 and os.path.exists(partial_path):
+                os.remove(partial_path)
+        if returncode != 0:
+            errors.seek(0)
+            message = errors.read().decode("utf-8", errors="replace").strip().splitlines()[-3:]
+            raise EncoderError(f"ffmpeg exited with {returncode}: {' '.join(message)}")
+        os.replace(partial_path, output_path)
+        record["output_bytes"] = os.path.getsize(output_path)
+    if on_progress:
+        on_progress(total, total)
+    return output_path
@@ -0,0 +1,207 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import metrics
+from cache import make_key
+from chapters import PAGE_BREAK
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Below this many pages the process pool costs more than it saves.
+PDF_PARALLEL_MIN_PAGES = 8
+PDF_PAGES_PER_TASK = 4
+INGEST_CONCURRENCY = int(os.getenv("INGEST_CONCURRENCY", "4"))
+
+# pdfplumber and python-docx take ~100 ms to import between them, so they
+# are only loaded once a document of their type shows up.
+def _pdfplumber():
+    import pdfplumber
+    return pdfplumber
+
+def _docx():
+    import docx
+    return docx
+
+# ---------------------------
+# PAGE WORKERS
+# ---------------------------
+def _extract_pages(pdf, page_numbers):
+    results = []
+    for page_number in page_numbers:
+        start = time.perf_counter()
+        page = pdf.pages[page_number - 1]
+        text = page.extract_text() or ""
+        page.close()
+        results.append((page_number, text, time.perf_counter() - start))
+    return results
+
+def _extract_page_batch(path, page_numbers):
+    # Open and close the document per batch: a handle kept open in a worker
+    # would outlive the request and, on Windows, stop the temp file from
+    # being removed.
+    with _pdfplumber().open(path) as pdf:
+        return _extract_pages(pdf, page_numbers)
+
+_pool = None
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the Streamlit server is multi-threaded.
+        _pool = ProcessPoolExecutor(max_workers=max(1, PDF_WORKERS), mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+# ---------------------------
+# PDF EXTRACTION
+# ---------------------------
+def _as_path(file):
+    """Return ``(path, is_temporary)`` for a path or a file-like upload."""
+    if isinstance(file, (str, os.PathLike)):
+        return os.fspath(file), False
+    if hasattr(file, "seek"):
+        file.seek(0)
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        tmp.write(file.read())
+    return tmp.name, True
+
+def _record_page(timings, page_number, seconds, text):
+    metrics.REGISTRY.observe("pdf_page_seconds", seconds, help="Text extraction time per PDF page.")
+    if timings is not None:
+        timings.append((page_number, seconds, len(text)))
+
+def iter_pdf_pages(file, timings=None, max_workers=PDF_WORKERS):
+    """Yield ``(page_number, text)`` in page order, 1-based.
+
+    Large documents are split into small page batches and spread over a
+    shared process pool; pages are yielded as soon as every earlier page is
+    done, so callers can start chunking before the last page is parsed.
+    If ``timings`` is a list, ``(page_number, seconds, characters)`` is
+    appended for every page.
+    """
+    path, is_temporary = _as_path(file)
+    try:
+        with _pdfplumber().open(path) as pdf:
+            page_count = len(pdf.pages)
+            if page_count < PDF_PARALLEL_MIN_PAGES or max_workers <= 1:
+                for page_number, text, seconds in _extract_pages(pdf, range(1, page_count + 1)):
+                    _record_page(timings, page_number, seconds, text)
+                    yield page_number, text
+                return
+
+        pool = _get_pool()
+        batches = [range(start, min(start + PDF_PAGES_PER_TASK, page_count + 1))
+                   for start in range(1, page_count + 1, PDF_PAGES_PER_TASK)]
+        futures = [pool.submit(_extract_page_batch, path, batch) for batch in batches]
+        try:
+            # Futures are consumed in submission order, which is page order.
+            for future in futures:
+                for page_number, text, seconds in future.result():
+                    _record_page(timings, page_number, seconds, text)
+                    yield page_number, text
+        finally:
+            # Workers may still be reading the file; wait for them before it
+            # is removed below.
+            for future in futures:
+                future.cancel()
+            wait(futures)
+    finally:
+        if is_temporary:
+            os.remove(path)
+
+def extract_text_from_pdf(file, timings=None, max_workers=PDF_WORKERS):
+    # Pages are separated by a form feed so page boundaries survive for
+    # chapter detection; TTS cleaning treats it as ordinary whitespace.
+    return PAGE_BREAK.join(text for _, text in iter_pdf_pages(file, timings, max_workers))
+
+def format_page_timings(timings, top=5):
+    if not timings:
+        return "No pages extracted."
+    total = sum(seconds for _, seconds, _ in timings)
+    lines = [f"{len(timings)} page(s) in {total:.2f}s of page time ({total / len(timings) * 1000:.0f} ms/page average)."]
+    slowest = sorted(timings, key=lambda timing: timing[1], reverse=True)[:top]
+    for page_number, seconds, characters in slowest:
+        lines.append(f"- Page {page_number}: {seconds * 1000:.0f} ms, {characters} characters")
+    return "\n".join(lines)
+
+# ---------------------------
+# DOCX EXTRACTION
+# ---------------------------
+def extract_text_from_docx(file):
+    doc = _docx().Document(file)
+    return "\n".join([para.text for para in doc.paragraphs])
+
+def extract_docx_headings(file):
+    doc = _docx().Document(file)
+    return [
+        para.text.strip() for para in doc.paragraphs
+        if para.text.strip() and para.style is not None and para.style.name.startswith(("Heading", "Title"))
+    ]
+
+# ---------------------------
+# MULTI-FILE INGESTION
+# ---------------------------
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+def extract_text_from_bytes(name, data, timings=None):
+    with metrics.span("extract", bytes=len(data), format=os.path.splitext(name)[1].lower()) as record:
+        if name.endswith(".pdf"):
+            text = extract_text_from_pdf(io.BytesIO(data), timings)
+        elif name.endswith(".docx"):
+            text = extract_text_from_docx(io.BytesIO(data))
+        else:
+            text = data.decode("utf-8")
+        record["chars"] = len(text)
+    return text
+
+def ingest_files(files, cache=None, timings=None, headings=None, max_workers=INGEST_CONCURRENCY):
+    """Extract text from ``files``, a list of ``(name, bytes)`` pairs.
+
+    Returns the texts in the same order as ``files``. Files are keyed on a
+    hash of their content (plus extension), so with a ``cache`` anything
+    extracted before is reused and only new or changed files are parsed,
+    concurrently. ``timings`` (a dict) receives per-page PDF timings by
+    file name for the files that were actually parsed; ``headings`` (a
+    list) is extended with the heading paragraphs of every DOCX file.
+    """
+    keys = [make_key("extract-v2", os.path.splitext(name)[1].lower(), content_hash(data)) for name, data in files]
+    texts = [cache.get_text(key) if cache else None for key in keys]
+    pending = [i for i, text in enumerate(texts) if text is None]
+
+    def extract(i):
+        name, data = files[i]
+        file_timings = None
+        if timings is not None and name.endswith(".pdf"):
+            file_timings = timings.setdefault(name, [])
+        return extract_text_from_bytes(name, data, file_timings)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = [metrics.submit(pool, extract, i) for i in pending]
+        for i, future in zip(pending, futures):
+            texts[i] = text = future.result()
+            if cache:
+                cache.set_text(keys[i], text)
+
+    if headings is not None:
+        for name, data in files:
+            if name.endswith(".docx"):
+                headings.extend(cached_docx_headings(data, cache))
+    return texts
+
+def cached_docx_headings(data, cache=None):
+    key = make_key("docx-headings", content_hash(data))
+    cached = cache.get_text(key) if cache else None
+    if cached is not None:
+        return json.loads(cached)
+    found = extract_docx_headings(io.BytesIO(data))
+    if cache:
+        cache.set_text(key, json.dumps(found))
+    return found
@@ -0,0 +1,157 @@
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from html.parser import HTMLParser
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from cache import make_key
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+URL_CONCURRENCY = int(os.getenv("URL_CONCURRENCY", "8"))
+URL_CONNECT_TIMEOUT = float(os.getenv("URL_CONNECT_TIMEOUT", "5"))
+URL_READ_TIMEOUT = float(os.getenv("URL_READ_TIMEOUT", "20"))
+USER_AGENT = "Mozilla/5.0"
+
+META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+# ---------------------------
+# PARAGRAPH EXTRACTION
+# ---------------------------
+class _ParagraphParser(HTMLParser):
+    """Collect the text of <p> elements as the HTML streams past.
+
+    No tree is built: text outside paragraphs is dropped as soon as it is
+    seen, and script/style contents are skipped. A <p> opened inside
+    another one starts a new paragraph, as browsers do.
+    """
+
+    SKIP = {"script", "style", "noscript", "template"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.paragraphs = []
+        self._current = None
+        self._skip_depth = 0
+
+    def _close_paragraph(self):
+        if self._current is not None:
+            self.paragraphs.append("".join(self._current))
+            self._current = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skip_depth += 1
+        elif tag == "p":
+            self._close_paragraph()
+            self._current = []
+        elif tag == "br" and self._current is not None:
+            self._current.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag == "p":
+            self._close_paragraph()
+
+    def handle_data(self, data):
+        if self._current is not None and not self._skip_depth:
+            self._current.append(data)
+
+def _decode_html(content, header_encoding=None):
+    encoding = header_encoding
+    if not encoding:
+        match = META_CHARSET.search(content[:4096])
+        encoding = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return content.decode(encoding, errors="replace")
+    except LookupError:
+        return content.decode("utf-8", errors="replace")
+
+def extract_paragraphs(content, header_encoding=None):
+    """Text of every <p> in ``content`` (HTML bytes), one paragraph per line."""
+    parser = _ParagraphParser()
+    parser.feed(_decode_html(content, header_encoding))
+    parser.close()
+    parser._close_paragraph()
+    return "\n".join(parser.paragraphs)
+
+# ---------------------------
+# FETCHING
+# ---------------------------
+def make_session(pool_size=URL_CONCURRENCY):
+    """``requests.Session`` whose connection pool fits ``pool_size`` threads."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+def _charset(response):
+    # requests falls back to ISO-8859-1 for any text/* response without a
+    # charset; only trust an explicit one so <meta charset> gets a chance.
+    content_type = response.headers.get("Content-Type", "")
+    return response.encoding if "charset" in content_type.lower() else None
+
+def page_cache_key(url):
+    return make_key("page", url)
+
+def fetch_url_text(url, session=None, cache=None, timeout=(URL_CONNECT_TIMEOUT, URL_READ_TIMEOUT)):
+    """Fetch ``url`` and return its paragraph text.
+
+    With a ``cache`` (see ``cache.DiskCache``) the extracted text is stored
+    with the response's ETag/Last-Modified, and later fetches send a
+    conditional GET: a 304 reuses the stored text without downloading or
+    parsing the page again. Raises ``requests.RequestException`` on
+    network and HTTP errors.
+    """
+    session = session or make_session(1)
+    key = page_cache_key(url)
+    cached = cache.get(key) if cache is not None else None
+    cached = json.loads(cached) if cached is not None else None
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = session.get(url, headers=headers, timeout=timeout)
+    if response.status_code == 304 and cached:
+        return cached["text"]
+    response.raise_for_status()
+    text = extract_paragraphs(response.content, _charset(response))
+
+    etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+    if cache is not None and (etag or last_modified):
+        entry = {"etag": etag, "last_modified": last_modified, "text": text}
+        cache.set(key, json.dumps(entry).encode("utf-8"))
+    return text
+
+def fetch_urls(urls, session=None, cache=None, max_workers=URL_CONCURRENCY, on_progress=None):
+    """Fetch ``urls`` concurrently over one pooled session.
+
+    Returns ``(texts, errors)`` like ``rewriter.rewrite_chunks``: ``texts``
+    is in the order of ``urls`` with ``None`` for failures, ``errors``
+    maps the index of each failed URL to its exception.
+    ``on_progress(done, total)`` is called from the calling thread.
+    """
+    session = session or make_session(max_workers)
+    texts = [None] * len(urls)
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {pool.submit(fetch_url_text, url, session, cache): i for i, url in enumerate(urls)}
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                texts[i] = future.result()
+            except Exception as e:
+                errors[i] = e
+            if on_progress:
+                on_progress(done, len(urls))
+    return texts, errors
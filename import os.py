@@ -1,15 +1,18 @@
 import os
 import tempfile
 import streamlit as st
-import pdfplumber
-import docx
 import re
 from groq import Groq
-import asyncio
-import edge_tts
 import base64
 import requests
-from bs4 import BeautifulSoup
+import ratelimit
+from cache import DiskCache
+from chunking import chunk_for_rewrite, chunk_for_tts, estimate_tokens
+from extraction import content_hash, ingest_files
+from fetching import fetch_url_text, make_session
+from rewriter import rewrite_chunks
+from mp3 import concatenate_mp3
+from tts import format_gap_report, synthesize_edge_segments
 
 # ---------------------------
 # CONFIGURATION
@@ -58,7 +61,28 @@ except FileNotFoundError:
 # --- API CLIENT AND STATE MANAGEMENT ---
 groq_api_key = st.secrets.get("GROQ_API_KEY") or os.getenv("GROQ_API_KEY")
 if not groq_api_key: st.error("No Groq API key found! Please add it to secrets."); st.stop()
-client = Groq(api_key=groq_api_key)
+# Retries are left to ratelimit.LIMITER, which has to see every 429.
+client = Groq(api_key=groq_api_key, max_retries=0)
+
+@st.cache_resource
+def get_rewrite_cache():
+    return DiskCache("rewrites", max_bytes=int(os.getenv("REWRITE_CACHE_MB", "256")) * 1024 * 1024)
+
+@st.cache_resource
+def get_audio_cache():
+    return DiskCache("audio", max_bytes=int(os.getenv("AUDIO_CACHE_MB", "1024")) * 1024 * 1024)
+
+@st.cache_resource
+def get_extraction_cache():
+    return DiskCache("extractions", max_bytes=int(os.getenv("EXTRACTION_CACHE_MB", "256")) * 1024 * 1024)
+
+@st.cache_resource
+def get_page_cache():
+    return DiskCache("pages", max_bytes=int(os.getenv("PAGE_CACHE_MB", "64")) * 1024 * 1024)
+
+@st.cache_resource
+def get_url_session():
+    return make_session()
 
 if "original_text" not in st.session_state: st.session_state.original_text = ""
 if "rewritten_text" not in st.session_state: st.session_state.rewritten_text = ""
@@ -70,50 +94,23 @@ if "active_tab" not in st.session_state: st.session_state.active_tab = "Step 1:
 # --- CORE FUNCTIONS (unchanged) ---
 def extract_text_from_url(url):
     try:
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        paragraphs = soup.find_all('p')
-        if not paragraphs:
+        text = fetch_url_text(url, session=get_url_session(), cache=get_page_cache())
+        if not text:
             st.warning("Could not find any paragraph text on this page.")
-            return ""
-        text = "\n".join([p.get_text() for p in paragraphs])
         return text
     except requests.exceptions.RequestException as e:
         st.error(f"Error fetching URL: {e}")
         return ""
-def extract_text_from_pdf(file):
-    text = ""
-    with pdfplumber.open(file) as pdf:
-        for page in pdf.pages:
-            text += page.extract_text() or ""
-    return text
-def extract_text_from_docx(file):
-    doc = docx.Document(file)
-    return "\n".join([para.text for para in doc.paragraphs])
 def rewrite_with_groq(text, progress_placeholder):
-    chunks = chunk_text(text)
-    rewritten = ""
+    chunks = chunk_for_rewrite(text)
     progress_bar = progress_placeholder.progress(0, text="Initializing rewrite...")
-    for i, chunk in enumerate(chunks):
-        try:
-            response = client.chat.completions.create(model="llama-3.1-8b-instant", messages=[{"role": "system", "content": "You are an expert audiobook scriptwriter..."}, {"role": "user", "content": chunk}], temperature=0.7, max_tokens=4096)
-            rewritten_chunk = response.choices[0].message.content.strip()
-            rewritten += rewritten_chunk + " "
-            progress_bar.progress((i + 1) / len(chunks), text=f"Rewriting chunk {i+1}/{len(chunks)}...")
-        except Exception as e:
-            st.error(f"Error processing chunk {i+1}: {e}")
+    def update_progress(done, total):
+        progress_bar.progress(done / total, text=f"Rewriting chunk {done}/{total}...")
+    results, errors = rewrite_chunks(client, chunks, system_prompt="You are an expert audiobook scriptwriter...", on_progress=update_progress, cache=get_rewrite_cache())
+    for i, e in sorted(errors.items()):
+        st.error(f"Error processing chunk {i+1}: {e}")
     progress_bar.empty()
-    return rewritten
-def chunk_text(text, chunk_size=3000, overlap=200):
-    chunks = []; start = 0
-    while start < len(text):
-        end = start + chunk_size
-        chunks.append(text[start:end])
-        if end >= len(text): break
-        start = end - overlap
-    return chunks
+    return "".join(chunk + " " for chunk in results if chunk is not None)
 def clean_text_for_tts(text):
     cleaned = re.sub(r'(\\|)(.?)(\\*|)', r'\2', text)
     cleaned = re.sub(r'(\|_)(.?)(\*|_)', r'\2', cleaned)
@@ -122,18 +119,27 @@ def clean_text_for_tts(text):
     cleaned = re.sub(r'[#>`~=]', '', cleaned)
     cleaned = re.sub(r'\s+', ' ', cleaned).strip()
     return cleaned
-async def _convert_text_to_speech_edge(text, voice, output_file):
-    communicate = edge_tts.Communicate(text, voice)
-    await communicate.save(output_file)
 def convert_text_to_speech_edge_tts(text, voice):
     cleaned_text = clean_text_for_tts(text)
-    final_audio_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3").name
-    try:
-        asyncio.run(_convert_text_to_speech_edge(cleaned_text, voice, final_audio_path))
-        return final_audio_path
-    except Exception as e:
-        st.error(f"Error during audio generation: {e}")
+    segments = chunk_for_tts(cleaned_text, "edge-tts")
+    if not segments:
+        st.error("No text available to convert to audio.")
         return None
+    progress_bar = st.progress(0, text="Generating audio...")
+    def update_progress(done, total):
+        progress_bar.progress(done / total, text=f"Generating segment {done}/{total}...")
+    # The segments are only needed until they are joined into the final file.
+    with tempfile.TemporaryDirectory() as temp_dir:
+        paths, gaps = synthesize_edge_segments(segments, voice, temp_dir, on_progress=update_progress, cache=get_audio_cache())
+        progress_bar.empty()
+        if gaps:
+            st.warning(format_gap_report(gaps, len(segments)))
+        available = [path for path in paths if path]
+        if not available:
+            st.error("Error during audio generation: no segments could be synthesized.")
+            return None
+        final_audio_path = tempfile.NamedTemporaryFile(delete=False, suffix=".mp3").name
+        return concatenate_mp3(available, final_audio_path)
 
 # --- STREAMLIT UI ---
 st.title("AUDIO BOOK GENERATOR")
@@ -166,22 +172,16 @@ if st.session_state.active_tab == "Step 1: Upload":
         
         if uploaded_files:
             # --- MODIFIED: Logic to handle a list of files ---
-            uploaded_filenames = [f.name for f in uploaded_files]
-            if st.session_state.last_uploaded_files != uploaded_filenames:
+            uploaded_data = [(f.name, f.getvalue()) for f in uploaded_files]
+            uploaded_signature = [(name, content_hash(data)) for name, data in uploaded_data]
+            if st.session_state.last_uploaded_files != uploaded_signature:
                 # Reset state for new files
                 st.session_state.original_text, st.session_state.rewritten_text, st.session_state.audio_path, st.session_state.messages = "", "", None, []
-                st.session_state.last_uploaded_files = uploaded_filenames
+                st.session_state.last_uploaded_files = uploaded_signature
                 
-                all_text = ""
                 with st.spinner(f"Extracting text from {len(uploaded_files)} file(s)..."):
-                    for uploaded_file in uploaded_files:
-                        if uploaded_file.name.endswith(".pdf"):
-                            all_text += extract_text_from_pdf(uploaded_file) + "\n\n"
-                        elif uploaded_file.name.endswith(".docx"):
-                            all_text += extract_text_from_docx(uploaded_file) + "\n\n"
-                        else:
-                            all_text += uploaded_file.read().decode("utf-8") + "\n\n"
-                st.session_state.original_text = all_text
+                    texts = ingest_files(uploaded_data, cache=get_extraction_cache())
+                st.session_state.original_text = "".join(text + "\n\n" for text in texts)
 
             if st.session_state.original_text:
                 st.success(f"Successfully extracted {len(st.session_state.original_text)} characters from {len(uploaded_files)} file(s).")
@@ -251,7 +251,9 @@ elif st.session_state.active_tab == "Step 3: Generate & Chat":
                 st.session_state.messages.append({"role": "user", "content": prompt})
                 try:
                     with st.spinner("Thinking..."):
-                        chat_response = client.chat.completions.create(model="llama-3.1-8b-instant", messages=[{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": prompt}], temperature=0.7)
+                        chat_messages = [{"role": "system", "content": "You are a helpful assistant."}, {"role": "user", "content": prompt}]
+                        chat_response = ratelimit.LIMITER.call(lambda: client.chat.completions.create(model="llama-3.1-8b-instant", messages=chat_messages, temperature=0.7, max_tokens=1024),
+                                                               cost=sum(estimate_tokens(m["content"]) for m in chat_messages) + 1024)
                         response_content = chat_response.choices[0].message.content
                         st.session_state.messages.append({"role": "assistant", "content": response_content})
                 except Exception as e:
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+# Jobs are mostly waiting on Groq/TTS, and each one already fans out its own
+# requests, so this bounds how many documents are processed at once.
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+# Finished jobs are forgotten after this long if nobody collects them.
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    pass
+
+# ---------------------------
+# JOB RUNNER
+# ---------------------------
+class JobRunner:
+    """Run long rewrite/TTS jobs on a shared thread pool, tracked by job ID.
+
+    ``submit(kind, fn, *args, **kwargs)`` returns a job ID immediately and
+    calls ``fn(*args, on_progress=..., **kwargs)`` on a worker thread; the
+    ``on_progress(done, total)`` callback only updates the job record, so
+    ``fn`` must not touch Streamlit. ``get(job_id)`` returns a snapshot dict
+    (``id``, ``kind``, ``status``, ``done``, ``total``, ``result``,
+    ``error``, timestamps) and is cheap enough to poll on every rerun.
+    With ``trace_dir`` set every job's spans are saved there as
+    ``<job_id>.json`` (``trace_path`` in the snapshot).
+    One instance is shared by all sessions through ``st.cache_resource``.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, retention_seconds=JOB_RETENTION_SECONDS, trace_dir=metrics.TRACE_DIR):
+        self.retention_seconds = retention_seconds
+        self.trace_dir = trace_dir
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "kind": kind,
+            "status": QUEUED,
+            "done": 0,
+            "total": 0,
+            "result": None,
+            "error": None,
+            "submitted": time.time(),
+            "started": None,
+            "finished": None,
+            "cancel_requested": False,
+            "trace_path": None,
+        }
+        with self._lock:
+            self._prune()
+            self._jobs[job_id] = job
+        # The job runs in a copy of the submitter's context (rate-limit owner).
+        metrics.submit(self._pool, self._run, job, fn, args, kwargs)
+        return job_id
+
+    def _run(self, job, fn, args, kwargs):
+        with self._lock:
+            if job["cancel_requested"]:
+                job.update(status=CANCELLED, finished=time.time())
+                return
+            job.update(status=RUNNING, started=time.time())
+
+        def on_progress(done, total):
+            with self._lock:
+                job["done"], job["total"] = done, total
+                if job["cancel_requested"]:
+                    raise JobCancelled()
+
+        trace = metrics.Trace(f"{job['kind']} {job['id']}") if self.trace_dir else None
+        try:
+            with metrics.tracing(trace), metrics.span("job", kind=job["kind"]):
+                result = fn(*args, on_progress=on_progress, **kwargs)
+        except JobCancelled:
+            update = {"status": CANCELLED}
+        except Exception as e:
+            update = {"status": FAILED, "error": f"{type(e).__name__}: {e}"}
+        else:
+            update = {"status": DONE, "result": result}
+        if trace is not None:
+            update["trace_path"] = trace.save(os.path.join(self.trace_dir, f"{job['id']}.json"))
+        metrics.count("jobs_total", kind=job["kind"], status=update["status"], help="Finished background jobs.")
+        metrics.write_textfile()
+        with self._lock:
+            job.update(update, finished=time.time())
+
+    def get(self, job_id):
+        """Snapshot of the job, or ``None`` if the ID is unknown or expired."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def cancel(self, job_id):
+        """Ask a job to stop.
+
+        A queued job never starts; a running one is abandoned at its next
+        progress report (requests already in flight still complete).
+        """
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job["status"] not in FINISHED:
+                job["cancel_requested"] = True
+
+    def forget(self, job_id):
+        """Drop a finished job (and its result) once the caller has it."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job and job["status"] in FINISHED:
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+        return {status: statuses.count(status) for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job["status"] in FINISHED and job["finished"] < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
@@ -0,0 +1,222 @@
+import contextvars
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+# Prometheus textfile (node_exporter textfile collector). "{pid}" is
+# replaced by the process ID, for multi-process runs like batch.py.
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+# Per-job traces (Chrome trace event JSON) are written here when set.
+TRACE_DIR = os.getenv("TRACE_DIR")
+
+PREFIX = "audiobook"
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# ---------------------------
+# REGISTRY
+# ---------------------------
+class Registry:
+    """Thread-safe counters and histograms, rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._help = {}
+
+    def count(self, name, value=1, help="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("counter", help))
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, help="", **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._help.setdefault(name, ("histogram", help))
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(BUCKETS):
+                if value <= bound:
+                    histogram["buckets"][i] += 1
+            histogram["sum"] += value
+            histogram["count"] += 1
+
+    def value(self, name, **labels):
+        """Current counter value (for tests and the UI)."""
+        with self._lock:
+            return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def render(self):
+        def label_text(labels, extra=()):
+            items = list(labels) + list(extra)
+            if not items:
+                return ""
+            escaped = (
+                f'{k}="' + str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') + '"'
+                for k, v in items
+            )
+            return "{" + ",".join(escaped) + "}"
+
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: dict(value, buckets=list(value["buckets"])) for key, value in self._histograms.items()}
+            helps = dict(self._help)
+        lines = []
+        for name, (kind, help_text) in sorted(helps.items()):
+            full = f"{PREFIX}_{name}"
+            if help_text:
+                lines.append(f"# HELP {full} {help_text}")
+            lines.append(f"# TYPE {full} {kind}")
+            if kind == "counter":
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{full}{label_text(labels)} {value}")
+            else:
+                for (metric, labels), histogram in sorted(histograms.items()):
+                    if metric != name:
+                        continue
+                    for bound, count in zip(BUCKETS, histogram["buckets"]):
+                        lines.append(f"{full}_bucket{label_text(labels, [('le', bound)])} {count}")
+                    lines.append(f"{full}_bucket{label_text(labels, [('le', '+Inf')])} {histogram['count']}")
+                    lines.append(f"{full}_sum{label_text(labels)} {histogram['sum']}")
+                    lines.append(f"{full}_count{label_text(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+
+def count(name, value=1, help="", **labels):
+    REGISTRY.count(name, value, help, **labels)
+
+# ---------------------------
+# TRACES
+# ---------------------------
+class Trace:
+    """Spans of one job, exported as Chrome trace events (chrome://tracing, Perfetto)."""
+
+    def __init__(self, name):
+        self.name = name
+        self.origin = time.perf_counter()
+        self.events = []
+        self._lock = threading.Lock()
+
+    def add(self, name, start, duration, args):
+        event = {
+            "name": name,
+            "ph": "X",
+            "ts": round((start - self.origin) * 1e6),
+            "dur": round(duration * 1e6),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        }
+        with self._lock:
+            self.events.append(event)
+
+    def to_json(self):
+        with self._lock:
+            events = list(self.events)
+        return json.dumps({"traceEvents": events, "otherData": {"job": self.name}})
+
+    def save(self, path):
+        _atomic_write(path, self.to_json())
+        return path
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+@contextmanager
+def tracing(trace):
+    """Record spans of this thread (and pools it submits to) into ``trace``."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def submit(pool, fn, *args, **kwargs):
+    """``pool.submit`` that carries the current trace into the worker thread."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+# ---------------------------
+# SPANS
+# ---------------------------
+@contextmanager
+def span(stage, **attrs):
+    """Time a stage: one histogram observation and, if tracing, one trace span.
+
+    Yields a dict; numeric ``bytes``, ``chars`` and ``tokens_*`` entries
+    set on it (up front or inside the block) are also added to the
+    ``stage_bytes_total`` / ``stage_chars_total`` / ``groq_tokens_total``
+    counters. An exception counts towards ``errors_total``.
+    """
+    record = dict(attrs)
+    start = time.perf_counter()
+    try:
+        yield record
+    except BaseException as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        REGISTRY.count("errors_total", help="Stage failures.", stage=stage)
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        REGISTRY.observe("stage_seconds", duration, help="Time spent per stage call.", stage=stage)
+        if record.get("bytes"):
+            REGISTRY.count("stage_bytes_total", record["bytes"], help="Bytes processed per stage.", stage=stage)
+        if record.get("chars"):
+            REGISTRY.count("stage_chars_total", record["chars"], help="Characters processed per stage.", stage=stage)
+        for kind in ("prompt", "completion"):
+            if record.get(f"tokens_{kind}"):
+                REGISTRY.count("groq_tokens_total", record[f"tokens_{kind}"], help="Groq tokens used.", kind=kind)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(stage, start, duration, record)
+
+# ---------------------------
+# EXPORT
+# ---------------------------
+def _atomic_write(path, text):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(temp_path, path)
+
+def write_textfile(path=METRICS_TEXTFILE):
+    """Write the registry to ``path`` (no-op when unset)."""
+    if path:
+        _atomic_write(path.format(pid=os.getpid()), REGISTRY.render())
+
+def start_http_server(port=METRICS_PORT, host="0.0.0.0"):
+    """Serve ``/metrics`` on a daemon thread (no-op when ``port`` is 0)."""
+    if not port:
+        return None
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
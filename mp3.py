@@ -0,0 +1,290 @@
+import os
+import struct
+from collections import namedtuple
+
+import metrics
+
+# ---------------------------
+# MPEG AUDIO LAYER III TABLES
+# ---------------------------
+BLOCK_SIZE = 64 * 1024
+
+MPEG1, MPEG2, MPEG25 = 3, 2, 0  # header version bits
+BITRATES = {
+    MPEG1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    MPEG2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+BITRATES[MPEG25] = BITRATES[MPEG2]
+SAMPLE_RATES = {
+    MPEG1: [44100, 48000, 32000],
+    MPEG2: [22050, 24000, 16000],
+    MPEG25: [11025, 12000, 8000],
+}
+MONO = 3
+
+FrameHeader = namedtuple("FrameHeader", [
+    "version", "bitrate_index", "sample_rate_index", "bitrate", "sample_rate", "padding",
+    "channel_mode", "protected", "frame_length", "samples", "side_info", "raw",
+])
+
+def _frame_length(version, bitrate, sample_rate, padding):
+    coefficient = 144000 if version == MPEG1 else 72000
+    return coefficient * bitrate // sample_rate + padding
+
+def _side_info_length(version, channel_mode):
+    if version == MPEG1:
+        return 17 if channel_mode == MONO else 32
+    return 9 if channel_mode == MONO else 17
+
+def parse_header(data):
+    """Parse a 4-byte Layer III frame header, or return ``None``."""
+    if len(data) < 4 or data[0] != 0xFF or (data[1] & 0xE0) != 0xE0:
+        return None
+    version = (data[1] >> 3) & 3
+    layer = (data[1] >> 1) & 3
+    bitrate_index = data[2] >> 4
+    sample_rate_index = (data[2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    bitrate = BITRATES[version][bitrate_index]
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (data[2] >> 1) & 1
+    channel_mode = data[3] >> 6
+    return FrameHeader(
+        version=version,
+        bitrate_index=bitrate_index,
+        sample_rate_index=sample_rate_index,
+        bitrate=bitrate,
+        sample_rate=sample_rate,
+        padding=padding,
+        channel_mode=channel_mode,
+        protected=not (data[1] & 1),
+        frame_length=_frame_length(version, bitrate, sample_rate, padding),
+        samples=1152 if version == MPEG1 else 576,
+        side_info=_side_info_length(version, channel_mode),
+        raw=bytes(data[:4]),
+    )
+
+def _id3v2_length(head):
+    """Total length of the ID3v2 tag whose 10-byte header is ``head``."""
+    size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+    return 10 + size + (10 if head[5] & 0x10 else 0)
+
+def _is_info_frame(header, frame):
+    offset = 4 + header.side_info + (2 if header.protected else 0)
+    return frame[offset:offset + 4] in (b"Xing", b"Info") or frame[36:40] == b"VBRI"
+
+# ---------------------------
+# STREAMING FRAME READER
+# ---------------------------
+class _Reader:
+    def __init__(self, f, end, block_size):
+        self.f = f
+        self.remaining = end
+        self.block_size = block_size
+        self.buf = bytearray()
+        self.pos = 0
+
+    def peek(self, n):
+        while len(self.buf) - self.pos < n and self.remaining > 0:
+            if self.pos:
+                del self.buf[:self.pos]
+                self.pos = 0
+            chunk = self.f.read(min(self.block_size, self.remaining))
+            if not chunk:
+                self.remaining = 0
+                break
+            self.remaining -= len(chunk)
+            self.buf += chunk
+        return bytes(self.buf[self.pos:self.pos + n])
+
+    def skip(self, n):
+        self.pos += n
+        overrun = self.pos - len(self.buf)
+        if overrun > 0:
+            # Skipping past the buffer (e.g. an ID3v2 tag with cover art
+            # bigger than a block): drop the rest straight from the file.
+            self.buf.clear()
+            self.pos = 0
+            overrun = min(overrun, self.remaining)
+            self.f.seek(overrun, os.SEEK_CUR)
+            self.remaining -= overrun
+
+def iter_frames(path, block_size=BLOCK_SIZE):
+    """Yield ``(header, frame_bytes)`` for every audio frame in ``path``.
+
+    ID3v2 tags (anywhere in the stream), a trailing ID3v1 tag and
+    Xing/Info/VBRI header frames are dropped. After garbage the reader
+    resyncs on the next header whose successor is also a valid header, so
+    stray 0xFF bytes don't turn into bogus frames. Only ``block_size``
+    bytes plus one frame are buffered at a time.
+    """
+    with open(path, "rb") as f:
+        end = os.fstat(f.fileno()).st_size
+        if end >= 128:
+            f.seek(end - 128)
+            if f.read(3) == b"TAG":
+                end -= 128
+            f.seek(0)
+        reader = _Reader(f, end, block_size)
+        synced = False
+        while True:
+            head = reader.peek(10)
+            if len(head) < 4:
+                return
+            if head[:3] == b"ID3" and len(head) == 10:
+                reader.skip(_id3v2_length(head))
+                continue
+            header = parse_header(head)
+            if header is None:
+                reader.skip(1)
+                synced = False
+                continue
+            frame = reader.peek(header.frame_length + 4)
+            if len(frame) < header.frame_length:
+                return  # truncated final frame
+            if not synced and len(frame) == header.frame_length + 4:
+                following = frame[header.frame_length:]
+                if parse_header(following) is None and following[:3] not in (b"ID3", b"TAG"):
+                    reader.skip(1)
+                    continue
+            frame = frame[:header.frame_length]
+            reader.skip(header.frame_length)
+            synced = True
+            if not _is_info_frame(header, frame):
+                yield header, frame
+
+# ---------------------------
+# XING / INFO HEADER
+# ---------------------------
+XING_FLAGS = 0x0F  # frames, bytes, TOC, quality
+
+class _FrameIndex:
+    """Byte offsets of every ``stride``-th frame, at most ``limit`` entries.
+
+    When the table fills up every other entry is dropped and the stride
+    doubles, so memory stays bounded however long the book is while still
+    giving far more resolution than the 100-entry Xing TOC needs.
+    """
+
+    def __init__(self, limit=4096):
+        self.limit = limit
+        self.stride = 1
+        self.offsets = []
+
+    def add(self, index, offset):
+        if index % self.stride == 0:
+            self.offsets.append(offset)
+            if len(self.offsets) >= self.limit:
+                self.offsets = self.offsets[::2]
+                self.stride *= 2
+
+    def offset_of(self, index):
+        return self.offsets[min(index // self.stride, len(self.offsets) - 1)]
+
+def _info_frame_header(first):
+    needed = 4 + first.side_info + 4 + 4 + 4 + 4 + 100 + 4
+    for bitrate_index in range(1, 15):
+        bitrate = BITRATES[first.version][bitrate_index]
+        length = _frame_length(first.version, bitrate, first.sample_rate, 0)
+        if length >= needed:
+            raw = bytes([
+                0xFF,
+                0xE0 | (first.version << 3) | (1 << 1) | 1,
+                (bitrate_index << 4) | (first.sample_rate_index << 2),
+                first.raw[3] & 0xCF,
+            ])
+            return raw, length
+    raise ValueError("No bitrate can hold a Xing header at this sample rate.")
+
+def _build_info_frame(first, frames, total_bytes, index, vbr):
+    raw, length = _info_frame_header(first)
+    toc = bytes(
+        min(255, index.offset_of(int(frames * i / 100)) * 256 // total_bytes) if frames else 0
+        for i in range(100)
+    )
+    body = (
+        raw
+        + b"\x00" * first.side_info
+        + (b"Xing" if vbr else b"Info")
+        + struct.pack(">III", XING_FLAGS, frames, total_bytes)
+        + toc
+        + struct.pack(">I", 0)
+    )
+    return body + b"\x00" * (length - len(body))
+
+# ---------------------------
+# ASSEMBLY
+# ---------------------------
+def concatenate_mp3(paths, output_path, block_size=BLOCK_SIZE, prefix=b"", boundaries=None):
+    """Join MP3 files frame by frame into one stream with a single Xing header.
+
+    Per-file tags and Xing/Info frames are stripped, audio frames are
+    streamed through a bounded buffer, and a fresh Xing (VBR) or Info (CBR)
+    frame with exact frame/byte counts and a seek TOC is written at the
+    front. ``prefix`` (e.g. an ID3v2 tag) is written before it. If
+    ``boundaries`` is a list, the output byte offset at which each input's
+    audio starts is appended to it. Raises ``ValueError`` if the inputs mix
+    sample rates or MPEG versions, or contain no audio at all.
+    """
+    with metrics.span("merge", files=len(paths)) as record:
+        record["frames"], record["bytes"] = _concatenate(paths, output_path, block_size, prefix, boundaries)
+    return output_path
+
+def _concatenate(paths, output_path, block_size, prefix, boundaries):
+    first = None
+    frames = 0
+    audio_bytes = 0
+    info_length = 0
+    bitrates = set()
+    index = _FrameIndex()
+    with open(output_path, "wb") as out:
+        out.write(prefix)
+        for path in paths:
+            if boundaries is not None:
+                boundaries.append(len(prefix) + info_length + audio_bytes)
+            for header, frame in iter_frames(path, block_size):
+                if first is None:
+                    first = header
+                    info_length = _info_frame_header(first)[1]
+                    out.write(b"\x00" * info_length)
+                    if boundaries is not None:
+                        boundaries[:] = [offset + info_length for offset in boundaries]
+                elif (header.version, header.sample_rate) != (first.version, first.sample_rate):
+                    raise ValueError(
+                        f"{path}: {header.sample_rate} Hz audio cannot be joined to a {first.sample_rate} Hz stream."
+                    )
+                index.add(frames, info_length + audio_bytes)
+                out.write(frame)
+                frames += 1
+                audio_bytes += len(frame)
+                bitrates.add(header.bitrate)
+        if first is None:
+            raise ValueError("No MP3 audio frames found to concatenate.")
+        out.seek(len(prefix))
+        out.write(_build_info_frame(first, frames, info_length + audio_bytes, index, vbr=len(bitrates) > 1))
+    return frames, audio_bytes
+
+def mp3_duration(path):
+    """Exact duration in seconds, read from the Xing/Info header if present."""
+    total_samples = 0
+    with open(path, "rb") as f:
+        head = f.read(10)
+        if head[:3] == b"ID3" and len(head) == 10:
+            f.seek(_id3v2_length(head))
+        else:
+            f.seek(0)
+        head = f.read(4)
+        header = parse_header(head)
+        if header is not None:
+            frame = head + f.read(header.frame_length - 4)
+            offset = 4 + header.side_info + (2 if header.protected else 0)
+            if frame[offset:offset + 4] in (b"Xing", b"Info"):
+                flags, frame_count = struct.unpack(">II", frame[offset + 4:offset + 12])
+                if flags & 1:
+                    return frame_count * header.samples / header.sample_rate
+    sample_rate = None
+    for header, _ in iter_frames(path):
+        total_samples += header.samples
+        sample_rate = header.sample_rate
+    return total_samples / sample_rate if sample_rate else 0.0
@@ -0,0 +1,75 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import metrics
+from mp3 import concatenate_mp3
+from rewriter import REWRITE_CONCURRENCY, rewrite_chunk_cached
+from tts import TTS_CONCURRENCY
+
+# ---------------------------
+# STREAMING REWRITE -> TTS PIPELINE
+# ---------------------------
+def stream_audiobook(client, chunks, tts_chunker, synthesize, out_dir,
+                     rewrite_workers=REWRITE_CONCURRENCY, tts_workers=TTS_CONCURRENCY,
+                     rewrite_cache=None, **rewrite_options):
+    """Rewrite and narrate ``chunks`` with the two stages overlapping.
+
+    Each rewritten chunk is split with ``tts_chunker(text)`` and its pieces
+    are handed to ``synthesize(piece, path)`` as soon as the rewrite lands,
+    so chunk N is being narrated while chunk N+1 is still being rewritten.
+
+    Yields one dict per chunk, strictly in chunk order, as soon as that
+    section's audio is assembled:
+    ``{"index", "total", "text", "audio_path", "pieces", "gaps", "error"}``.
+    ``text``/``audio_path`` are ``None`` if the rewrite failed (``error`` is
+    set); ``gaps`` lists TTS pieces that failed within the section.
+    """
+    total = len(chunks)
+    rewrite_pool = ThreadPoolExecutor(max_workers=max(1, rewrite_workers))
+    tts_pool = ThreadPoolExecutor(max_workers=max(1, tts_workers))
+    try:
+        pending = {
+            metrics.submit(rewrite_pool, rewrite_chunk_cached, client, chunk, rewrite_cache, **rewrite_options): ("rewrite", i, None)
+            for i, chunk in enumerate(chunks)
+        }
+        sections = [{"index": i, "total": total, "text": None, "audio_path": None, "pieces": 0, "gaps": [], "error": None}
+                    for i in range(total)]
+        piece_texts = [None] * total
+        pieces = [None] * total
+        remaining = [None] * total
+        next_section = 0
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, i, j = pending.pop(future)
+                if stage == "rewrite":
+                    try:
+                        sections[i]["text"] = future.result()
+                    except Exception as e:
+                        sections[i]["error"] = str(e)
+                        remaining[i] = 0
+                        continue
+                    tts_chunks = piece_texts[i] = tts_chunker(sections[i]["text"])
+                    pieces[i] = [None] * len(tts_chunks)
+                    remaining[i] = sections[i]["pieces"] = len(tts_chunks)
+                    for j, piece in enumerate(tts_chunks):
+                        path = os.path.join(out_dir, f"section_{i}_{j}.mp3")
+                        pending[metrics.submit(tts_pool, synthesize, piece, path)] = ("tts", i, j)
+                else:
+                    try:
+                        pieces[i][j] = future.result()
+                    except Exception as e:
+                        sections[i]["gaps"].append({"index": j, "error": str(e), "text": piece_texts[i][j]})
+                    remaining[i] -= 1
+
+            while next_section < total and remaining[next_section] == 0:
+                section = sections[next_section]
+                audio = [path for path in pieces[next_section] or [] if path]
+                if audio:
+                    section["audio_path"] = concatenate_mp3(audio, os.path.join(out_dir, f"section_{next_section}.mp3"))
+                yield section
+                next_section += 1
+    finally:
+        rewrite_pool.shutdown(wait=False, cancel_futures=True)
+        tts_pool.shutdown(wait=False, cancel_futures=True)
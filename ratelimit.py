@@ -0,0 +1,261 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+
+import metrics
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+# Groq quotas depend on the account and model; 0 disables that bucket.
+# The limits are per process: batch.py workers each get their own share.
+GROQ_REQUESTS_PER_MINUTE = float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "0"))
+GROQ_TOKENS_PER_MINUTE = float(os.getenv("GROQ_TOKENS_PER_MINUTE", "0"))
+# Upper bound for the adaptive in-flight limit, shared by all sessions.
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "8"))
+GROQ_RETRIES = int(os.getenv("GROQ_RETRIES", "6"))
+MAX_BACKOFF_SECONDS = 60
+
+def backoff_delay(attempt, base_delay=1.0):
+    return min(MAX_BACKOFF_SECONDS, base_delay * 2 ** (attempt - 1)) * (0.5 + random.random())
+
+# ---------------------------
+# OWNERS
+# ---------------------------
+# Requests are scheduled round-robin between owners (one per Streamlit
+# session), so one large document can't starve everybody else. The owner
+# travels with the context: metrics.submit() and JobRunner carry it into
+# worker threads.
+_owner = contextvars.ContextVar("rate_limit_owner", default=None)
+
+def set_owner(owner):
+    _owner.set(owner)
+
+# ---------------------------
+# ERROR CLASSIFICATION
+# ---------------------------
+THROTTLED, TRANSIENT, FATAL = "throttled", "transient", "fatal"
+
+def classify(error):
+    """``THROTTLED`` for 429s, ``TRANSIENT`` for errors worth retrying, else ``FATAL``."""
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return THROTTLED
+    if status is not None:
+        return TRANSIENT if status >= 500 or status in (408, 409) else FATAL
+    # Connection errors and timeouts carry no status code.
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return TRANSIENT
+    if type(error).__name__ in ("APIConnectionError", "APITimeoutError"):
+        return TRANSIENT
+    return FATAL
+
+def retry_after(error):
+    """Seconds the server asked us to wait (``Retry-After``), or ``None``."""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+# ---------------------------
+# TOKEN BUCKET
+# ---------------------------
+class TokenBucket:
+    """``per_minute`` units refilling continuously, bursting to one minute's worth.
+
+    Not thread-safe; ``RateLimiter`` holds its lock around every call.
+    A ``per_minute`` of 0 means unlimited.
+    """
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        """Seconds until ``amount`` is available (0 if it is now)."""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        # A request bigger than the whole bucket waits for a full bucket.
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.level) / self.rate)
+
+    def take(self, amount):
+        if self.rate:
+            self.level -= amount  # may go negative when reconciling
+
+# ---------------------------
+# RATE LIMITER
+# ---------------------------
+class _Ticket:
+    __slots__ = ("cost", "granted")
+
+    def __init__(self, cost):
+        self.cost = cost
+        self.granted = False
+
+class RateLimiter:
+    """Process-wide scheduler for Groq requests.
+
+    Every call waits for a request token, its estimated tokens and a free
+    in-flight slot. Waiting calls are served round-robin by owner. The
+    in-flight limit adapts to the quota (AIMD): it halves on every 429 and
+    grows by one per ``limit`` successful calls, up to ``max_concurrency``.
+    A 429 also pauses *all* callers for its Retry-After. Token estimates
+    are corrected with the actual ``usage`` of each response.
+    """
+
+    def __init__(self, requests_per_minute=GROQ_REQUESTS_PER_MINUTE, tokens_per_minute=GROQ_TOKENS_PER_MINUTE,
+                 max_concurrency=GROQ_MAX_CONCURRENCY, retries=GROQ_RETRIES, base_delay=1.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_concurrency = max(1, max_concurrency)
+        self.limit = float(self.max_concurrency)
+        self.retries = retries
+        self.base_delay = base_delay
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.throttled = 0
+        self._queues = OrderedDict()
+        self._cond = threading.Condition()
+
+    # -- scheduling ---------------------------------------------------
+    def _dispatch(self):
+        """Grant queued tickets while capacity allows; return seconds to wait, or ``None``."""
+        while self._queues and self.in_flight < int(self.limit):
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            owner, queue = next(iter(self._queues.items()))
+            ticket = queue[0]
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(ticket.cost, now))
+            if wait > 0:
+                return wait
+            queue.popleft()
+            self.requests.take(1)
+            self.tokens.take(ticket.cost)
+            self.in_flight += 1
+            ticket.granted = True
+            # Round-robin: this owner goes to the back of the line.
+            del self._queues[owner]
+            if queue:
+                self._queues[owner] = queue
+            self._cond.notify_all()
+        return None
+
+    def acquire(self, cost=0, owner=None):
+        ticket = _Ticket(cost)
+        with self._cond:
+            self._queues.setdefault(owner, deque()).append(ticket)
+            while True:
+                wait = self._dispatch()
+                if ticket.granted:
+                    return ticket
+                self._cond.wait(timeout=wait)
+
+    def release(self, ticket, used=None, throttled=False, pause=None):
+        with self._cond:
+            self.in_flight -= 1
+            if used is not None:
+                self.tokens.take(used - ticket.cost)
+            if throttled:
+                self.throttled += 1
+                # Requests that were already in flight when the first 429
+                # came back don't shrink the limit again.
+                now = time.monotonic()
+                if now >= self.paused_until:
+                    self.limit = max(1.0, self.limit / 2)
+                if pause:
+                    self.paused_until = max(self.paused_until, now + pause)
+            elif used is not None:
+                self.limit = min(float(self.max_concurrency), self.limit + 1 / self.limit)
+            self._dispatch()
+            self._cond.notify_all()
+
+    # -- calls ----------------------------------------------------------
+    def call(self, fn, cost=0, owner=None):
+        """Run ``fn()`` (one API request) under the limiter, retrying as needed.
+
+        ``cost`` is the estimated token count of the request. 429s are
+        retried after their Retry-After (or a jittered backoff), transient
+        server and connection errors after a jittered backoff, both up to
+        ``retries`` attempts; anything else is raised at once. ``owner``
+        defaults to the one set with ``set_owner`` for this context.
+        """
+        owner = owner if owner is not None else _owner.get()
+        for attempt in range(1, self.retries + 1):
+            ticket = self.acquire(cost, owner)
+            try:
+                result = fn()
+            except Exception as e:
+                kind = classify(e)
+                delay = retry_after(e) if kind == THROTTLED else None
+                if delay is None:
+                    delay = backoff_delay(attempt, self.base_delay)
+                self.release(ticket, throttled=kind == THROTTLED, pause=delay if kind == THROTTLED else None)
+                if kind == FATAL or attempt == self.retries:
+                    raise
+                metrics.count("retries_total", stage="groq", help="Retried requests.")
+                if kind == THROTTLED:
+                    metrics.count("groq_throttled_total", help="Groq 429 responses.")
+                else:
+                    time.sleep(delay)
+                continue
+            except BaseException:
+                self.release(ticket)
+                raise
+            usage = getattr(result, "usage", None)
+            self.release(ticket, used=getattr(usage, "total_tokens", None) or cost)
+            return result
+
+    @contextmanager
+    def hold(self, cost=0, owner=None):
+        """Hold one request slot for the whole ``with`` block, e.g. while a reply streams.
+
+        Yields a dict; set ``"used"`` to the actual token count before the
+        block ends, or ``cost`` is charged. Nothing is retried, but a 429
+        raised inside still throttles everybody like in ``call``.
+        """
+        owner = owner if owner is not None else _owner.get()
+        ticket = self.acquire(cost, owner)
+        usage = {"used": None}
+        try:
+            yield usage
+        except Exception as e:
+            throttled = classify(e) == THROTTLED
+            self.release(ticket, throttled=throttled, pause=retry_after(e) if throttled else None)
+            raise
+        except BaseException:
+            self.release(ticket)
+            raise
+        self.release(ticket, used=usage["used"] or cost)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "in_flight": self.in_flight,
+                "waiting": sum(len(queue) for queue in self._queues.values()),
+                "throttled": self.throttled,
+            }
+
+LIMITER = RateLimiter()
@@ -0,0 +1,109 @@
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from heapq import nlargest
+
+import metrics
+from artifacts import mapped
+from textview import PageIndex
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+# ~300 tokens per passage: small enough that the top few fit in a short
+# prompt, big enough to hold a complete thought.
+PASSAGE_BYTES = int(os.getenv("PASSAGE_BYTES", "1200"))
+TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "4"))
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TOKEN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by for from had has have he her his i if in into is it its me my no not of on "
+    "or our she so that the their them then there these they this to was we were what when where which who "
+    "why will with would you your".split()
+)
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+# ---------------------------
+# BM25 INDEX
+# ---------------------------
+class PassageIndex:
+    """BM25 inverted index over the passages of a UTF-8 text file.
+
+    Passages are ``textview.PageIndex`` pages of about ``passage_bytes``,
+    so they end on line breaks and only their offsets are kept; passage
+    text is read back from the memory-mapped file when a hit is returned.
+    Any file with the same content will do, so an index cached by content
+    hash can serve every copy of a document. Postings map each term to
+    ``[(passage, term frequency)]``.
+    """
+
+    def __init__(self, path, passage_bytes=PASSAGE_BYTES):
+        self.pages = PageIndex(path, passage_bytes)
+        self.lengths = []
+        self.postings = defaultdict(list)
+        with metrics.span("index", bytes=self.pages.size, passages=len(self.pages)), mapped(path) as data:
+            for passage in range(len(self.pages)):
+                counts = Counter(tokenize(self._text(data, passage)))
+                self.lengths.append(sum(counts.values()))
+                for term, frequency in counts.items():
+                    self.postings[term].append((passage, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0.0
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def _text(self, data, passage):
+        start, end = self.pages.bounds(passage)
+        return bytes(data[start:end]).decode("utf-8", errors="ignore")
+
+    def search(self, query, k=TOP_K):
+        """Best ``k`` passages for ``query`` as ``[(score, passage)]``, best first."""
+        scores = defaultdict(float)
+        total = len(self.lengths)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (total - len(postings) + 0.5) / (len(postings) + 0.5))
+            for passage, frequency in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[passage] / self.average_length)
+                scores[passage] += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return nlargest(k, ((score, passage) for passage, score in scores.items()))
+
+    def passages(self, query, k=TOP_K, path=None):
+        """Text of the best ``k`` passages as ``[(passage, text)]``, in book order.
+
+        Passages are read from ``path`` (defaults to the indexed file).
+        """
+        hits = sorted(passage for _, passage in self.search(query, k))
+        with mapped(path or self.pages.path) as data:
+            return [(passage, self._text(data, passage).strip()) for passage in hits]
+
+# ---------------------------
+# GROUNDED PROMPTS
+# ---------------------------
+GROUNDED_SYSTEM_PROMPT = (
+    "You are a helpful assistant answering questions about a book the user uploaded. "
+    "Use the numbered passages from the book below. If they don't contain the answer, say so "
+    "rather than guessing, and mention which passages you relied on."
+)
+PLAIN_SYSTEM_PROMPT = "You are a helpful assistant."
+
+def build_chat_messages(question, passages=(), history=()):
+    """Chat request messages: system prompt with ``passages``, recent ``history``, then ``question``.
+
+    ``passages`` is ``[(passage, text)]`` as returned by
+    ``PassageIndex.passages``; ``history`` is a list of ``{"role",
+    "content"}`` messages from earlier turns.
+    """
+    if passages:
+        context = "\n\n".join(f"[Passage {passage + 1}]\n{text}" for passage, text in passages)
+        system = f"{GROUNDED_SYSTEM_PROMPT}\n\n{context}"
+    else:
+        system = PLAIN_SYSTEM_PROMPT
+    return [{"role": "system", "content": system}, *history, {"role": "user", "content": question}]
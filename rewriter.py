@@ -0,0 +1,154 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from cache import make_key
+from chunking import chunk_for_rewrite, chunk_text, estimate_tokens
+from ratelimit import LIMITER
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+DEFAULT_SYSTEM_PROMPT = "You are an expert audiobook scriptwriter. Rewrite the text in a storytelling tone."
+DEFAULT_TEMPERATURE = 0.7
+DEFAULT_MAX_TOKENS = 4096
+
+# Number of chat completions kept in flight at once.
+REWRITE_CONCURRENCY = int(os.getenv("REWRITE_CONCURRENCY", "4"))
+
+class RewriteTruncated(RuntimeError):
+    pass
+
+# ---------------------------
+# REWRITE ENGINE
+# ---------------------------
+def rewrite_chunk(client, chunk, model=DEFAULT_MODEL, system_prompt=DEFAULT_SYSTEM_PROMPT,
+                  temperature=DEFAULT_TEMPERATURE, max_tokens=DEFAULT_MAX_TOKENS, split_truncated=True):
+    """Rewrite one chunk.
+
+    A completion cut off at ``max_tokens`` is never returned: the chunk is
+    split in two and each half rewritten (once; a half that is cut off
+    again raises ``RewriteTruncated``, which callers report as a chunk
+    error).
+    """
+    # The rewrite comes back at about the length of its input.
+    cost = estimate_tokens(system_prompt) + min(max_tokens, 2 * estimate_tokens(chunk))
+    with metrics.span("rewrite_chunk", chars=len(chunk), model=model) as record:
+        response = LIMITER.call(lambda: client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": chunk}
+            ],
+            temperature=temperature,
+            max_tokens=max_tokens
+        ), cost)
+        usage = getattr(response, "usage", None)
+        if usage is not None:
+            record["tokens_prompt"] = usage.prompt_tokens
+            record["tokens_completion"] = usage.completion_tokens
+        choice = response.choices[0]
+        if getattr(choice, "finish_reason", None) != "length":
+            return choice.message.content.strip()
+        record["truncated"] = True
+    pieces = chunk_text(chunk, max(1, estimate_tokens(chunk) // 2), estimate_tokens) if split_truncated else []
+    if len(pieces) < 2:
+        raise RewriteTruncated(f"rewrite cut off at max_tokens={max_tokens} for a {len(chunk):,}-character chunk")
+    return " ".join(rewrite_chunk(client, piece, model, system_prompt, temperature, max_tokens, split_truncated=False)
+                    for piece in pieces)
+
+def rewrite_cache_key(chunk, model=DEFAULT_MODEL, system_prompt=DEFAULT_SYSTEM_PROMPT,
+                      temperature=DEFAULT_TEMPERATURE, max_tokens=DEFAULT_MAX_TOKENS):
+    return make_key("rewrite", model, system_prompt, temperature, max_tokens, chunk)
+
+def rewrite_chunk_cached(client, chunk, cache=None, **options):
+    key = rewrite_cache_key(chunk, **options) if cache else None
+    if cache:
+        cached = cache.get_text(key)
+        if cached is not None:
+            return cached
+    rewritten = rewrite_chunk(client, chunk, **options)
+    if cache:
+        cache.set_text(key, rewritten)
+    return rewritten
+
+def rewrite_chunks(client, chunks, max_workers=REWRITE_CONCURRENCY, on_progress=None, cache=None,
+                   checkpoint=None, **options):
+    """Rewrite ``chunks`` with up to ``max_workers`` requests in flight.
+
+    Returns ``(results, errors)``: ``results`` is in the original chunk order
+    with ``None`` for chunks that failed, and ``errors`` maps chunk index to
+    the exception raised. ``on_progress(done, total)`` is called from the
+    calling thread as chunks complete, so it is safe to update Streamlit
+    widgets from it. With a ``cache`` (see ``cache.DiskCache``) chunks
+    rewritten before with the same model settings skip the API entirely.
+    With a ``checkpoint`` (see ``checkpoints.Checkpoint``) every chunk is
+    persisted as soon as it lands, and chunks already checkpointed by an
+    earlier, interrupted run of the same job are not redone.
+    """
+    results = [None] * len(chunks)
+    errors = {}
+    if not chunks:
+        return results, errors
+
+    stores = [store for store in (checkpoint, cache) if store is not None]
+    keys = [rewrite_cache_key(chunk, **options) for chunk in chunks] if stores else None
+    pending = []
+    for i in range(len(chunks)):
+        for store in stores:
+            results[i] = store.get_text(keys[i])
+            if results[i] is not None:
+                # A shared-cache hit is pinned in the checkpoint too, so
+                # eviction can't cost this job the chunk later.
+                if checkpoint is not None and store is cache:
+                    checkpoint.set_text(keys[i], results[i])
+                break
+        else:
+            pending.append(i)
+
+    done = len(chunks) - len(pending)
+    if on_progress and done:
+        on_progress(done, len(chunks))
+
+    with metrics.span("rewrite", chunks=len(chunks), reused=done) as record, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {metrics.submit(pool, rewrite_chunk, client, chunks[i], **options): i for i in pending}
+
+        def collect(future):
+            i = futures.pop(future)
+            try:
+                results[i] = future.result()
+                for store in stores:
+                    store.set_text(keys[i], results[i])
+            except Exception as e:
+                errors[i] = e
+
+        try:
+            for future in as_completed(list(futures)):
+                collect(future)
+                done += 1
+                if on_progress:
+                    on_progress(done, len(chunks))
+        except BaseException:
+            # Cancelled from on_progress (or interrupted): drop the queued
+            # chunks, but keep what the requests already in flight return,
+            # since they are paid for.
+            pool.shutdown(wait=False, cancel_futures=True)
+            for future in list(futures):
+                if not future.cancelled():
+                    collect(future)
+            raise
+        record["failed"] = len(errors)
+    return results, errors
+
+def rewrite_text(client, text, max_workers=REWRITE_CONCURRENCY, on_progress=None, cache=None,
+                 checkpoint=None, **options):
+    """Chunk and rewrite a whole document.
+
+    Returns ``(rewritten_text, errors)`` where ``errors`` maps the index of
+    every chunk that could not be rewritten to its exception.
+    """
+    chunks = chunk_for_rewrite(text)
+    results, errors = rewrite_chunks(client, chunks, max_workers, on_progress, cache, checkpoint, **options)
+    return "".join(chunk + " " for chunk in results if chunk is not None), errors
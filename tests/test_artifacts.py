@@ -0,0 +1,95 @@
+import os
+import time
+
+import pytest
+
+from artifacts import LAST_SEEN, ArtifactQuotaError, ArtifactStore
+
+@pytest.fixture
+def store(tmp_path):
+    return ArtifactStore(str(tmp_path / "sessions"), session_quota=1000, global_quota=1500, ttl_seconds=60)
+
+def _audio(store, session_id, size):
+    path = store.new_path(session_id, "audiobook", ".mp3")
+    with open(path, "wb") as f:
+        f.write(b"\x00" * size)
+    return path
+
+def test_text_round_trip(store):
+    artifact = store.put_text("a", "Café au lait. " * 10, name="original")
+    assert store.read_text(artifact) == "Café au lait. " * 10
+    assert (artifact.chars, artifact.size) == (140, 150)
+    assert store.read_text(store.put_text("a", "", name="empty")) == ""
+    assert store.read_text(None) == ""
+
+def test_running_totals_follow_writes_and_deletes(store):
+    text = store.put_text("a", "x" * 300)
+    audio = _audio(store, "a", 200)
+    store.check_quota("a", audio)
+    store.put_text("b", "y" * 100)
+    assert (store.session_bytes("a"), store.session_bytes("b"), store.total_bytes()) == (500, 100, 600)
+    store.delete(text)
+    store.delete(audio)
+    assert (store.session_bytes("a"), store.total_bytes()) == (0, 100)
+    assert not os.path.exists(text.path) and not os.path.exists(audio)
+
+def test_totals_are_rebuilt_on_start(store):
+    store.put_text("a", "x" * 300)
+    reopened = ArtifactStore(store.directory, session_quota=1000, global_quota=1500)
+    assert (reopened.session_bytes("a"), reopened.total_bytes()) == (300, 300)
+
+def test_session_quota(store):
+    store.put_text("a", "x" * 900)
+    with pytest.raises(ArtifactQuotaError, match="session's storage quota"):
+        store.put_text("a", "x" * 200)
+    # Produced in place: deleted when it doesn't fit.
+    audio = _audio(store, "a", 200)
+    with pytest.raises(ArtifactQuotaError):
+        store.check_quota("a", audio)
+    assert not os.path.exists(audio)
+    assert store.session_bytes("a") == 900
+
+def test_global_quota_reaps_idle_sessions_first(store):
+    store.put_text("idle", "x" * 900)
+    store.touch("idle")
+    stale = time.time() - 3600
+    os.utime(os.path.join(store.session_dir("idle"), LAST_SEEN), (stale, stale))
+    store.put_text("busy", "y" * 900)
+    assert not os.path.exists(os.path.join(store.directory, "idle"))
+    assert store.total_bytes() == 900
+    store.touch("busy")
+    with pytest.raises(ArtifactQuotaError, match="Server storage is full"):
+        store.put_text("other", "z" * 700)
+
+def test_delete_only_touches_the_store(store, tmp_path):
+    outside = tmp_path / "keep.txt"
+    outside.write_text("user file")
+    store.delete(str(outside))
+    store.delete(None)
+    assert outside.exists()
+    scratch = store.temp_dir("a")
+    open(os.path.join(scratch, "section_0.mp3"), "wb").close()
+    store.delete(scratch)
+    assert not os.path.exists(scratch)
+
+def test_reap_removes_idle_sessions_only(store):
+    store.put_text("idle", "x" * 100)
+    store.put_text("active", "y" * 100)
+    for session_id in ("idle", "active"):
+        store.touch(session_id)
+    stale = time.time() - 3600
+    os.utime(os.path.join(store.session_dir("idle"), LAST_SEEN), (stale, stale))
+    assert store.reap() == 1
+    assert sorted(os.listdir(store.directory)) == ["active"]
+    assert (store.session_bytes("idle"), store.total_bytes()) == (0, 100)
+
+def test_quota_checks_do_not_walk_the_tree(store, monkeypatch):
+    store.put_text("a", "x" * 100)
+
+    def walk(*args, **kwargs):
+        raise AssertionError("the artifact tree was walked")
+
+    monkeypatch.setattr(os, "walk", walk)
+    store.put_text("a", "y" * 100)
+    store.check_quota("a", _audio(store, "a", 100))
+    assert store.total_bytes() == 300
@@ -0,0 +1,98 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import batch
+import tts
+from batch import main, output_collisions
+from cache import DiskCache
+from checkpoints import Checkpoint
+
+# MPEG-2 Layer III, 64 kbps, 24 kHz, mono: 192-byte frames of 24 ms.
+FRAME = b"\xff\xf3\x84\xc4" + b"\x00" * 188
+
+@pytest.fixture
+def converted(monkeypatch, tmp_path):
+    """Run conversions in threads against fake gTTS; returns the converted document paths."""
+    converted = []
+
+    def convert_document(source, output_base, options):
+        converted.append(os.path.relpath(source, tmp_path / "in"))
+        return convert(source, output_base, options)
+
+    def synthesize(chunk, path, language="en", storyteller=True):
+        with open(path, "wb") as f:
+            f.write(FRAME * 5)
+
+    convert = batch.convert_document
+    monkeypatch.setattr(batch, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(batch, "convert_document", convert_document)
+    monkeypatch.setattr(batch, "Checkpoint", lambda key, **meta: Checkpoint(key, str(tmp_path / "jobs"), **meta))
+    monkeypatch.setitem(batch._resources, "audio", DiskCache("audio", directory=str(tmp_path / "cache")))
+    monkeypatch.setattr(tts, "synthesize_gtts_chunk", synthesize)
+    (tmp_path / "in" / "sub").mkdir(parents=True)
+    (tmp_path / "in" / "book.txt").write_text("The ferry left at dawn.")
+    (tmp_path / "in" / "sub" / "notes.txt").write_text("The bridge fell in the flood.")
+    return converted
+
+def _run(tmp_path, *flags):
+    return main([str(tmp_path / "in"), str(tmp_path / "out"), "--no-rewrite", "--format", "original", *flags])
+
+def _manifest(tmp_path):
+    with open(tmp_path / "out" / "manifest.json", encoding="utf-8") as f:
+        return json.load(f)["documents"]
+
+def test_output_collisions():
+    documents = ["book.docx", "Book.pdf", "notes.txt", os.path.join("sub", "book.txt")]
+    assert output_collisions(documents) == [["book.docx", "Book.pdf"]]
+
+def test_clashing_documents_fail_before_any_work(tmp_path, capsys):
+    source = tmp_path / "in"
+    source.mkdir()
+    (source / "book.txt").write_text("One.")
+    (source / "book.docx").write_bytes(b"")
+    assert main([str(source), str(tmp_path / "out"), "--no-rewrite"]) == 2
+    assert "book.docx, book.txt" in capsys.readouterr().err
+    assert not os.path.exists(tmp_path / "out" / "book.mp3")
+
+def test_manifest_records_finished_documents(converted, tmp_path):
+    assert _run(tmp_path) == 0
+    entries = _manifest(tmp_path)
+    notes = os.path.join("sub", "notes.txt")
+    assert sorted(entries) == ["book.txt", notes] and sorted(converted) == ["book.txt", notes]
+    entry = entries[notes]
+    assert entry["status"] == "done" and entry["chunks"] == 1 and "error" not in entry
+    assert entry["output"] == str(tmp_path / "out" / "sub" / "notes.mp3") and os.path.getsize(entry["output"]) > 0
+    assert entry["sha256"] == batch.file_hash(str(tmp_path / "in" / notes))
+    assert entry["options"]["format"] == "original" and not entry["options"]["rewrite"]
+    assert (tmp_path / "out" / "sub" / "notes.txt").read_text() == "The bridge fell in the flood."
+    assert not os.listdir(tmp_path / "jobs")
+
+def test_resume_only_redoes_changed_or_missing_documents(converted, tmp_path, capsys):
+    assert _run(tmp_path) == 0
+    converted.clear()
+    assert _run(tmp_path) == 0
+    assert converted == [] and "0 document(s) to convert, 2 already handled" in capsys.readouterr().out
+
+    (tmp_path / "in" / "book.txt").write_text("The ferry left at noon.")
+    os.remove(tmp_path / "out" / "sub" / "notes.mp3")
+    assert _run(tmp_path) == 0
+    assert sorted(converted) == ["book.txt", os.path.join("sub", "notes.txt")]
+
+    # Settings that change the output redo everything; concurrency does not.
+    converted.clear()
+    assert _run(tmp_path, "--tts-concurrency", "2") == 0 and converted == []
+    assert _run(tmp_path, "--no-storyteller") == 0 and len(converted) == 2
+
+def test_failed_documents_are_only_retried_on_request(converted, tmp_path):
+    pytest.importorskip("docx")
+    (tmp_path / "in" / "broken.docx").write_bytes(b"not a docx")
+    assert _run(tmp_path) == 1
+    entries = _manifest(tmp_path)
+    assert entries["broken.docx"]["status"] == "failed" and entries["broken.docx"]["error"]
+    assert entries["book.txt"]["status"] == "done"
+    converted.clear()
+    assert _run(tmp_path) == 0 and converted == []
+    assert _run(tmp_path, "--retry-failed") == 1 and converted == ["broken.docx"]
@@ -0,0 +1,74 @@
+import random
+
+from boilerplate import remove_boilerplate, remove_near_duplicates, remove_repeated_lines
+from chapters import PAGE_BREAK, detect_chapters
+
+WORDS = "rain town river night lamp window road stone bridge market bell harbor lantern field".split()
+
+def _paragraph(rng, words=60):
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + "."
+
+def _book(pages=10):
+    rng = random.Random(1)
+    text = []
+    for n in range(pages):
+        heading = f"Chapter {n // 2 + 1}\n" if n % 2 == 0 else ""
+        text.append(f"THE BOOK TITLE\n{heading}{_paragraph(rng)}\n{_paragraph(rng)}\nPage {n + 1}")
+    return PAGE_BREAK.join(text)
+
+def test_running_headers_and_page_numbers_are_removed():
+    cleaned, removed = remove_repeated_lines(_book())
+    assert removed == 18
+    assert cleaned.count("THE BOOK TITLE") == 1
+    assert "Page 2" not in cleaned
+
+def test_numbered_chapter_headings_survive():
+    text = _book()
+    cleaned, _ = remove_boilerplate(text)
+    titles = [chapter["title"] for chapter in detect_chapters(cleaned)]
+    assert titles == [chapter["title"] for chapter in detect_chapters(text)]
+    assert all(f"Chapter {n}" in cleaned for n in range(1, 6))
+
+def test_near_duplicate_paragraphs_on_single_line_breaks():
+    # DOCX extraction separates paragraphs with a single newline.
+    rng = random.Random(2)
+    notice = "This copy is licensed to a single reader and may not be shared, resold or copied in any form."
+    text = "\n".join(f"{_paragraph(rng, 20)}\n{notice}" for _ in range(10))
+    cleaned, removed = remove_near_duplicates(text)
+    assert removed == 9
+    assert cleaned.count(notice) == 1
+
+def test_short_paragraphs_are_kept():
+    text = "Yes.\n\nYes.\n\nYes."
+    assert remove_near_duplicates(text) == (text, 0)
+
+def test_dialogue_repeated_on_a_few_pages_of_a_long_book_is_kept():
+    rng = random.Random(3)
+    pages = []
+    for n in range(300):
+        top = "again.\n" if n in (10, 120, 250) else ""
+        bottom = "\n\u201cYes,\u201d she said." if n in (40, 41, 200) else ""
+        pages.append(f"{top}{_paragraph(rng)}\n{_paragraph(rng)}{bottom}\nPage {n + 1}")
+    cleaned, removed = remove_repeated_lines(PAGE_BREAK.join(pages))
+    assert removed == 299
+    assert cleaned.count("again.") == 3
+    assert cleaned.count("\u201cYes,\u201d she said.") == 3
+
+def test_repeats_must_be_at_the_same_edge():
+    rng = random.Random(4)
+    pages = []
+    for n in range(10):
+        body = "\n".join(_paragraph(rng) for _ in range(3))
+        pages.append(f"Interlude\n{body}" if n % 2 else f"{body}\nInterlude")
+    cleaned, removed = remove_repeated_lines(PAGE_BREAK.join(pages), min_share=0.6)
+    assert removed == 0
+    assert cleaned.count("Interlude") == 10
+
+def test_short_near_duplicate_paragraphs_are_removed():
+    # 12 words make only 8 shingles, far fewer than a full sketch.
+    notice = "Printed and bound in a small town by the river for you."
+    rng = random.Random(5)
+    text = "\n".join(f"{_paragraph(rng, 20)}\n{notice}" for _ in range(5))
+    cleaned, removed = remove_near_duplicates(text)
+    assert removed == 4
+    assert cleaned.count(notice) == 1
@@ -0,0 +1,40 @@
+import time
+
+from cache import DiskCache, make_key
+
+def test_make_key_is_stable_and_distinguishes_parts():
+    assert make_key("rewrite", "model", 0.7, "text") == make_key("rewrite", "model", 0.7, "text")
+    assert make_key("rewrite", "model", 0.7, "text") != make_key("rewrite", "model", 0.8, "text")
+    assert make_key("a", "bc") != make_key("ab", "c")
+
+def test_round_trip_and_stats(tmp_path):
+    cache = DiskCache("test", directory=str(tmp_path))
+    assert cache.get_text("missing") is None
+    cache.set_text("k", "Grüße")
+    cache.set("b", b"\x00\xff")
+    assert (cache.get_text("k"), cache.get("b")) == ("Grüße", b"\x00\xff")
+    assert "k" in cache and "missing" not in cache
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["bytes"]) == (2, 1, len("Grüße".encode()) + 2)
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DiskCache("test", max_bytes=300, directory=str(tmp_path))
+    for key in "abc":
+        cache.set(key, key.encode() * 100)
+        time.sleep(0.01)
+    # Reading "a" makes "b" the least recently used entry.
+    assert cache.get("a") is not None
+    time.sleep(0.01)
+    cache.set("d", b"d" * 100)
+    assert cache.get("b") is None
+    assert all(cache.get(key) is not None for key in "acd")
+    assert cache.total_bytes() == 300
+
+def test_oversized_values_are_not_stored(tmp_path):
+    cache = DiskCache("test", max_bytes=10, directory=str(tmp_path))
+    cache.set("big", b"x" * 11)
+    assert cache.get("big") is None and cache.total_bytes() == 0
+
+def test_entries_persist_across_instances(tmp_path):
+    DiskCache("test", directory=str(tmp_path)).set_text("k", "kept")
+    assert DiskCache("test", directory=str(tmp_path)).get_text("k") == "kept"
@@ -0,0 +1,92 @@
+import struct
+
+import pytest
+
+from chapters import assemble_chapters, build_chapter_tag, detect_chapters, find_headings, is_heading
+from mp3 import iter_frames
+
+# MPEG-2 Layer III, 64 kbps, 24 kHz, mono: 192-byte frames of 24 ms.
+FRAME = b"\xff\xf3\x84\xc4" + b"\x55" * 188
+
+BODY = "The tide came in slowly over the flats, and nobody on the pier said a word about it. " * 4
+
+@pytest.mark.parametrize("line", [
+    "Chapter 1", "CHAPTER TWELVE", "Chapter one", "Part Two: The Return", "Chapter 3: The long road",
+    "BOOK IV", "Chapter XII The Dark Tower", "Prologue", "Appendix A", "3. The Storm",
+])
+def test_heading_lines(line):
+    assert is_heading(line)
+
+@pytest.mark.parametrize("line", [
+    # Wrapped PDF lines that merely start with a chapter keyword.
+    "book that he had never read before and",
+    "Book that he had never read",
+    "Part of the reason was",
+    "Part One of the plan was simple, but",
+    "Chapter One: The Lion and",
+    "Introduction to the new edition was written by",
+    "chapter 5",
+    "Chapters of his life were",
+    "The storm broke at dawn.",
+])
+def test_body_lines_are_not_headings(line):
+    assert not is_heading(line)
+
+def test_detect_chapters_ignores_wrapped_keyword_lines():
+    text = (f"Chapter 1\n{BODY}\nbook that he had never read before and\n{BODY}\n"
+            f"Part of the reason was\n{BODY}\nChapter 2\n{BODY}")
+    chapters = detect_chapters(text)
+    assert [chapter["title"] for chapter in chapters] == ["Chapter 1", "Chapter 2"]
+    assert "".join(chapter["text"] for chapter in chapters) == text
+
+def test_known_headings_and_page_titles():
+    text = f"Opening words.\n\fTHE RETURN\n{BODY}\nA Styled Heading\n{BODY}"
+    assert [title for _, title in find_headings(text, ["A Styled Heading"])] == ["THE RETURN", "A Styled Heading"]
+
+def _frames(tag):
+    """``{frame id: [payload, ...]}`` of an ID3v2.3 tag."""
+    assert tag[:5] == b"ID3\x03\x00"
+    size = (tag[6] << 21) | (tag[7] << 14) | (tag[8] << 7) | tag[9]
+    frames, position = {}, 10
+    while position < 10 + size:
+        frame_id = tag[position:position + 4].decode("ascii")
+        length = struct.unpack(">I", tag[position + 4:position + 8])[0]
+        frames.setdefault(frame_id, []).append(tag[position + 10:position + 10 + length])
+        position += 10 + length
+    return frames, 10 + size
+
+def _title(text_frame):
+    # TIT2 sub-frame: 10-byte header, encoding byte, UTF-16 with BOM, two-byte terminator.
+    assert text_frame[:4] == b"TIT2" and text_frame[10] == 1
+    return text_frame[11:-2].decode("utf-16")
+
+def test_chapter_tag_frames():
+    tag = build_chapter_tag(["Chapter 1", "Châpitre 2"], [(0, 1500), (1500, 4000)], book_title="Book")
+    frames, length = _frames(tag)
+    assert length == len(tag)
+    assert frames["TIT2"] == [b"\x01" + "Book".encode("utf-16") + b"\x00\x00"]
+    # Top-level, ordered table of contents listing both chapters.
+    assert frames["CTOC"] == [b"toc\x00\x03\x02chp0\x00chp1\x00"]
+    chaps = []
+    for chap in frames["CHAP"]:
+        element_id, rest = chap.split(b"\x00", 1)
+        start, end, start_offset, end_offset = struct.unpack(">IIII", rest[:16])
+        assert (start_offset, end_offset) == (0xFFFFFFFF, 0xFFFFFFFF)
+        chaps.append((element_id, start, end, _title(rest[16:])))
+    assert chaps == [(b"chp0", 0, 1500, "Chapter 1"), (b"chp1", 1500, 4000, "Châpitre 2")]
+
+def test_assemble_chapters_index(tmp_path):
+    paths = []
+    for name, frames in (("one", 125), ("two", 250)):
+        path = tmp_path / f"{name}.mp3"
+        path.write_bytes(FRAME * frames)
+        paths.append(str(path))
+    output = str(tmp_path / "book.mp3")
+    index = assemble_chapters(paths, ["One", "Two"], output)
+    assert [(c["title"], c["start_ms"], c["end_ms"]) for c in index] == [("One", 0, 3000), ("Two", 3000, 9000)]
+    assert index[1]["start_byte"] - index[0]["start_byte"] == 125 * len(FRAME)
+    assert index[1]["end_byte"] == (tmp_path / "book.mp3").stat().st_size
+    with open(output, "rb") as f:
+        frames, _ = _frames(f.read(index[0]["start_byte"]))
+    assert [_title(chap[chap.index(b"TIT2"):]) for chap in frames["CHAP"]] == ["One", "Two"]
+    assert sum(1 for _ in iter_frames(output)) == 375
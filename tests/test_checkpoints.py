@@ -0,0 +1,82 @@
+import os
+import tempfile
+import time
+from types import SimpleNamespace
+
+from checkpoints import Checkpoint, checkpoint_key, prune_checkpoints
+from rewriter import rewrite_chunks
+
+class FlakyClient:
+    """Uppercases chunks, failing those listed in ``fail``."""
+
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, **options):
+        content = messages[-1]["content"]
+        self.calls.append(content)
+        if content in self.fail:
+            raise RuntimeError("upstream error")
+        message = SimpleNamespace(content=content.upper())
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+def test_round_trip_and_key(tmp_path):
+    checkpoint = Checkpoint(checkpoint_key("rewrite", "text"), directory=str(tmp_path), source="book.pdf")
+    checkpoint.set_text("a", "chunk a")
+    checkpoint.set("b", b"\x00\x01")
+    assert (checkpoint.get_text("a"), checkpoint.get("b"), checkpoint.get("c")) == ("chunk a", b"\x00\x01", None)
+    assert "a" in checkpoint and checkpoint.completed() == 2
+    assert not [name for name in os.listdir(checkpoint.path) if name.endswith(".part")]
+    assert checkpoint_key("rewrite", "text") == checkpoint_key("rewrite", "text")
+    assert checkpoint_key("rewrite", "text") != checkpoint_key("tts", "text")
+
+def test_interrupted_run_resumes_only_missing_chunks(tmp_path):
+    chunks = [f"chunk {i}" for i in range(6)]
+    first = FlakyClient(fail={"chunk 2", "chunk 4"})
+    results, errors = rewrite_chunks(first, chunks, checkpoint=Checkpoint("job", directory=str(tmp_path)))
+    assert sorted(errors) == [2, 4] and results[2] is None
+    second = FlakyClient()
+    results, errors = rewrite_chunks(second, chunks, checkpoint=Checkpoint("job", directory=str(tmp_path)))
+    assert errors == {} and results == [chunk.upper() for chunk in chunks]
+    assert sorted(second.calls) == ["chunk 2", "chunk 4"]
+
+def test_discard_waits_for_the_last_holder(tmp_path):
+    first = Checkpoint("job", directory=str(tmp_path))
+    second = Checkpoint("job", directory=str(tmp_path))
+    first.set_text("a", "A")
+    first.discard()
+    # The other session is still working on the same document.
+    assert second.get_text("a") == "A"
+    second.set_text("b", "B")
+    assert second.get_text("b") == "B"
+    second.discard()
+    assert not os.path.exists(second.path)
+
+def test_write_failures_are_not_chunk_errors(tmp_path, monkeypatch):
+    checkpoint = Checkpoint("job", directory=str(tmp_path))
+
+    def no_space(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(tempfile, "mkstemp", no_space)
+    checkpoint.set_text("a", "A")
+    assert checkpoint.get_text("a") is None
+    results, errors = rewrite_chunks(FlakyClient(), ["one", "two"], checkpoint=checkpoint)
+    assert errors == {} and results == ["ONE", "TWO"]
+
+def test_writes_after_the_directory_was_removed(tmp_path):
+    checkpoint = Checkpoint("job", directory=str(tmp_path))
+    Checkpoint("job", directory=str(tmp_path)).discard()
+    checkpoint.discard()
+    assert not os.path.exists(checkpoint.path)
+    checkpoint.set_text("a", "A")
+    assert checkpoint.get_text("a") == "A"
+
+def test_prune_removes_only_stale_jobs(tmp_path):
+    old, fresh = Checkpoint("old", directory=str(tmp_path)), Checkpoint("fresh", directory=str(tmp_path))
+    stale = time.time() - 10 * 86400
+    os.utime(old.path, (stale, stale))
+    assert prune_checkpoints(str(tmp_path), max_age_days=7) == 1
+    assert not os.path.exists(old.path) and os.path.exists(fresh.path)
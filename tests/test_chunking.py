@@ -0,0 +1,52 @@
+import random
+
+from chunking import chunk_for_rewrite, chunk_for_tts, chunk_text, estimate_tokens
+
+def _text(paragraphs=40, seed=0):
+    rng = random.Random(seed)
+    words = "the storm rolled over a quiet harbor while lanterns swung in the wind".split()
+    return "\n\n".join(
+        " ".join(" ".join(rng.choice(words) for _ in range(rng.randint(3, 25))).capitalize() + "."
+                 for _ in range(rng.randint(1, 8)))
+        for _ in range(paragraphs)
+    )
+
+def test_chunks_fit_the_budget_and_keep_every_word():
+    text = _text()
+    for max_size in (40, 200, 1000):
+        chunks = chunk_text(text, max_size)
+        assert all(len(chunk) <= max_size for chunk in chunks)
+        assert " ".join(chunks).split() == text.split()
+
+def test_chunks_end_on_sentence_boundaries():
+    chunks = chunk_text(_text(), 300)
+    assert all(chunk.endswith(".") for chunk in chunks)
+
+def test_oversized_sentence_and_word_are_split():
+    sentence = " ".join(["word"] * 50) + "."
+    chunks = chunk_text(sentence, 30)
+    assert all(len(chunk) <= 30 for chunk in chunks)
+    assert " ".join(chunks).split() == sentence.split()
+    url = "x" * 95
+    assert all(len(piece) <= 30 for piece in chunk_text(url, 30))
+    assert "".join(chunk_text(url, 30)) == url
+
+def test_token_budget_for_rewrite():
+    text = _text(200)
+    chunks = chunk_for_rewrite(text, max_tokens=300)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 300 for chunk in chunks)
+
+def test_tts_engine_limits():
+    text = _text(200)
+    assert all(len(chunk) <= 2500 for chunk in chunk_for_tts(text, "edge-tts"))
+    assert all(len(chunk) <= 4000 for chunk in chunk_for_tts(text, "gtts"))
+
+def test_empty_text():
+    assert chunk_text("", 100) == []
+    assert chunk_text("  \n\n ", 100) == []
+
+def test_paragraph_breaks_count_against_the_budget():
+    chunks = chunk_text("\n\n".join(["Abc."] * 20), 20)
+    assert all(len(chunk) <= 20 for chunk in chunks)
+    assert "".join(chunks).count("Abc.") == 20
@@ -0,0 +1,96 @@
+import os
+import shutil
+import stat
+
+import pytest
+
+from encoding import (FORMATS, EncoderError, available_formats, encode_audio, encode_command, encoder_available,
+                      mime_type)
+from jobs import JobCancelled
+from mp3 import mp3_duration
+
+# MPEG-2 Layer III, 64 kbps, 24 kHz, mono: 192-byte frames of 24 ms.
+FRAME = b"\xff\xf3\x84\xc4" + b"\x00" * 188
+
+posix_only = pytest.mark.skipif(os.name != "posix", reason="fake ffmpeg is a shell script")
+
+def _mp3(tmp_path, seconds=3):
+    path = tmp_path / "book.mp3"
+    path.write_bytes(FRAME * round(seconds / 0.024))
+    return str(path)
+
+def _fake_ffmpeg(tmp_path, body):
+    """Shell script standing in for ffmpeg; the output path is its last argument."""
+    path = tmp_path / "ffmpeg"
+    path.write_text("#!/bin/sh\nfor last; do :; done\n" + body)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+def test_encoder_detection(tmp_path):
+    missing = str(tmp_path / "no-ffmpeg")
+    assert not encoder_available(missing)
+    assert available_formats(missing) == ["original"]
+    if os.name == "posix":
+        fake = _fake_ffmpeg(tmp_path, "exit 0\n")
+        assert encoder_available(fake)
+        assert available_formats(fake) == list(FORMATS)
+
+def test_mime_types():
+    assert mime_type("book.mp3") == "audio/mpeg"
+    assert mime_type("book.OGG") == "audio/ogg"
+    assert mime_type("book.wav") == "application/octet-stream"
+
+def test_encode_command():
+    command = encode_command("in.mp3", "out.ogg", FORMATS["opus"], ffmpeg="ff")
+    assert command[0] == "ff" and command[-3:] == ["-f", "ogg", "out.ogg"]
+    assert any(arg.startswith("loudnorm=I=") for arg in command)
+    assert command[command.index("-c:a") + 1] == "libopus"
+    assert not any("loudnorm" in arg for arg in encode_command("in.mp3", "out.mp3", FORMATS["mp3"], normalize=False))
+
+def test_original_is_copied_without_ffmpeg(tmp_path):
+    source = _mp3(tmp_path)
+    output = encode_audio(source, str(tmp_path / "copy.mp3"), "original", ffmpeg=str(tmp_path / "no-ffmpeg"))
+    assert open(output, "rb").read() == open(source, "rb").read()
+
+def test_missing_ffmpeg_raises(tmp_path):
+    with pytest.raises(EncoderError, match="not found"):
+        encode_audio(_mp3(tmp_path), str(tmp_path / "out.ogg"), "opus", ffmpeg=str(tmp_path / "no-ffmpeg"))
+
+@posix_only
+def test_progress_and_atomic_output(tmp_path):
+    ffmpeg = _fake_ffmpeg(tmp_path, 'echo out_time_us=N/A\necho out_time_us=1000000\necho out_time_us=2000000\n'
+                                    'printf encoded > "$last"\n')
+    progress = []
+    output = encode_audio(_mp3(tmp_path), str(tmp_path / "out.ogg"), "opus",
+                          on_progress=lambda done, total: progress.append((done, total)), ffmpeg=ffmpeg)
+    assert open(output).read() == "encoded"
+    assert progress == [(1, 3), (2, 3), (3, 3)]
+    assert sorted(os.listdir(tmp_path)) == ["book.mp3", "ffmpeg", "out.ogg"]
+
+@posix_only
+def test_failure_reports_stderr_and_leaves_nothing(tmp_path):
+    ffmpeg = _fake_ffmpeg(tmp_path, 'printf partial > "$last"\necho "Unknown encoder libopus" >&2\nexit 1\n')
+    with pytest.raises(EncoderError, match="exited with 1: Unknown encoder libopus"):
+        encode_audio(_mp3(tmp_path), str(tmp_path / "out.ogg"), "opus", ffmpeg=ffmpeg)
+    assert sorted(os.listdir(tmp_path)) == ["book.mp3", "ffmpeg"]
+
+@posix_only
+def test_cancel_kills_ffmpeg(tmp_path):
+    ffmpeg = _fake_ffmpeg(tmp_path, 'printf partial > "$last"\necho out_time_us=1000000\nexec sleep 30\n')
+
+    def cancel(done, total):
+        raise JobCancelled()
+
+    with pytest.raises(JobCancelled):
+        encode_audio(_mp3(tmp_path), str(tmp_path / "out.ogg"), "opus", on_progress=cancel, ffmpeg=ffmpeg)
+    assert sorted(os.listdir(tmp_path)) == ["book.mp3", "ffmpeg"]
+
+@pytest.mark.skipif(not shutil.which(os.getenv("FFMPEG", "ffmpeg")), reason="ffmpeg not installed")
+@pytest.mark.parametrize("format_key", ["mp3", "opus"])
+def test_real_ffmpeg(tmp_path, format_key):
+    # Synthetic frames decode to silence, which loudnorm leaves alone.
+    output = encode_audio(_mp3(tmp_path, seconds=5), str(tmp_path / f"out{FORMATS[format_key].extension}"),
+                          format_key, ffmpeg=os.getenv("FFMPEG", "ffmpeg"))
+    assert os.path.getsize(output) > 0
+    if format_key == "mp3":
+        assert abs(mp3_duration(output) - 5) < 0.2
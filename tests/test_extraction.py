@@ -0,0 +1,126 @@
+import io
+import os
+
+import pytest
+
+pdfplumber = pytest.importorskip("pdfplumber")
+
+import extraction
+from chapters import PAGE_BREAK
+from extraction import extract_text_from_pdf, format_page_timings, iter_pdf_pages
+
+def make_pdf(pages):
+    """Build a minimal PDF with one line of Helvetica text per page."""
+    count = len(pages)
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+                   b" ".join(b"%d 0 R" % (4 + 2 * i) for i in range(count)), count),
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for i, text in enumerate(pages):
+        stream = b"BT /F1 12 Tf 72 720 Td (%s) Tj ET" % text.encode("latin-1")
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (5 + 2 * i))
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    out.write(b"".join(b"%010d 00000 n \n" % offset for offset in offsets))
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+PAGES = [f"Page {i} of the book." for i in range(1, 11)]
+
+@pytest.fixture(autouse=True)
+def shared_pool():
+    yield
+    if extraction._pool is not None:
+        extraction._pool.shutdown()
+        extraction._pool = None
+
+def test_small_documents_are_read_in_process(tmp_path):
+    path = tmp_path / "short.pdf"
+    path.write_bytes(make_pdf(PAGES[:3]))
+    timings = []
+    assert extract_text_from_pdf(str(path), timings) == PAGE_BREAK.join(PAGES[:3])
+    assert [page_number for page_number, _, _ in timings] == [1, 2, 3]
+    assert extraction._pool is None
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_pages_come_back_in_order(tmp_path, max_workers):
+    path = tmp_path / "book.pdf"
+    path.write_bytes(make_pdf(PAGES))
+    assert list(iter_pdf_pages(str(path), max_workers=max_workers)) == list(enumerate(PAGES, 1))
+
+def test_uploads_are_parsed_from_a_temporary_file_that_is_removed(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction.tempfile, "tempdir", str(tmp_path))
+    timings = []
+    text = extract_text_from_pdf(io.BytesIO(make_pdf(PAGES)), timings, max_workers=2)
+    assert text.split(PAGE_BREAK) == PAGES
+    assert sorted(page_number for page_number, _, _ in timings) == list(range(1, 11))
+    assert os.listdir(tmp_path) == []
+    assert format_page_timings(timings, top=2).startswith("10 page(s) in ")
+
+def test_stopping_early_still_removes_the_temporary_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(extraction.tempfile, "tempdir", str(tmp_path))
+    pages = iter_pdf_pages(io.BytesIO(make_pdf(PAGES * 2)), max_workers=2)
+    assert next(pages) == (1, PAGES[0])
+    pages.close()
+    assert os.listdir(tmp_path) == []
+
+def make_docx(paragraphs):
+    """``paragraphs`` is a list of ``(style, text)``; ``style`` may be ``None``."""
+    docx = pytest.importorskip("docx")
+    document = docx.Document()
+    for style, text in paragraphs:
+        document.add_paragraph(text, style=style)
+    out = io.BytesIO()
+    document.save(out)
+    return out.getvalue()
+
+class MemoryStore:
+    def __init__(self):
+        self.items = {}
+
+    def get_text(self, key):
+        return self.items.get(key)
+
+    def set_text(self, key, text):
+        self.items[key] = text
+
+DOCX = [("Title", "The Harbor"), ("Heading 1", "Chapter One"), (None, "The ferry left at dawn."),
+        ("Heading 2", "Aside"), (None, "   ")]
+
+def test_docx_text_and_headings():
+    data = make_docx(DOCX)
+    assert extraction.extract_text_from_docx(io.BytesIO(data)) == "\n".join(text for _, text in DOCX)
+    assert extraction.extract_docx_headings(io.BytesIO(data)) == ["The Harbor", "Chapter One", "Aside"]
+
+def test_ingest_keeps_order_and_only_parses_new_files(monkeypatch):
+    files = [("a.docx", make_docx(DOCX)), ("b.pdf", make_pdf(PAGES[:2])), ("c.txt", "Plain café".encode())]
+    cache, headings, timings = MemoryStore(), [], {}
+    texts = extraction.ingest_files(files, cache=cache, headings=headings, timings=timings)
+    assert texts == ["\n".join(text for _, text in DOCX), PAGE_BREAK.join(PAGES[:2]), "Plain café"]
+    assert headings == ["The Harbor", "Chapter One", "Aside"]
+    assert list(timings) == ["b.pdf"] and len(timings["b.pdf"]) == 2
+
+    parsed = []
+    original = extraction.extract_text_from_bytes
+    monkeypatch.setattr(extraction, "extract_text_from_bytes",
+                        lambda name, data, timings=None: parsed.append(name) or original(name, data, timings))
+    renamed = [("renamed.docx", files[0][1]), ("d.txt", b"New text"), files[1]]
+    headings = []
+    texts = extraction.ingest_files(renamed, cache=cache, headings=headings)
+    # Files are keyed on content, so a renamed upload is still a cache hit.
+    assert parsed == ["d.txt"]
+    assert texts[1] == "New text" and texts[2] == PAGE_BREAK.join(PAGES[:2])
+    assert headings == ["The Harbor", "Chapter One", "Aside"]
+
+def test_cache_keys_include_the_extension():
+    cache = MemoryStore()
+    texts = extraction.ingest_files([("a.txt", b"same"), ("b.md", b"same"), ("c.txt", b"same")], cache=cache)
+    assert texts == ["same"] * 3 and len(cache.items) == 2
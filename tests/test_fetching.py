@@ -0,0 +1,93 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from cache import DiskCache
+from fetching import fetch_url_text, fetch_urls, make_session
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Wed, 01 Jan 2025 00:00:00 GMT"
+
+class Handler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, dict(self.headers)))
+        if self.path.startswith("/page/"):
+            # Later pages answer sooner, so completion order is reversed.
+            n = int(self.path.rsplit("/", 1)[1])
+            time.sleep(0.05 * (5 - n))
+            self._send(200, f"<html><p>Page {n}</p></html>".encode(), [("Content-Type", "text/html; charset=utf-8")])
+        elif self.path == "/cached":
+            if self.headers.get("If-None-Match") == ETAG or self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                self._send(304)
+            else:
+                self._send(200, b"<p>Cached text</p>", [("Content-Type", "text/html"), ("ETag", ETAG),
+                                                          ("Last-Modified", LAST_MODIFIED)])
+        elif self.path == "/latin1-meta":
+            body = '<meta charset="iso-8859-1"><p>Café crème</p>'.encode("iso-8859-1")
+            self._send(200, body, [("Content-Type", "text/html")])
+        elif self.path == "/latin1-header":
+            body = "<p>Crème brûlée</p>".encode("iso-8859-1")
+            self._send(200, body, [("Content-Type", "text/html; charset=ISO-8859-1")])
+        elif self.path == "/utf8-default":
+            self._send(200, "<p>Naïve café</p>".encode("utf-8"), [("Content-Type", "text/html")])
+        elif self.path == "/bad-charset":
+            self._send(200, "<p>Déjà vu</p>".encode("utf-8"), [("Content-Type", "text/html; charset=no-such-codec")])
+        else:
+            self._send(404, b"not found")
+
+@pytest.fixture
+def server():
+    Handler.requests_seen = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_fetch_urls_keeps_input_order(server):
+    urls = [f"{server}/page/{n}" for n in range(5)]
+    progress = []
+    texts, errors = fetch_urls(urls, max_workers=5, on_progress=lambda done, total: progress.append((done, total)))
+    assert errors == {}
+    assert texts == [f"Page {n}" for n in range(5)]
+    assert progress[-1] == (5, 5)
+
+def test_errors_are_reported_per_url(server):
+    texts, errors = fetch_urls([f"{server}/page/4", f"{server}/missing", f"{server}/page/3"])
+    assert texts == ["Page 4", None, "Page 3"]
+    assert list(errors) == [1]
+    assert errors[1].response.status_code == 404
+
+def test_revalidation_serves_304_from_cache(server, tmp_path):
+    cache = DiskCache("pages", directory=str(tmp_path))
+    session = make_session()
+    assert fetch_url_text(f"{server}/cached", session, cache) == "Cached text"
+    assert fetch_url_text(f"{server}/cached", session, cache) == "Cached text"
+    first, second = [headers for path, headers in Handler.requests_seen if path == "/cached"]
+    assert "If-None-Match" not in first
+    assert second["If-None-Match"] == ETAG
+    assert second["If-Modified-Since"] == LAST_MODIFIED
+
+def test_charset_fallbacks(server):
+    # <meta charset> when the header has none, the header's charset when
+    # given, UTF-8 otherwise, and UTF-8 for an unknown codec.
+    assert fetch_url_text(f"{server}/latin1-meta") == "Café crème"
+    assert fetch_url_text(f"{server}/latin1-header") == "Crème brûlée"
+    assert fetch_url_text(f"{server}/utf8-default") == "Naïve café"
+    assert fetch_url_text(f"{server}/bad-charset") == "Déjà vu"
@@ -0,0 +1,80 @@
+import threading
+import time
+
+import pytest
+
+from jobs import CANCELLED, DONE, FAILED, QUEUED, RUNNING, JobRunner
+
+def _wait(runner, job_id, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = runner.get(job_id)
+        if job["status"] in (DONE, FAILED, CANCELLED):
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f"job {job_id} did not finish")
+
+@pytest.fixture
+def runner():
+    return JobRunner(max_workers=1, trace_dir=None)
+
+def test_submit_passes_arguments_and_progress(runner):
+    def add(a, b, scale=1, on_progress=None):
+        on_progress(1, 2)
+        on_progress(2, 2)
+        return (a + b) * scale
+
+    job_id = runner.submit("add", add, 2, 3, scale=10)
+    job = _wait(runner, job_id)
+    assert (job["status"], job["result"], job["done"], job["total"], job["kind"]) == (DONE, 50, 2, 2, "add")
+    assert job["submitted"] <= job["started"] <= job["finished"]
+
+def test_failure_is_recorded(runner):
+    def fail(on_progress=None):
+        raise ValueError("bad input")
+
+    job = _wait(runner, runner.submit("fail", fail))
+    assert job["status"] == FAILED
+    assert job["error"] == "ValueError: bad input"
+
+def test_cancel_stops_a_running_job_at_its_next_progress_report(runner):
+    started, steps = threading.Event(), []
+
+    def work(on_progress=None):
+        started.set()
+        for step in range(1000):
+            steps.append(step)
+            on_progress(step, 1000)
+            time.sleep(0.005)
+
+    job_id = runner.submit("work", work)
+    started.wait(5)
+    assert runner.get(job_id)["status"] == RUNNING
+    runner.cancel(job_id)
+    assert _wait(runner, job_id)["status"] == CANCELLED
+    assert len(steps) < 1000
+
+def test_cancelled_queued_job_never_starts(runner):
+    release, ran = threading.Event(), []
+    blocker = runner.submit("block", lambda on_progress=None: release.wait(5))
+    queued = runner.submit("queued", lambda on_progress=None: ran.append(True))
+    assert runner.get(queued)["status"] == QUEUED
+    runner.cancel(queued)
+    release.set()
+    assert _wait(runner, blocker)["status"] == DONE
+    assert _wait(runner, queued)["status"] == CANCELLED
+    assert ran == []
+
+def test_forget_stats_and_retention():
+    runner = JobRunner(max_workers=2, retention_seconds=0, trace_dir=None)
+    job_id = runner.submit("noop", lambda on_progress=None: None)
+    _wait(runner, job_id)
+    assert runner.stats()[DONE] == 1
+    runner.forget(job_id)
+    assert runner.get(job_id) is None
+    # Finished jobs past the retention time are pruned on the next submit.
+    old = runner.submit("noop", lambda on_progress=None: None)
+    _wait(runner, old)
+    runner.submit("noop", lambda on_progress=None: None)
+    assert runner.get(old) is None
+    assert runner.get("unknown") is None
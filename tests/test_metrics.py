@@ -0,0 +1,95 @@
+import json
+import socket
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import metrics
+
+@pytest.fixture
+def registry(monkeypatch):
+    registry = metrics.Registry()
+    monkeypatch.setattr(metrics, "REGISTRY", registry)
+    return registry
+
+def test_counters_and_histograms_render_in_prometheus_format(registry):
+    registry.count("jobs_total", help="Finished jobs.", kind="tts", status="done")
+    registry.count("jobs_total", 2, kind="tts", status="done")
+    registry.observe("stage_seconds", 0.3, help="Stage time.", stage="rewrite")
+    text = registry.render()
+    assert registry.value("jobs_total", status="done", kind="tts") == 3
+    assert "# HELP audiobook_jobs_total Finished jobs.\n# TYPE audiobook_jobs_total counter\n" in text
+    assert 'audiobook_jobs_total{kind="tts",status="done"} 3\n' in text
+    assert 'audiobook_stage_seconds_bucket{stage="rewrite",le="0.25"} 0\n' in text
+    assert 'audiobook_stage_seconds_bucket{stage="rewrite",le="0.5"} 1\n' in text
+    assert 'audiobook_stage_seconds_bucket{stage="rewrite",le="+Inf"} 1\n' in text
+    assert 'audiobook_stage_seconds_count{stage="rewrite"} 1\n' in text
+
+def test_label_values_are_escaped(registry):
+    registry.count("errors_total", stage='say "hi"\\\n')
+    assert 'audiobook_errors_total{stage="say \\"hi\\"\\\\\\n"} 1' in registry.render()
+
+def test_span_records_time_counters_and_errors(registry):
+    with metrics.span("rewrite_chunk", chars=120) as record:
+        record["tokens_prompt"], record["tokens_completion"] = 40, 35
+    with pytest.raises(ValueError):
+        with metrics.span("tts"):
+            raise ValueError("boom")
+    assert registry.value("stage_chars_total", stage="rewrite_chunk") == 120
+    assert registry.value("groq_tokens_total", kind="prompt") == 40
+    assert registry.value("groq_tokens_total", kind="completion") == 35
+    assert registry.value("errors_total", stage="tts") == 1
+    assert 'audiobook_stage_seconds_count{stage="tts"} 1' in registry.render()
+
+def test_trace_export(registry, tmp_path):
+    trace = metrics.Trace("job 1")
+    with metrics.tracing(trace):
+        with metrics.span("job", kind="rewrite"):
+            with metrics.span("merge"):
+                pass
+    # Spans outside the tracing block are not recorded.
+    with metrics.span("after"):
+        pass
+    path = trace.save(str(tmp_path / "traces" / "job.json"))
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    assert sorted(event["name"] for event in data["traceEvents"]) == ["job", "merge"]
+    assert data["otherData"] == {"job": "job 1"}
+    job = next(event for event in data["traceEvents"] if event["name"] == "job")
+    assert job["ph"] == "X" and job["args"] == {"kind": "rewrite"} and job["dur"] >= 0
+
+def test_submit_carries_the_trace_into_pools(registry):
+    trace = metrics.Trace("job 2")
+
+    def work(i):
+        with metrics.span("chunk", index=i):
+            pass
+
+    with metrics.tracing(trace), ThreadPoolExecutor(max_workers=2) as pool:
+        for future in [metrics.submit(pool, work, i) for i in range(3)]:
+            future.result()
+    assert sorted(event["args"]["index"] for event in trace.events) == [0, 1, 2]
+
+def test_textfile_and_http_export(registry, tmp_path):
+    registry.count("jobs_total", kind="rewrite", status="done")
+    path = tmp_path / "metrics-{pid}.prom"
+    metrics.write_textfile(str(path))
+    written = list(tmp_path.glob("metrics-*.prom"))
+    assert len(written) == 1 and written[0].read_text() == registry.render()
+    metrics.write_textfile(None)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = metrics.start_http_server(port, host="127.0.0.1")
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+            assert response.read().decode() == registry.render()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert metrics.start_http_server(0) is None
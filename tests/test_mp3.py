@@ -0,0 +1,41 @@
+from mp3 import concatenate_mp3, iter_frames, mp3_duration, parse_header
+
+# MPEG-2 Layer III, 64 kbps, 24 kHz, mono, no CRC: 192-byte frames of 576 samples.
+FRAME_HEADER = b"\xff\xf3\x84\xc4"
+FRAME = FRAME_HEADER + b"\x55" * 188
+
+def _id3v2(payload):
+    size = len(payload)
+    syncsafe = bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+    return b"ID3\x03\x00\x00" + syncsafe + payload
+
+def _write(path, frames, tag=b""):
+    path.write_bytes(tag + FRAME * frames)
+    return str(path)
+
+def test_frame_header():
+    header = parse_header(FRAME_HEADER)
+    assert (header.sample_rate, header.bitrate, header.frame_length, header.samples) == (24000, 64, 192, 576)
+
+def test_concatenate_counts_frames_and_boundaries(tmp_path):
+    paths = [_write(tmp_path / "a.mp3", 50), _write(tmp_path / "b.mp3", 30)]
+    boundaries = []
+    output = concatenate_mp3(paths, str(tmp_path / "out.mp3"), boundaries=boundaries)
+    assert sum(1 for _ in iter_frames(output)) == 80
+    assert mp3_duration(output) == 80 * 576 / 24000
+    # The Info frame comes first, then each input's audio.
+    assert boundaries[0] > 0 and boundaries[1] - boundaries[0] == 50 * 192
+
+def test_tag_larger_than_block_is_skipped(tmp_path):
+    # Cover art easily makes an ID3v2 tag bigger than the read buffer; this
+    # one holds bytes that look like frames, which must not leak into the audio.
+    tagged = _write(tmp_path / "tagged.mp3", 40, tag=_id3v2(FRAME * 500))
+    assert sum(1 for _ in iter_frames(tagged, block_size=4096)) == 40
+    output = concatenate_mp3([tagged, _write(tmp_path / "plain.mp3", 10)], str(tmp_path / "out.mp3"),
+                             block_size=4096)
+    assert sum(1 for _ in iter_frames(output)) == 50
+
+def test_garbage_between_frames_is_resynced(tmp_path):
+    path = tmp_path / "noisy.mp3"
+    path.write_bytes(FRAME * 5 + b"\xff\x00junk\xff" + FRAME * 5)
+    assert sum(1 for _ in iter_frames(str(path))) == 10
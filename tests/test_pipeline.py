@@ -0,0 +1,69 @@
+import os
+import random
+import time
+from types import SimpleNamespace
+
+from mp3 import mp3_duration
+from pipeline import stream_audiobook
+
+# MPEG-2 Layer III, 64 kbps, 24 kHz, mono: 192-byte frames of 24 ms.
+FRAME = b"\xff\xf3\x84\xc4" + b"\x00" * 188
+
+class FakeClient:
+    """Upper-cases each chunk after a random delay; chunks containing "fail" raise."""
+
+    def __init__(self):
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, **options):
+        text = messages[-1]["content"]
+        time.sleep(random.uniform(0, 0.03))
+        if "fail" in text:
+            raise RuntimeError(f"rejected {text}")
+        message = SimpleNamespace(content=text.upper())
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=None)
+
+def synthesize(piece, path):
+    time.sleep(random.uniform(0, 0.01))
+    if "BROKEN" in piece:
+        raise RuntimeError("tts failed")
+    with open(path, "wb") as f:
+        f.write(FRAME * 10)
+    return path
+
+def words(text):
+    return text.split()
+
+def test_sections_are_yielded_in_order(tmp_path):
+    chunks = [f"chunk {i} alpha beta" for i in range(12)]
+    sections = list(stream_audiobook(FakeClient(), chunks, words, synthesize, str(tmp_path),
+                                     rewrite_workers=4, tts_workers=3))
+    assert [section["index"] for section in sections] == list(range(12))
+    for i, section in enumerate(sections):
+        assert section["total"] == 12 and section["error"] is None and section["gaps"] == []
+        assert section["text"] == chunks[i].upper() and section["pieces"] == 4
+        assert os.path.basename(section["audio_path"]) == f"section_{i}.mp3"
+        assert abs(mp3_duration(section["audio_path"]) - 4 * 10 * 0.024) < 0.01
+
+def test_failed_rewrite_sets_error_and_keeps_going(tmp_path):
+    chunks = ["one", "fail here", "three"]
+    sections = list(stream_audiobook(FakeClient(), chunks, words, synthesize, str(tmp_path), rewrite_workers=2))
+    assert [section["index"] for section in sections] == [0, 1, 2]
+    failed = sections[1]
+    assert "rejected fail here" in failed["error"]
+    assert failed["text"] is None and failed["audio_path"] is None and failed["pieces"] == 0
+    assert sections[0]["audio_path"] and sections[2]["audio_path"]
+
+def test_tts_failures_are_reported_as_gaps(tmp_path):
+    sections = list(stream_audiobook(FakeClient(), ["good broken good", "broken"], words, synthesize, str(tmp_path)))
+    first, second = sections
+    assert first["error"] is None and first["pieces"] == 3
+    assert first["gaps"] == [{"index": 1, "error": "tts failed", "text": "BROKEN"}]
+    assert abs(mp3_duration(first["audio_path"]) - 2 * 10 * 0.024) < 0.01
+    # A section whose every piece failed has no audio but still arrives.
+    assert second["audio_path"] is None and len(second["gaps"]) == 1
+
+def test_closing_the_generator_early_stops_cleanly(tmp_path):
+    stream = stream_audiobook(FakeClient(), [f"chunk {i}" for i in range(20)], words, synthesize, str(tmp_path))
+    assert next(stream)["index"] == 0
+    stream.close()
@@ -0,0 +1,119 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from ratelimit import FATAL, THROTTLED, TRANSIENT, RateLimiter, classify, retry_after
+
+class FakeAPIError(Exception):
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+        headers = {"retry-after": retry_after} if retry_after is not None else {}
+        self.response = SimpleNamespace(headers=headers)
+
+class FakeServer:
+    """Answers with 429 (Retry-After) for the first ``throttle`` calls."""
+
+    def __init__(self, throttle=0, retry_after="0.05", error=None):
+        self.throttle = throttle
+        self.retry_after = retry_after
+        self.error = error
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def __call__(self):
+        with self.lock:
+            self.calls.append(time.monotonic())
+            n = len(self.calls)
+        if self.error is not None:
+            raise self.error
+        if n <= self.throttle:
+            raise FakeAPIError(429, self.retry_after)
+        return SimpleNamespace(usage=SimpleNamespace(total_tokens=10))
+
+def test_classify():
+    assert classify(FakeAPIError(429)) == THROTTLED
+    assert classify(FakeAPIError(503)) == TRANSIENT
+    assert classify(FakeAPIError(400)) == FATAL
+    assert classify(ConnectionError()) == TRANSIENT
+    assert retry_after(FakeAPIError(429, "2")) == 2.0
+    assert retry_after(FakeAPIError(429)) is None
+
+def test_429_is_retried_after_retry_after():
+    server = FakeServer(throttle=2, retry_after="0.05")
+    limiter = RateLimiter(max_concurrency=8, retries=5, base_delay=0.001)
+    result = limiter.call(server)
+    assert result.usage.total_tokens == 10
+    assert len(server.calls) == 3
+    assert server.calls[1] - server.calls[0] >= 0.05
+    stats = limiter.stats()
+    assert stats["throttled"] == 2
+    assert stats["limit"] < 8
+    assert stats["in_flight"] == 0
+
+def test_fatal_errors_are_not_retried():
+    server = FakeServer(error=FakeAPIError(401))
+    limiter = RateLimiter(retries=5, base_delay=0.001)
+    with pytest.raises(FakeAPIError):
+        limiter.call(server)
+    assert len(server.calls) == 1
+    assert limiter.stats()["in_flight"] == 0
+
+def test_gives_up_after_retries():
+    server = FakeServer(error=FakeAPIError(503))
+    limiter = RateLimiter(retries=3, base_delay=0.001)
+    with pytest.raises(FakeAPIError):
+        limiter.call(server)
+    assert len(server.calls) == 3
+
+def test_concurrency_stays_within_limit():
+    limiter = RateLimiter(max_concurrency=2, retries=1)
+    active, peak, lock = [0], [0], threading.Lock()
+
+    def request():
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+
+    threads = [threading.Thread(target=limiter.call, args=(request,)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
+
+def test_owners_are_served_round_robin():
+    limiter = RateLimiter(max_concurrency=1, retries=1)
+    blocker = limiter.acquire(owner="busy")
+    order, threads = [], []
+    for owner in ["big"] * 3 + ["small"]:
+        thread = threading.Thread(target=lambda owner=owner: limiter.call(lambda: order.append(owner), owner=owner))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.01)  # queue in this order
+    limiter.release(blocker)
+    for thread in threads:
+        thread.join()
+    assert order.index("small") <= 1
+
+def test_hold_keeps_the_slot_and_charges_actual_usage():
+    limiter = RateLimiter(tokens_per_minute=6000, max_concurrency=4, retries=1)
+    with limiter.hold(cost=1000) as usage:
+        assert limiter.stats()["in_flight"] == 1
+        usage["used"] = 100
+    assert limiter.stats()["in_flight"] == 0
+    # 1000 estimated, 100 used: the difference goes back to the bucket.
+    assert limiter.tokens.level == pytest.approx(5900, abs=5)
+
+def test_hold_throttles_on_429():
+    limiter = RateLimiter(max_concurrency=8, retries=1)
+    with pytest.raises(FakeAPIError):
+        with limiter.hold():
+            raise FakeAPIError(429, "0.05")
+    assert limiter.stats()["throttled"] == 1
+    assert limiter.stats()["in_flight"] == 0
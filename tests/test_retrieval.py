@@ -0,0 +1,55 @@
+import math
+
+from retrieval import PLAIN_SYSTEM_PROMPT, PassageIndex, build_chat_messages, tokenize
+
+TOPICS = [
+    "The lighthouse keeper trimmed the lamp wick every evening before the storm.",
+    "Marta baked bread in the village oven and traded loaves for fish.",
+    "The old bridge collapsed during the spring flood, cutting off the village.",
+    "A stranger arrived on the ferry carrying a locked wooden chest.",
+]
+
+def _book(tmp_path, paragraphs=40):
+    text = "".join(f"{TOPICS[i % len(TOPICS)]} Paragraph {i}.\n" for i in range(paragraphs))
+    path = tmp_path / "book.txt"
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+def test_tokenize_drops_case_punctuation_and_stopwords():
+    assert tokenize("The Keeper, and HIS lamp!") == ["keeper", "lamp"]
+
+def test_search_ranks_matching_passages_first(tmp_path):
+    index = PassageIndex(_book(tmp_path), passage_bytes=200)
+    assert len(index) > 10
+    hits = index.search("locked chest on the ferry", k=3)
+    assert len(hits) == 3 and hits == sorted(hits, reverse=True)
+    for _, passage in hits:
+        assert "locked wooden chest" in index.pages.page(passage)
+    assert index.search("submarine") == []
+
+def test_bm25_scores(tmp_path):
+    path = tmp_path / "book.txt"
+    path.write_text("village village unique\n" + "village road\n" * 30, encoding="utf-8")
+    index = PassageIndex(str(path), passage_bytes=30)
+    (score, passage), = index.search("unique", k=1)
+    total, length = len(index), index.lengths[0]
+    idf = math.log(1 + (total - 1 + 0.5) / (1 + 0.5))
+    norm = 1.5 * (1 - 0.75 + 0.75 * length / index.average_length)
+    assert passage == 0 and math.isclose(score, idf * 2.5 / (1 + norm))
+    # A term in every passage is worth less than a rare one.
+    assert index.search("village", k=1)[0][0] < score
+
+def test_passages_come_back_in_book_order_from_any_copy(tmp_path):
+    index = PassageIndex(_book(tmp_path), passage_bytes=200)
+    copy = tmp_path / "copy.txt"
+    copy.write_bytes((tmp_path / "book.txt").read_bytes())
+    passages = index.passages("bread oven", k=3, path=str(copy))
+    assert [passage for passage, _ in passages] == sorted(passage for passage, _ in passages)
+    assert all("Marta baked bread" in text and text == text.strip() for _, text in passages)
+
+def test_chat_messages_with_and_without_passages():
+    history = [{"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}]
+    messages = build_chat_messages("Who baked?", [(2, "Marta baked bread.")], history)
+    assert messages[0]["role"] == "system" and "[Passage 3]\nMarta baked bread." in messages[0]["content"]
+    assert messages[1:] == history + [{"role": "user", "content": "Who baked?"}]
+    assert build_chat_messages("Hi")[0] == {"role": "system", "content": PLAIN_SYSTEM_PROMPT}
@@ -0,0 +1,89 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from rewriter import RewriteTruncated, rewrite_chunks
+
+class FakeClient:
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.calls = 0
+        self.lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, messages, **options):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        message = SimpleNamespace(content=messages[-1]["content"].upper())
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+class MemoryStore:
+    def __init__(self):
+        self.items = {}
+
+    def get_text(self, key):
+        return self.items.get(key)
+
+    def set_text(self, key, text):
+        self.items[key] = text
+
+class Cancelled(Exception):
+    pass
+
+def test_results_keep_chunk_order():
+    chunks = [f"chunk {i}" for i in range(10)]
+    results, errors = rewrite_chunks(FakeClient(), chunks, max_workers=4)
+    assert results == [chunk.upper() for chunk in chunks] and errors == {}
+
+def test_cache_hits_skip_the_api():
+    client, cache = FakeClient(latency=0), MemoryStore()
+    chunks = [f"chunk {i}" for i in range(5)]
+    rewrite_chunks(client, chunks, cache=cache)
+    rewrite_chunks(client, chunks, cache=cache)
+    assert client.calls == 5
+
+def test_cancel_stops_queued_requests_and_keeps_finished_ones():
+    client, cache = FakeClient(), MemoryStore()
+
+    def on_progress(done, total):
+        raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        rewrite_chunks(client, [f"chunk {i}" for i in range(40)], max_workers=4, on_progress=on_progress, cache=cache)
+    # Only the requests already in flight when the first one finished.
+    assert client.calls <= 8
+    assert len(cache.items) == client.calls
+
+class TruncatingClient(FakeClient):
+    """Cuts off completions for inputs longer than ``limit`` characters."""
+
+    def __init__(self, limit):
+        super().__init__(latency=0)
+        self.limit = limit
+
+    def create(self, messages, **options):
+        response = super().create(messages, **options)
+        content = messages[-1]["content"]
+        response.choices[0].finish_reason = "length" if len(content) > self.limit else "stop"
+        if len(content) > self.limit:
+            response.choices[0].message.content = content[:self.limit].upper()
+        return response
+
+def test_truncated_rewrite_is_retried_in_halves():
+    chunk = " ".join(f"Sentence number {i} is here." for i in range(20))
+    cache = MemoryStore()
+    results, errors = rewrite_chunks(TruncatingClient(limit=len(chunk) // 2 + 50), [chunk], cache=cache)
+    assert errors == {}
+    assert results[0].split() == chunk.upper().split()
+    assert list(cache.items.values()) == results
+
+def test_rewrite_still_truncated_after_splitting_is_a_chunk_error():
+    chunks = ["Short one.", " ".join(f"Sentence number {i} is here." for i in range(20))]
+    cache = MemoryStore()
+    results, errors = rewrite_chunks(TruncatingClient(limit=100), chunks, cache=cache)
+    assert results == ["SHORT ONE.", None]
+    assert isinstance(errors[1], RewriteTruncated)
+    assert list(cache.items.values()) == ["SHORT ONE."]
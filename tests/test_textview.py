@@ -0,0 +1,47 @@
+from textview import PageIndex, page_html
+
+def _write(tmp_path, text):
+    path = tmp_path / "book.txt"
+    path.write_bytes(text.encode("utf-8"))
+    return str(path)
+
+def _lines(count=300):
+    return "".join(f"Line {i}: the ferry left at dawn and came back éclairée by the harbor lights.\n"
+                   for i in range(count))
+
+def test_pages_cover_the_text_and_end_on_line_breaks(tmp_path):
+    text = _lines()
+    index = PageIndex(_write(tmp_path, text), page_bytes=1000)
+    pages = [index.page(page) for page in range(len(index))]
+    assert "".join(pages) == text
+    assert len(index) > 20
+    assert all(page.endswith("\n") for page in pages)
+    assert all(len(page.encode("utf-8")) <= 1000 for page in pages)
+
+def test_long_lines_split_on_spaces_and_never_inside_characters(tmp_path):
+    text = " ".join(["éléphant"] * 2000)
+    index = PageIndex(_write(tmp_path, text), page_bytes=500)
+    assert "".join(index.page(page) for page in range(len(index))) == text
+    unbroken = "é" * 3000
+    index = PageIndex(_write(tmp_path, unbroken), page_bytes=501)
+    assert "".join(index.page(page) for page in range(len(index))) == unbroken
+
+def test_search_and_page_of(tmp_path):
+    index = PageIndex(_write(tmp_path, _lines()), page_bytes=1000)
+    hits = index.search("LINE 250:")
+    assert len(hits) == 1
+    page, offset = hits[0]
+    assert index.bounds(page)[0] <= offset < index.bounds(page)[1]
+    assert "Line 250:" in index.page(page)
+    assert "harbor lights. Line 250: the ferry" in index.snippet(offset, len("Line 250:"))
+    assert len(index.search("ferry", limit=7)) == 7
+    assert index.search("") == [] and index.search("submarine") == []
+
+def test_page_html_escapes_and_marks_matches(tmp_path):
+    index = PageIndex(_write(tmp_path, "Fish & <chips> and more fish.\n"))
+    assert page_html(index, 0, "fish") == "<mark>Fish</mark> &amp; &lt;chips&gt; and more <mark>fish</mark>.\n"
+    assert page_html(index, 0) == "Fish &amp; &lt;chips&gt; and more fish.\n"
+
+def test_empty_file(tmp_path):
+    index = PageIndex(_write(tmp_path, ""))
+    assert len(index) == 1 and index.page(0) == "" and index.search("x") == []
@@ -0,0 +1,39 @@
+import threading
+import time
+
+import pytest
+
+import tts
+
+class Cancelled(Exception):
+    pass
+
+@pytest.fixture
+def fake_gtts(monkeypatch):
+    calls = []
+    lock = threading.Lock()
+
+    def synthesize(chunk, path, language="en", storyteller=True):
+        with lock:
+            calls.append(chunk)
+        time.sleep(0.05)
+        with open(path, "wb") as f:
+            f.write(chunk.encode())
+
+    monkeypatch.setattr(tts, "synthesize_gtts_chunk", synthesize)
+    return calls
+
+def test_paths_in_chunk_order(fake_gtts, tmp_path):
+    chunks = [f"chunk {i}" for i in range(10)]
+    paths, gaps = tts.synthesize_gtts_chunks(chunks, str(tmp_path), max_workers=4)
+    assert gaps == []
+    assert [open(path).read() for path in paths] == chunks
+
+def test_cancel_stops_queued_chunks(fake_gtts, tmp_path):
+    def on_progress(done, total):
+        raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        tts.synthesize_gtts_chunks([f"chunk {i}" for i in range(40)], str(tmp_path), max_workers=4,
+                                   on_progress=on_progress)
+    assert len(fake_gtts) <= 8
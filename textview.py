@@ -0,0 +1,107 @@
+import html
+import re
+from bisect import bisect_right
+
+from artifacts import mapped
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+PAGE_BYTES = 4000
+MAX_SEARCH_HITS = 500
+SNIPPET_BYTES = 60
+
+def _char_start(data, offset):
+    # Step back to the first byte of a UTF-8 character.
+    while 0 < offset < len(data) and data[offset] & 0xC0 == 0x80:
+        offset -= 1
+    return offset
+
+def _decode(data):
+    return bytes(data).decode("utf-8", errors="ignore")
+
+# ---------------------------
+# PAGE INDEX
+# ---------------------------
+class PageIndex:
+    """Page start offsets into a UTF-8 text file, computed once per file.
+
+    Pages are about ``page_bytes`` long and end on a line break, or failing
+    that a space, in the second half of the page, so words and (usually)
+    paragraphs aren't cut. The file is memory-mapped whenever a page is
+    read and only that page is decoded, so neither the index nor a page
+    view ever holds the whole document in memory.
+    """
+
+    def __init__(self, path, page_bytes=PAGE_BYTES):
+        self.path = path
+        self.offsets = [0]
+        with mapped(path) as data:
+            self.size = len(data)
+            start = 0
+            while self.size - start > page_bytes:
+                end = start + page_bytes
+                cut = data.rfind(b"\n", start + page_bytes // 2, end)
+                if cut == -1:
+                    cut = data.rfind(b" ", start + page_bytes // 2, end)
+                start = cut + 1 if cut != -1 else _char_start(data, end)
+                self.offsets.append(start)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def bounds(self, page):
+        """``(start, end)`` byte offsets of 0-based ``page``."""
+        start = self.offsets[page]
+        end = self.offsets[page + 1] if page + 1 < len(self.offsets) else self.size
+        return start, end
+
+    def page(self, page):
+        start, end = self.bounds(page)
+        with mapped(self.path) as data:
+            return _decode(data[start:end])
+
+    def page_of(self, offset):
+        return bisect_right(self.offsets, offset) - 1
+
+    def _find_all(self, data, query, start, end, limit):
+        # Case-insensitive for ASCII letters; runs over the mapped bytes,
+        # so the document is never decoded or lower-cased as a whole.
+        pattern = re.compile(re.escape(query.encode("utf-8")), re.IGNORECASE)
+        offsets = []
+        for match in pattern.finditer(data, start, end):
+            offsets.append(match.start())
+            if len(offsets) >= limit:
+                break
+        return offsets
+
+    def search(self, query, limit=MAX_SEARCH_HITS):
+        """Matches as ``[(page, offset)]``, at most ``limit``."""
+        if not query:
+            return []
+        with mapped(self.path) as data:
+            offsets = self._find_all(data, query, 0, self.size, limit)
+        return [(self.page_of(offset), offset) for offset in offsets]
+
+    def snippet(self, offset, length, context=SNIPPET_BYTES):
+        with mapped(self.path) as data:
+            text = _decode(data[max(0, offset - context):min(self.size, offset + length + context)])
+        return " ".join(text.split())
+
+# ---------------------------
+# RENDERING
+# ---------------------------
+def page_html(index, page, query=""):
+    """Escaped HTML for one page, with ``query`` matches wrapped in <mark>."""
+    start, end = index.bounds(page)
+    needle = len(query.encode("utf-8"))
+    parts = []
+    with mapped(index.path) as data:
+        position = start
+        if query:
+            for offset in index._find_all(data, query, start, end, MAX_SEARCH_HITS):
+                parts.append(html.escape(_decode(data[position:offset])))
+                parts.append(f"<mark>{html.escape(_decode(data[offset:offset + needle]))}</mark>")
+                position = offset + needle
+        parts.append(html.escape(_decode(data[position:end])))
+    return "".join(parts)
@@ -0,0 +1,240 @@
+import asyncio
+import os
+import random
+import re
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import metrics
+from cache import make_key
+from chunking import chunk_for_tts
+from mp3 import concatenate_mp3
+
+# ---------------------------
+# CONFIGURATION
+# ---------------------------
+# gTTS is almost entirely network-bound, so a handful of workers is plenty.
+TTS_CONCURRENCY = int(os.getenv("TTS_CONCURRENCY", "4"))
+TTS_RETRIES = int(os.getenv("TTS_RETRIES", "3"))
+EDGE_TTS_CONCURRENCY = int(os.getenv("EDGE_TTS_CONCURRENCY", "4"))
+
+def backoff_delay(attempt, base_delay=1.0):
+    return base_delay * 2 ** (attempt - 1) * (0.5 + random.random())
+
+def with_retries(fn, retries=TTS_RETRIES, base_delay=1.0, stage="tts"):
+    """Call ``fn()`` up to ``retries`` times with jittered exponential backoff."""
+    for attempt in range(1, retries + 1):
+        try:
+            return fn()
+        except Exception:
+            if attempt == retries:
+                raise
+            metrics.count("retries_total", stage=stage, help="Retried requests.")
+            time.sleep(backoff_delay(attempt, base_delay))
+
+def clean_text_for_tts(text):
+    cleaned = re.sub(r'[^\w\s.,!?;:()"\']', '', text)
+    cleaned = re.sub(r'\s+', ' ', cleaned).strip()
+    return cleaned
+
+# ---------------------------
+# SEGMENT AUDIO CACHE
+# ---------------------------
+def audio_cache_key(engine, text, voice, storyteller=False):
+    return make_key("audio", engine, voice, bool(storyteller), text)
+
+def restore_cached_audio(cache, key, path):
+    audio = cache.get(key) if cache is not None else None
+    if audio is None:
+        return False
+    with open(path, "wb") as f:
+        f.write(audio)
+    return True
+
+def store_cached_audio(cache, key, path):
+    if cache is not None:
+        with open(path, "rb") as f:
+            cache.set(key, f.read())
+
+# ---------------------------
+# gTTS
+# ---------------------------
+def storyteller_pacing(chunk):
+    chunk = re.sub(r'(?<=[.!?]) ', '. ', chunk)
+    chunk = chunk.replace(',', ', ')
+    return chunk + " ..."
+
+def synthesize_gtts_chunk(chunk, path, language="en", storyteller=True):
+    if storyteller:
+        chunk = storyteller_pacing(chunk)
+    from gtts import gTTS
+    gTTS(text=chunk, lang=language, slow=True).save(path)
+    return path
+
+def synthesize_gtts_chunk_cached(chunk, path, language="en", storyteller=True, retries=TTS_RETRIES, cache=None,
+                                 checkpoint=None):
+    key = audio_cache_key("gtts", chunk, language, storyteller)
+    with metrics.span("tts_chunk", chars=len(chunk), engine="gtts") as record:
+        if restore_cached_audio(checkpoint, key, path):
+            record["source"] = "checkpoint"
+        else:
+            record["source"] = "cache"
+            if not restore_cached_audio(cache, key, path):
+                record["source"] = "gtts"
+                with_retries(lambda: synthesize_gtts_chunk(chunk, path, language, storyteller), retries)
+                store_cached_audio(cache, key, path)
+            store_cached_audio(checkpoint, key, path)
+        record["bytes"] = os.path.getsize(path)
+    return path
+
+def synthesize_gtts_chunks(chunks, out_dir, language="en", storyteller=True,
+                           max_workers=TTS_CONCURRENCY, retries=TTS_RETRIES, on_progress=None, cache=None,
+                           checkpoint=None):
+    """Synthesize ``chunks`` to ``out_dir/chunk_<i>.mp3`` on a worker pool.
+
+    Returns ``(paths, gaps)``. ``paths`` is in chunk order with ``None`` where
+    synthesis failed after all retries; ``gaps`` lists those failures as
+    ``{"index", "error", "text"}`` dicts so the caller can report exactly
+    which parts of the book are missing. With a ``cache`` only chunks whose
+    text (or language/storyteller setting) changed are sent to gTTS. With a
+    ``checkpoint`` finished chunks survive a crash or restart and a resumed
+    run only synthesizes the rest.
+    """
+    paths = [None] * len(chunks)
+    gaps = []
+    with metrics.span("tts", chunks=len(chunks), engine="gtts") as record, \
+            ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {}
+        for i, chunk in enumerate(chunks):
+            path = os.path.join(out_dir, f"chunk_{i}.mp3")
+            future = metrics.submit(pool, synthesize_gtts_chunk_cached, chunk, path, language, storyteller, retries,
+                                    cache, checkpoint)
+            futures[future] = i
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                i = futures[future]
+                try:
+                    paths[i] = future.result()
+                except Exception as e:
+                    gaps.append({"index": i, "error": str(e), "text": chunks[i]})
+                if on_progress:
+                    on_progress(done, len(chunks))
+        except BaseException:
+            # Cancelled from on_progress: don't synthesize the queued chunks.
+            # Chunks in flight still land in the cache and checkpoint.
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        record["failed"] = len(gaps)
+    gaps.sort(key=lambda gap: gap["index"])
+    return paths, gaps
+
+def format_gap_report(gaps, total):
+    lines = [f"{len(gaps)} of {total} audio chunk(s) could not be generated and are missing from the audiobook:"]
+    for gap in gaps:
+        preview = gap["text"][:80] + ("..." if len(gap["text"]) > 80 else "")
+        lines.append(f"- Chunk {gap['index'] + 1}: \"{preview}\" ({gap['error']})")
+    return "\n".join(lines)
+
+# ---------------------------
+# edge-tts
+# ---------------------------
+async def _synthesize_edge_segment(segment, voice, path, retries):
+    # edge-tts pulls in aiohttp (~150 ms); only pay for it when it's used.
+    import edge_tts
+    for attempt in range(1, retries + 1):
+        try:
+            # Communicate.save() writes audio to ``path`` as it streams in.
+            await edge_tts.Communicate(segment, voice).save(path)
+            return path
+        except Exception:
+            if attempt == retries:
+                raise
+            metrics.count("retries_total", stage="tts", help="Retried requests.")
+            await asyncio.sleep(backoff_delay(attempt))
+
+async def _synthesize_edge_segments(segments, voice, out_dir, max_concurrency, retries, on_progress, cache,
+                                    checkpoint):
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def run(i, segment):
+        path = os.path.join(out_dir, f"segment_{i}.mp3")
+        key = audio_cache_key("edge-tts", segment, voice)
+        # Each task runs in its own copy of the context, so the span lands
+        # in the caller's trace.
+        try:
+            with metrics.span("tts_chunk", chars=len(segment), engine="edge-tts") as record:
+                if restore_cached_audio(checkpoint, key, path):
+                    record["source"] = "checkpoint"
+                else:
+                    record["source"] = "cache"
+                    if not restore_cached_audio(cache, key, path):
+                        record["source"] = "edge-tts"
+                        async with semaphore:
+                            await _synthesize_edge_segment(segment, voice, path, retries)
+                        store_cached_audio(cache, key, path)
+                    store_cached_audio(checkpoint, key, path)
+                record["bytes"] = os.path.getsize(path)
+        except Exception as e:
+            return i, None, e
+        return i, path, None
+
+    paths = [None] * len(segments)
+    gaps = []
+    tasks = [run(i, segment) for i, segment in enumerate(segments)]
+    for done, finished in enumerate(asyncio.as_completed(tasks), start=1):
+        i, path, error = await finished
+        if error is None:
+            paths[i] = path
+        else:
+            gaps.append({"index": i, "error": str(error), "text": segments[i]})
+        if on_progress:
+            on_progress(done, len(segments))
+    gaps.sort(key=lambda gap: gap["index"])
+    return paths, gaps
+
+def synthesize_edge_segments(segments, voice, out_dir, max_concurrency=EDGE_TTS_CONCURRENCY,
+                             retries=TTS_RETRIES, on_progress=None, cache=None, checkpoint=None):
+    """edge-tts counterpart of ``synthesize_gtts_chunks``.
+
+    All segments share one event loop; at most ``max_concurrency`` are
+    being synthesized at a time. Returns ``(paths, gaps)`` in segment order.
+    """
+    with metrics.span("tts", chunks=len(segments), engine="edge-tts") as record:
+        paths, gaps = asyncio.run(
+            _synthesize_edge_segments(segments, voice, out_dir, max_concurrency, retries, on_progress, cache, checkpoint)
+        )
+        record["failed"] = len(gaps)
+    return paths, gaps
+
+# ---------------------------
+# WHOLE DOCUMENT
+# ---------------------------
+def text_to_speech(text, output_path, engine="gtts", voice="en", storyteller=True,
+                   cache=None, on_progress=None, max_workers=None, checkpoint=None):
+    """Clean, chunk, synthesize and assemble ``text`` into ``output_path``.
+
+    ``voice`` is the gTTS language code or the edge-tts voice name.
+    Returns ``(path, gaps, chunk_count)``; ``path`` is ``None`` when there
+    was nothing to say or every chunk failed. ``checkpoint`` is passed on
+    to the per-chunk synthesis so an interrupted run can be resumed.
+    """
+    chunks = chunk_for_tts(clean_text_for_tts(text), engine)
+    if not chunks:
+        return None, [], 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if engine == "gtts":
+            paths, gaps = synthesize_gtts_chunks(
+                chunks, temp_dir, voice, storyteller, max_workers=max_workers or TTS_CONCURRENCY,
+                on_progress=on_progress, cache=cache, checkpoint=checkpoint
+            )
+        else:
+            paths, gaps = synthesize_edge_segments(
+                chunks, voice, temp_dir, max_concurrency=max_workers or EDGE_TTS_CONCURRENCY,
+                on_progress=on_progress, cache=cache, checkpoint=checkpoint
+            )
+        audio = [path for path in paths if path]
+        if not audio:
+            return None, gaps, len(chunks)
+        concatenate_mp3(audio, output_path)
+    return output_path, gaps, len(chunks)